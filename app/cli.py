@@ -0,0 +1,154 @@
+# 作用: 命令行管理工具。用法: python -m app.cli <命令> [参数]
+
+import argparse
+import asyncio
+import datetime
+import json
+
+from .config import settings
+from .database import AppSessionLocal
+from . import crud
+
+
+def _migrate(args: argparse.Namespace) -> None:
+    from . import migrations
+    from .database import app_engine
+
+    for statement in migrations.upgrade(app_engine):
+        print(statement)
+    print("数据库结构已是最新")
+
+
+def _audit_questions(args: argparse.Namespace) -> None:
+    from .services import question_audit
+
+    db = AppSessionLocal()
+    try:
+        questions = crud.get_questions_for_audit(db, question_ids=args.ids)
+    finally:
+        db.close()
+
+    report = question_audit.run_question_audit(
+        questions,
+        max_workers=args.workers,
+        top_n=args.top,
+        max_vm_steps=settings.SANDBOX_MAX_VM_STEPS,
+        time_limit_seconds=settings.SANDBOX_TIME_LIMIT_SECONDS
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"共检查 {report['total']} 道题目，正常 {report['ok']} 道，"
+          f"用时 {report['elapsed_ms']:.0f} ms（{report['workers']} 个进程）")
+    for item in report["broken"]:
+        print(f"  [失效] #{item['question_id']} {item['status']}: {item['error']}")
+    for question_id in report["stale_fingerprint_ids"]:
+        print(f"  [指纹过期] #{question_id}")
+    print("最慢的题目:")
+    for item in report["slowest"]:
+        print(f"  #{item['question_id']} setup {item['setup_ms']:.1f} ms, "
+              f"query {item['query_ms'] or 0:.1f} ms, {item['row_count']} 行")
+    # 非零退出码便于在部署流水线中使用
+    if report["broken"]:
+        raise SystemExit(1)
+
+
+def _backfill_topics(args: argparse.Namespace) -> None:
+    from . import models
+    from .database import app_engine
+
+    models.Base.metadata.create_all(bind=app_engine)
+    db = AppSessionLocal()
+    try:
+        count = crud.backfill_question_topics(db)
+    finally:
+        db.close()
+    print(f"已为 {count} 道题目建立知识点关联")
+
+
+def _backfill_topic_stats(args: argparse.Namespace) -> None:
+    from . import models
+    from .database import app_engine
+
+    models.Base.metadata.create_all(bind=app_engine)
+    db = AppSessionLocal()
+    try:
+        # 统计按题目与知识点的关联汇总，先为还没有关联的旧题目补建关联
+        linked = crud.backfill_question_topics(db)
+        count = crud.backfill_user_topic_stats(db)
+    finally:
+        db.close()
+    print(f"已为 {linked} 道题目建立知识点关联，根据历史提交重建 {count} 行知识点统计")
+
+
+def _backfill_daily_awards(args: argparse.Namespace) -> None:
+    from . import models
+    from .database import app_engine
+    from .routers.daily import POINTS_FOR_DAILY_QUESTION
+
+    models.Base.metadata.create_all(bind=app_engine)
+    db = AppSessionLocal()
+    try:
+        count = crud.backfill_daily_point_awards(db, day=args.date, points=POINTS_FOR_DAILY_QUESTION)
+    finally:
+        db.close()
+    print(f"已根据 {args.date} 的正确提交补齐 {count} 条每日积分发放记录")
+
+
+def _generation_worker(args: argparse.Namespace) -> None:
+    from . import models
+    from .database import app_engine
+    from .services import generation_jobs
+
+    models.Base.metadata.create_all(bind=app_engine)
+    worker = asyncio.run(generation_jobs.run_worker(
+        concurrency=args.concurrency,
+        poll_interval_seconds=args.poll_interval,
+        once=args.once
+    ))
+    print(f"工作进程 {worker.worker_id} 已退出：成功 {worker.succeeded} 道，失败 {worker.failed} 道，"
+          f"等待重试 {worker.retried} 次")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="SQL学习助手管理工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="为已有数据库补齐新增的表、列和索引，升级后启动服务前执行")
+    migrate.set_defaults(func=_migrate)
+
+    audit = subparsers.add_parser("audit-questions", help="并行检查题库中的题目能否正常评测")
+    audit.add_argument("--ids", type=int, nargs="+", help="只检查指定ID的题目（默认检查全部已发布题目）")
+    audit.add_argument("--workers", type=int, default=None, help="工作进程数，默认等于CPU核数")
+    audit.add_argument("--top", type=int, default=10, help="报告中列出的最慢/最大题目数量")
+    audit.add_argument("--json", action="store_true", help="以JSON格式输出完整报告")
+    audit.set_defaults(func=_audit_questions)
+
+    backfill_topics = subparsers.add_parser("backfill-topics", help="为已有题目建立知识点关联表中的记录，从旧版本升级时必须执行一次")
+    backfill_topics.set_defaults(func=_backfill_topics)
+
+    backfill_stats = subparsers.add_parser("backfill-topic-stats",
+                                           help="根据历史能力测试提交重建每个用户每个知识点的每日统计")
+    backfill_stats.set_defaults(func=_backfill_topic_stats)
+
+    backfill_awards = subparsers.add_parser("backfill-daily-awards",
+                                            help="根据每日一题的正确提交补齐当天的积分发放记录，上线新版本时执行一次")
+    backfill_awards.add_argument("--date", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                                 help="补齐哪一天的记录（YYYY-MM-DD），默认今天")
+    backfill_awards.set_defaults(func=_backfill_daily_awards)
+
+    worker = subparsers.add_parser("generation-worker", help="启动批量生成题目的工作进程，可同时运行多个")
+    worker.add_argument("--concurrency", type=int, default=settings.GENERATION_MAX_CONCURRENCY,
+                        help="同时进行的LLM请求数量")
+    worker.add_argument("--poll-interval", type=float, default=settings.GENERATION_POLL_INTERVAL_SECONDS,
+                        help="队列为空时查询新任务的间隔（秒）")
+    worker.add_argument("--once", action="store_true", help="处理完队列中现有的任务后退出")
+    worker.set_defaults(func=_generation_worker)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 # 作用: 使用Pydantic加载和管理环境变量。
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,6 +11,104 @@ class Settings(BaseSettings):
 
     # 通义千问 配置
     QWEN_API_KEY: str = "default_key"
+    QWEN_API_BASE: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # DashScope 的 OpenAI 兼容接口
+
+    # 模拟LLM提供商（llm_provider="mock"），用于离线压测，不需要API Key
+    MOCK_LLM_ENABLED: bool = False
+    MOCK_LLM_FIRST_TOKEN_SECONDS: float = 0.8  # 首个token的延迟
+    MOCK_LLM_INTER_CHUNK_SECONDS: float = 0.03  # 相邻分块之间的延迟
+    MOCK_LLM_JITTER: float = 0.3  # 延迟的随机浮动比例
+    MOCK_LLM_CHUNK_CHARS: int = 8  # 每个分块的字符数
+    MOCK_LLM_PARAGRAPHS: int = 4  # 非题目生成类响应的段落数
+    MOCK_LLM_ERROR_RATE: float = 0.0  # 调用直接失败的概率
+    MOCK_LLM_STALL_PROBABILITY: float = 0.0  # 输出中途卡顿的概率
+    MOCK_LLM_STALL_SECONDS: float = 30.0  # 卡顿的时长，不小于 LLM_TIMEOUT_SECONDS 时按读取超时报错
+    MOCK_LLM_SEED: Optional[int] = None  # 固定随机种子，使延迟、错误和卡顿可以复现
+    MOCK_LLM_RESPONSES_FILE: Optional[str] = None  # 录制的响应（JSON，按调用用途分组），为空时使用内置的确定性内容
+    # AI导师分析使用的提供商，压测时可设为 mock
+    ANALYSIS_LLM_PROVIDER: str = "deepseek"
+
+    # LLM HTTP客户端连接池配置（客户端在应用启动时创建，所有请求共享）
+    LLM_HTTP2: bool = True
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    LLM_TIMEOUT_SECONDS: float = 120.0  # 读取/写入超时，流式响应中两次数据之间的最长等待时间
+
+    # LLM提供商准入控制：同时进行的请求数、每秒请求数、排队上限和熔断
+    DEEPSEEK_MAX_IN_FLIGHT: int = 32
+    DEEPSEEK_RATE_LIMIT_PER_SECOND: float = 10.0
+    QWEN_MAX_IN_FLIGHT: int = 32
+    QWEN_RATE_LIMIT_PER_SECOND: float = 10.0
+    LLM_MAX_IN_FLIGHT: int = 32  # 其他提供商的默认值
+    LLM_RATE_LIMIT_PER_SECOND: float = 10.0
+    LLM_RATE_LIMIT_BURST: int = 20
+    LLM_MAX_QUEUED: int = 200  # 每个提供商最多排队的请求数，超出直接拒绝
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 15.0  # 排队超过这个时间直接拒绝
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5  # 连续失败多少次后熔断
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0  # 熔断后多久放行一个探测请求
+    LLM_FAILOVER_ENABLED: bool = False  # 非流式调用失败时是否自动改用另一个提供商
+
+    LLM_CALL_LOG_ENABLED: bool = False  # 是否把每次LLM调用的明细以JSON写入日志 app.llm_calls
+
+    # 非流式调用的对冲请求：主提供商超过延迟仍没有首个token时向另一个提供商再发一次
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0  # 延迟取最近首个token耗时的这个分位数
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS: float = 2.0  # 样本不足时使用的延迟
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    LLM_HEDGE_MAX_DELAY_SECONDS: float = 10.0
+
+    # SQL评测沙箱配置
+    SANDBOX_MAX_WORKERS: int = 4  # 评测工作进程数，即同时执行的评测数量上限
+    SANDBOX_MAX_QUEUE: int = 64  # 等待中的评测数量上限，超出后直接拒绝
+    SANDBOX_MAX_VM_STEPS: int = 50_000_000  # 单条查询允许执行的SQLite虚拟机指令数
+    SANDBOX_TIME_LIMIT_SECONDS: float = 5.0  # 单条查询的墙钟时间上限
+    SANDBOX_MEMORY_LIMIT_MB: int = 256  # 每个工作进程中SQLite可使用的内存上限
+    SANDBOX_SNAPSHOT_CACHE_SIZE: int = 64  # 每个工作进程缓存的题目数据库快照数量
+    SANDBOX_MAX_USER_ROWS: int = 100_000  # 用户查询最多读取的行数，超出视为资源超限
+    SANDBOX_PREVIEW_ROWS: int = 50  # 需要展示结果时，最多返回的预览行数
+    VERDICT_CACHE_SIZE: int = 10_000  # 缓存的评测结论数量（按题目+规范化后的用户SQL）
+    FINGERPRINT_FAILURE_TTL_SECONDS: int = 600  # 正确答案无法计算指纹的题目，隔多久才重新尝试计算
+    QUESTION_AUDIT_CONCURRENCY: Optional[int] = None  # 管理后台发起的题库审计同时占用的评测进程数，为空时使用一半的评测进程，其余留给用户评测
+
+    # AI导师分析缓存
+    ANALYSIS_CACHE_SIZE: int = 5_000
+    ANALYSIS_CACHE_TTL_SECONDS: int = 24 * 3600
+    ANALYSIS_CACHE_MAX_MB: int = 64
+    # 后台生成的分析：超过这个时间仍无人领取就取消；生成完后保留多久供客户端读取；最多同时跟踪多少个
+    ANALYSIS_UNCLAIMED_TIMEOUT_SECONDS: int = 60
+    ANALYSIS_RESULT_RETENTION_SECONDS: int = 600
+    ANALYSIS_MAX_PENDING: int = 1_000
+
+    # 知识点讲解缓存（按规范化后的知识点+提供商）
+    EXPLANATION_CACHE_SIZE: int = 2_000
+    EXPLANATION_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    EXPLANATION_CACHE_MAX_MB: int = 64
+    EXPLANATION_PREWARM_CONCURRENCY: int = 3  # 预热时同时进行的LLM请求数量
+
+    # 知识点索引：每个服务进程在内存中维护，后台任务隔多久从数据库整体重建一次（同步其他进程发布的题目）
+    TOPIC_INDEX_REFRESH_SECONDS: float = 60.0
+
+    # 认证身份缓存：按 (令牌主体, 令牌版本) 缓存用户ID、用户名和管理员标记。
+    # 本进程内修改权限或密码会立即失效；其他服务进程最多在 TTL 之后才看到变化
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_CACHE_TTL_SECONDS: int = 60
+
+    # 积分排行榜：每个服务进程在内存中维护，后台任务隔多久从数据库整体重建一次（同步其他进程的积分变化）
+    LEADERBOARD_REFRESH_SECONDS: float = 30.0
+
+    # 聊天记录的后台批量写入
+    CHAT_HISTORY_QUEUE_SIZE: int = 10_000  # 队列上限，写满后新的记录需要等待
+    CHAT_HISTORY_BATCH_SIZE: int = 200  # 每次最多写入的记录数
+    CHAT_HISTORY_FLUSH_INTERVAL_MS: int = 500  # 攒批的最长等待时间
+
+    # 批量生成题目的工作进程（python -m app.cli generation-worker）
+    GENERATION_MAX_CONCURRENCY: int = 5  # 每个工作进程同时进行的LLM请求数量
+    GENERATION_MAX_ATTEMPTS: int = 3  # 每道题最多尝试的次数
+    GENERATION_RETRY_DELAY_SECONDS: float = 30.0  # 失败后等待多久重试，随尝试次数递增
+    GENERATION_LEASE_SECONDS: float = 600.0  # 领取后超过这个时间仍未完成，视为工作进程已退出，由其他进程重新领取
+    GENERATION_POLL_INTERVAL_SECONDS: float = 2.0  # 队列为空时查询新任务的间隔
 
     class Config:
         # 指定从哪个文件加载环境变量
@@ -1,10 +1,13 @@
 # 作用: 封装数据库的CRUD(创建、读取、更新、删除)操作。
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_
-from typing import List, Optional, Dict
-from collections import Counter
+from sqlalchemy import func, or_, and_, case, insert, literal, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional, Dict, Tuple
 from . import models, schemas, security
+from .services import sql_executor, verdict_cache, analysis_cache, principal_cache
+from .services.topic_index import topic_index, topic_key, split_topics
+from .services.leaderboard import leaderboard, Standing
 import datetime
 
 
@@ -19,22 +22,68 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    if leaderboard.loaded:
+        leaderboard.update(db_user.id, db_user.username, db_user.points or 0)
     return db_user
 
 
-def add_points_to_user(db: Session, user_id: int, points_to_add: int):
-    """为指定用户增加积分"""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user:
-        db_user.points += points_to_add
-        db.commit()
-        db.refresh(db_user)
-    return db_user
+def _increment_points(db: Session, user_id: int, points_to_add: int):
+    # 在数据库里原子地累加，不先读出再写回；调用方提交后再用返回的积分更新排行榜
+    return db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(points=func.coalesce(models.User.points, 0) + points_to_add)
+        .returning(models.User.username, models.User.points)
+    ).first()
+
 
+def _sync_leaderboard(user_id: int, row) -> None:
+    if row is not None and leaderboard.loaded:
+        leaderboard.update(user_id, row.username, row.points)
+
+
+def add_points_to_user(db: Session, user_id: int, points_to_add: int) -> Optional[int]:
+    """为指定用户增加积分，返回增加后的总积分；用户不存在时返回 None。"""
+    row = _increment_points(db, user_id, points_to_add)
+    db.commit()
+    _sync_leaderboard(user_id, row)
+    return row.points if row else None
+
+
+def load_leaderboard(db: Session) -> None:
+    """从数据库重建内存中的积分排行榜。"""
+    # 与 ix_users_points_id 的顺序一致，数据库可以按索引顺序读取
+    rows = (
+        db.query(models.User.id, models.User.username, models.User.points)
+        .order_by(models.User.points.desc(), models.User.id)
+        .all()
+    )
+    leaderboard.load([(row.id, row.username, row.points) for row in rows])
 
-def get_leaderboard(db: Session, limit: int = 10):
+
+def _fresh_leaderboard(db: Session):
+    # 排行榜由后台任务定期重建；只有尚未加载过（例如命令行工具中）时才在这里同步加载
+    if not leaderboard.loaded:
+        load_leaderboard(db)
+    return leaderboard
+
+
+def get_leaderboard(db: Session, limit: int = 10) -> List[Standing]:
     """获取积分排行榜"""
-    return db.query(models.User).order_by(models.User.points.desc()).limit(limit).all()
+    return _fresh_leaderboard(db).top(limit)
+
+
+def get_leaderboard_page(db: Session, limit: int, cursor: Optional[str] = None) -> Tuple[List[Standing], Optional[str]]:
+    """按游标翻页获取排行榜，返回这一页和下一页的游标。游标格式不对时抛出 ValueError。"""
+    return _fresh_leaderboard(db).page(limit, cursor)
+
+
+def get_user_standing(db: Session, user_id: int) -> Optional[Standing]:
+    return _fresh_leaderboard(db).rank(user_id)
+
+
+def get_leaderboard_around_user(db: Session, user_id: int, radius: int) -> List[Standing]:
+    return _fresh_leaderboard(db).around(user_id, radius)
 
 
 def get_all_users(db: Session):
@@ -47,6 +96,7 @@ def update_user_permissions(db: Session, user_id: int, is_admin: bool):
         db_user.is_admin = is_admin
         db.commit()
         db.refresh(db_user)
+        principal_cache.invalidate_user(db_user.username)
     return db_user
 
 
@@ -55,6 +105,7 @@ def update_user_password(db: Session, user: models.User, new_password: str):
     db.add(user)
     db.commit()
     db.refresh(user)
+    principal_cache.invalidate_user(user.username)
     return user
 
 
@@ -67,7 +118,69 @@ def create_chat_history(db: Session, history: schemas.ChatHistoryCreate, user_id
     return db_history
 
 
+def create_chat_histories(db: Session, rows: List[Dict]) -> None:
+    """批量写入聊天记录（一条多行INSERT），供后台写入器使用。"""
+    db.execute(insert(models.ChatHistory), rows)
+    db.commit()
+
+
 # --- Question CRUD ---
+def _set_question_topics(db: Session, db_question: models.Question) -> None:
+    """根据 topics 字段同步题目与知识点的关联，不存在的知识点会被创建。"""
+    names = split_topics(db_question.topics)
+    keys = [topic_key(name) for name in names]
+    if not keys:
+        db_question.topic_entries = []
+        return
+    # 多个工作进程可能同时写入同一个新知识点，用 ON CONFLICT 避免唯一约束冲突
+    db.execute(
+        pg_insert(models.Topic)
+        .values([{"name": name, "key": key} for name, key in zip(names, keys)])
+        .on_conflict_do_nothing(index_elements=['key'])
+    )
+    existing = {topic.key: topic for topic in db.query(models.Topic).filter(models.Topic.key.in_(keys))}
+    db_question.topic_entries = [existing[key] for key in keys]
+
+
+def _sync_topic_index(db_question: models.Question) -> None:
+    # 在提交之后调用，索引里只有已发布的题目
+    if db_question.status == 'published':
+        topic_index.add(db_question.id, [topic_key(name) for name in split_topics(db_question.topics)])
+    else:
+        topic_index.remove(db_question.id)
+
+
+def load_topic_index(db: Session) -> None:
+    """从数据库重建内存中的知识点索引。"""
+    rows = (
+        db.query(models.question_topics.c.question_id, models.Topic.key)
+        .join(models.Topic, models.Topic.id == models.question_topics.c.topic_id)
+        .join(models.Question, models.Question.id == models.question_topics.c.question_id)
+        .filter(models.Question.status == 'published')
+        .all()
+    )
+    # 没有任何知识点的已发布题目也要能在不限知识点时被抽到
+    untagged = (
+        db.query(models.Question.id)
+        .filter(models.Question.status == 'published', ~models.Question.topic_entries.any())
+        .all()
+    )
+    topic_index.load([(row.question_id, row.key) for row in rows])
+    for row in untagged:
+        topic_index.add(row.id, [])
+
+
+def backfill_question_topics(db: Session) -> int:
+    """为还没有知识点关联的题目（新增关联表之前创建的）补建关联，返回处理的题目数量。"""
+    questions = db.query(models.Question).filter(~models.Question.topic_entries.any()).all()
+    for db_question in questions:
+        _set_question_topics(db, db_question)
+        db.flush()
+    db.commit()
+    load_topic_index(db)
+    return len(questions)
+
+
 def create_question_draft(db: Session, question_data: schemas.LLMGeneratedQuestionData, topics: str,
                           author_id: int) -> models.Question:
     temp_title = f"草稿-{topics}-{datetime.datetime.now().strftime('%H%M%S')}"
@@ -81,6 +194,7 @@ def create_question_draft(db: Session, question_data: schemas.LLMGeneratedQuesti
         author_id=author_id
     )
     db.add(db_question)
+    _set_question_topics(db, db_question)
     db.commit()
     db.refresh(db_question)
     return db_question
@@ -94,15 +208,88 @@ def get_question_by_id(db: Session, question_id: int) -> Optional[models.Questio
     return db.query(models.Question).filter(models.Question.id == question_id).first()
 
 
+def _refresh_correct_fingerprint(db_question: models.Question) -> bool:
+    """重新计算题目正确答案的结果指纹并写到模型上（不提交）。返回是否计算成功。"""
+    fingerprint = sql_executor.compute_result_fingerprint(
+        setup_sql=db_question.setup_sql,
+        sql=db_question.correct_sql,
+        question_id=db_question.id
+    )
+    if fingerprint["status"] != "ok":
+        db_question.correct_result_hash = None
+        db_question.correct_row_count = None
+        db_question.correct_column_count = None
+        return False
+    db_question.correct_result_hash = fingerprint["result_hash"]
+    db_question.correct_row_count = fingerprint["row_count"]
+    db_question.correct_column_count = fingerprint["column_count"]
+    return True
+
+
+def get_stored_question_fingerprint(question: models.Question) -> Optional[Dict]:
+    """
+    返回题目已保存的正确答案指纹；没有指纹或指纹由旧版算法生成时返回 None，
+    由评测流程在进程池中重新计算后调用 save_question_fingerprint 补齐。
+    """
+    if not sql_executor.is_current_fingerprint(question.correct_result_hash):
+        return None
+    return {
+        "result_hash": question.correct_result_hash,
+        "row_count": question.correct_row_count,
+        "column_count": question.correct_column_count,
+    }
+
+
+def save_question_fingerprint(db: Session, question_id: int, setup_sql: str, correct_sql: str,
+                              fingerprint: Dict) -> None:
+    """保存懒加载计算出的指纹；题目在计算期间被修改过时不写入，避免用旧SQL的指纹覆盖。"""
+    db.execute(
+        update(models.Question)
+        .where(models.Question.id == question_id,
+               models.Question.setup_sql == setup_sql,
+               models.Question.correct_sql == correct_sql)
+        .values(correct_result_hash=fingerprint["result_hash"],
+                correct_row_count=fingerprint["row_count"],
+                correct_column_count=fingerprint["column_count"])
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def backfill_question_fingerprints(db: Session) -> Dict:
+    """为所有缺少指纹或指纹已过期的题目补齐正确答案指纹。"""
+    questions = db.query(models.Question).filter(or_(
+        models.Question.correct_result_hash.is_(None),
+        models.Question.correct_result_hash.notlike(f"{sql_executor.FINGERPRINT_VERSION_PREFIX}%")
+    )).all()
+    failed_ids = [q.id for q in questions if not _refresh_correct_fingerprint(q)]
+    db.commit()
+    return {"updated": len(questions) - len(failed_ids), "failed_question_ids": failed_ids}
+
+
 def update_question(db: Session, question_id: int, question_update: schemas.QuestionUpdate) -> Optional[
     models.Question]:
     db_question = get_question_by_id(db, question_id)
     if db_question:
         update_data = question_update.model_dump(exclude_unset=True)
+        # 数据库快照按 setup_sql 哈希区分，评测进程遇到新的 setup_sql 时会自行丢弃旧快照
+        setup_changed = 'setup_sql' in update_data and update_data['setup_sql'] != db_question.setup_sql
+        answer_changed = setup_changed or (
+            'correct_sql' in update_data and update_data['correct_sql'] != db_question.correct_sql
+        )
+        topics_changed = 'topics' in update_data and update_data['topics'] != db_question.topics
         for key, value in update_data.items():
             setattr(db_question, key, value)
+        if topics_changed:
+            _set_question_topics(db, db_question)
+        if answer_changed:
+            _refresh_correct_fingerprint(db_question)
+            verdict_cache.invalidate_question(question_id)
+            analysis_cache.invalidate_question(question_id)
         db.commit()
         db.refresh(db_question)
+        if topics_changed:
+            _sync_topic_index(db_question)
     return db_question
 
 
@@ -112,17 +299,197 @@ def publish_question(db: Session, question_id: int, approver_id: int) -> Optiona
         db_question.status = 'published'
         db_question.approver_id = approver_id
         db_question.published_at = datetime.datetime.now(datetime.timezone.utc)
+        _refresh_correct_fingerprint(db_question)
         db.commit()
         db.refresh(db_question)
+        _sync_topic_index(db_question)
     return db_question
 
 
-def get_random_published_question(db: Session, topics: List[str]):
-    query = db.query(models.Question).filter(models.Question.status == 'published')
-    if topics:
-        topic_filters = [models.Question.topics.like(f"%{topic.strip()}%") for topic in topics]
-        query = query.filter(or_(*topic_filters))
-    return query.order_by(func.random()).first()
+def get_questions_for_audit(db: Session, question_ids: Optional[List[int]] = None) -> List[Dict]:
+    """获取需要回归检查的题目；未指定题目ID时返回全部已发布题目。"""
+    query = db.query(
+        models.Question.id,
+        models.Question.setup_sql,
+        models.Question.correct_sql,
+        models.Question.correct_result_hash
+    )
+    if question_ids:
+        query = query.filter(models.Question.id.in_(question_ids))
+    else:
+        query = query.filter(models.Question.status == 'published')
+    return [row._asdict() for row in query.all()]
+
+
+def get_random_published_question(db: Session, topics: List[str]) -> Optional[models.Question]:
+    """随机抽取一道包含任一知识点（精确匹配）的已发布题目，题目ID从内存索引中选取，数据库只按主键读取。"""
+    # 索引由后台任务定期重建；只有尚未加载过（例如命令行工具中）时才在这里同步加载
+    if not topic_index.loaded:
+        load_topic_index(db)
+    # 其他进程可能已修改了题目，索引过期的条目直接跳过
+    for _ in range(3):
+        question_id = topic_index.random_question_id(topics)
+        if question_id is None:
+            return None
+        question = get_question_by_id(db, question_id)
+        if question and question.status == 'published':
+            return question
+        topic_index.remove(question_id)
+    return None
+
+
+# --- GenerationJob CRUD ---
+def create_generation_job(db: Session, request: schemas.BatchGenerateRequest, author_id: int) -> models.GenerationJob:
+    """创建批量生成任务，每道题一行任务项，由独立的工作进程领取执行。"""
+    db_job = models.GenerationJob(
+        author_id=author_id,
+        topics=",".join(request.topics),
+        llm_provider=request.llm_provider,
+        total=request.count,
+        status='pending',
+        succeeded=0,
+        failed=0
+    )
+    db.add(db_job)
+    db.flush()
+    db.execute(insert(models.GenerationJobItem), [{"job_id": db_job.id}] * request.count)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_generation_job(db: Session, job_id: int) -> Optional[models.GenerationJob]:
+    return db.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).first()
+
+
+def get_generation_jobs(db: Session, limit: int = 20) -> List[models.GenerationJob]:
+    return db.query(models.GenerationJob).order_by(models.GenerationJob.id.desc()).limit(limit).all()
+
+
+def get_generation_job_progress(db: Session, job_id: int, max_errors: int = 20) -> Dict:
+    """统计任务中各状态的题目数量、已生成的题目ID和最近的失败原因。"""
+    Item = models.GenerationJobItem
+    counts = dict(db.query(Item.status, func.count()).filter(Item.job_id == job_id).group_by(Item.status).all())
+    question_ids = [row.question_id for row in
+                    db.query(Item.question_id).filter(Item.job_id == job_id, Item.question_id.isnot(None))
+                    .order_by(Item.id).all()]
+    errors = [row.last_error for row in
+              db.query(Item.last_error).filter(Item.job_id == job_id, Item.status == 'failed')
+              .order_by(Item.id.desc()).limit(max_errors).all()]
+    return {"counts": counts, "question_ids": question_ids, "errors": errors}
+
+
+def claim_generation_items(db: Session, worker_id: str, limit: int, lease_seconds: float) -> List[Dict]:
+    """
+    领取最多 limit 道待生成的题目。使用 FOR UPDATE SKIP LOCKED，多个工作进程同时领取时互不阻塞、不会重复领取；
+    领取后超过 lease_seconds 仍未完成的题目（例如工作进程崩溃）会被重新领取。
+    """
+    Item = models.GenerationJobItem
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stale_before = now - datetime.timedelta(seconds=lease_seconds)
+    items = (
+        db.query(Item)
+        .filter(or_(
+            and_(Item.status == 'pending', Item.available_at <= now),
+            and_(Item.status == 'running', Item.locked_at < stale_before)
+        ))
+        .order_by(Item.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not items:
+        db.rollback()
+        return []
+
+    job_ids = {item.job_id for item in items}
+    jobs = {job.id: job for job in db.query(models.GenerationJob).filter(models.GenerationJob.id.in_(job_ids))}
+    claimed = []
+    for item in items:
+        item.status = 'running'
+        item.locked_by = worker_id
+        item.locked_at = now
+        item.attempts += 1
+        job = jobs[item.job_id]
+        if job.status == 'pending':
+            job.status = 'running'
+            job.started_at = now
+        claimed.append({
+            "item_id": item.id,
+            "job_id": job.id,
+            "attempts": item.attempts,
+            "topics": job.topics,
+            "llm_provider": job.llm_provider,
+            "author_id": job.author_id,
+        })
+    db.commit()
+    return claimed
+
+
+def _release_generation_item(db: Session, claimed: Dict, worker_id: str, values: Dict) -> bool:
+    # 只有仍持有租约的工作进程才能更新结果，租约过期后被别人重新领取的题目以新的领取者为准
+    Item = models.GenerationJobItem
+    updated = db.query(Item).filter(
+        Item.id == claimed["item_id"],
+        Item.status == 'running',
+        Item.locked_by == worker_id
+    ).update({**values, Item.locked_by: None}, synchronize_session=False)
+    return updated == 1
+
+
+def _count_generation_result(db: Session, job_id: int, succeeded: bool) -> None:
+    Job = models.GenerationJob
+    counter = Job.succeeded if succeeded else Job.failed
+    db.query(Job).filter(Job.id == job_id).update({counter: counter + 1}, synchronize_session=False)
+    # 所有题目都有了结果时结束任务；并发完成时计数行的行锁保证只有最后一个会更新状态
+    db.query(Job).filter(
+        Job.id == job_id,
+        Job.status == 'running',
+        Job.succeeded + Job.failed >= Job.total
+    ).update({
+        Job.status: case((Job.succeeded > 0, 'completed'), else_='failed'),
+        Job.finished_at: datetime.datetime.now(datetime.timezone.utc)
+    }, synchronize_session=False)
+
+
+def complete_generation_item(db: Session, claimed: Dict, worker_id: str,
+                             question_data: schemas.LLMGeneratedQuestionData) -> Optional[models.Question]:
+    """把生成的题目写入草稿并标记该项成功；租约已失效时不写入，返回 None。"""
+    if not _release_generation_item(db, claimed, worker_id, {models.GenerationJobItem.status: 'succeeded',
+                                                              models.GenerationJobItem.last_error: None}):
+        db.rollback()
+        return None
+    _count_generation_result(db, claimed["job_id"], succeeded=True)
+    # 草稿与任务项状态在同一个事务中提交
+    db_question = create_question_draft(db, question_data, topics=claimed["topics"], author_id=claimed["author_id"])
+    db.query(models.GenerationJobItem).filter(models.GenerationJobItem.id == claimed["item_id"]).update(
+        {models.GenerationJobItem.question_id: db_question.id}, synchronize_session=False
+    )
+    db.commit()
+    return db_question
+
+
+def fail_generation_item(db: Session, claimed: Dict, worker_id: str, error: str, max_attempts: int,
+                         retry_delay_seconds: float) -> bool:
+    """记录失败；还有重试次数时放回队列（等待时间随重试次数递增）并返回 True。"""
+    Item = models.GenerationJobItem
+    will_retry = claimed["attempts"] < max_attempts
+    if will_retry:
+        values = {
+            Item.status: 'pending',
+            Item.last_error: error,
+            Item.available_at: datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(seconds=retry_delay_seconds * claimed["attempts"])
+        }
+    else:
+        values = {Item.status: 'failed', Item.last_error: error}
+    if not _release_generation_item(db, claimed, worker_id, values):
+        db.rollback()
+        return False
+    if not will_retry:
+        _count_generation_result(db, claimed["job_id"], succeeded=False)
+    db.commit()
+    return will_retry
 
 
 # --- DailyQuestion & Submission CRUD ---
@@ -163,56 +530,195 @@ def check_if_daily_question_is_solved(db: Session, user_id: int, daily_question_
     return correct_submission is not None
 
 
-# 【新增】检查用户今天是否已获得每日积分
-def has_user_received_daily_points_today(db: Session, user_id: int) -> bool:
+def award_daily_points(db: Session, user_id: int, question_id: int, submitted_sql: str,
+                       points: int) -> Optional[int]:
     """
-    检查用户今天是否已经有过任何一次正确的每日一题提交。
+    在一个事务里发放今天的每日积分，返回发放后的总积分；今天已经发放过时返回 None。
+    先插入 (user_id, day) 唯一的发放记录，并发的第二个请求会在这里等到第一个提交后什么也不插入，
+    所以不会重复加分。整个过程只有插入、更新和提交三次数据库往返。
     """
-    today = datetime.date.today()
-    start_of_day = datetime.datetime.combine(today, datetime.time.min)
-    end_of_day = datetime.datetime.combine(today, datetime.time.max)
-
-    correct_submission_today = db.query(models.DailySubmission).filter(
-        models.DailySubmission.user_id == user_id,
-        models.DailySubmission.is_correct == True,
-        models.DailySubmission.submitted_at >= start_of_day,
-        models.DailySubmission.submitted_at <= end_of_day
+    awarded = db.execute(
+        pg_insert(models.DailyPointAward)
+        .values(user_id=user_id, day=datetime.date.today(), question_id=question_id,
+                submitted_sql=submitted_sql, points=points)
+        .on_conflict_do_nothing(index_elements=['user_id', 'day'])
+        .returning(models.DailyPointAward.user_id)
     ).first()
+    if awarded is None:
+        db.rollback()
+        return None
+    row = _increment_points(db, user_id, points)
+    db.commit()
+    _sync_leaderboard(user_id, row)
+    return row.points if row else None
 
-    return correct_submission_today is not None
+
+def backfill_daily_point_awards(db: Session, day: datetime.date, points: int) -> int:
+    """
+    根据 daily_submissions 中当天的正确提交补齐发放记录，返回新写入的行数。
+    发放记录上线之前，每日积分以当天的正确提交为准；上线当天先执行一次，已得过分的用户才不会再得一次。
+    """
+    Submission = models.DailySubmission
+    start_of_day = datetime.datetime.combine(day, datetime.time.min)
+    end_of_day = datetime.datetime.combine(day, datetime.time.max)
+    correct_today = (
+        db.query(
+            Submission.user_id,
+            literal(day),
+            models.DailyQuestion.question_id,
+            Submission.submitted_sql,
+            literal(points),
+            Submission.submitted_at
+        )
+        .join(models.DailyQuestion, models.DailyQuestion.id == Submission.daily_question_id)
+        .filter(
+            Submission.is_correct == True,
+            Submission.submitted_at >= start_of_day,
+            Submission.submitted_at <= end_of_day
+        )
+    )
+    # 同一用户当天有多次正确提交时只保留一条，已有的发放记录保持不变
+    result = db.execute(
+        pg_insert(models.DailyPointAward)
+        .from_select(['user_id', 'day', 'question_id', 'submitted_sql', 'points', 'awarded_at'],
+                     correct_today.statement)
+        .on_conflict_do_nothing(index_elements=['user_id', 'day'])
+    )
+    db.commit()
+    return result.rowcount
 
 
 # --- TestSubmission CRUD ---
 def create_test_submission(db: Session, user_id: int, question_id: int, is_correct: bool):
-    """创建一条能力测试的提交记录"""
+    """创建一条能力测试的提交记录，并在同一个事务中更新该用户各知识点当天的统计"""
+    now = datetime.datetime.now(datetime.timezone.utc)
     db_submission = models.TestSubmission(
         user_id=user_id,
         question_id=question_id,
-        is_correct=is_correct
+        is_correct=is_correct,
+        submitted_at=now
     )
     db.add(db_submission)
+
+    Stat = models.UserTopicDailyStat
+    question_topics = models.question_topics
+    wrong = 0 if is_correct else 1
+    stmt = pg_insert(Stat).from_select(
+        ['user_id', 'topic_id', 'day', 'attempts', 'wrong', 'last_attempt_at'],
+        db.query(
+            literal(user_id), question_topics.c.topic_id, literal(now.date()),
+            literal(1), literal(wrong), literal(now)
+        ).filter(question_topics.c.question_id == question_id).statement
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'topic_id', 'day'],
+        set_={
+            'attempts': Stat.attempts + 1,
+            'wrong': Stat.wrong + stmt.excluded.wrong,
+            'last_attempt_at': stmt.excluded.last_attempt_at
+        }
+    ))
     db.commit()
     return db_submission
 
 
-def get_user_weakest_topics(db: Session, user_id: int, time_delta_days: int = 30) -> List[str]:
+def get_user_weakest_topics(db: Session, user_id: int, time_delta_days: int = 30, limit: int = 3) -> List[str]:
     """
-    根据用户在指定时间段内的错误记录，分析出最薄弱的知识点。
+    根据用户在指定时间段内的错误次数，找出最薄弱的知识点。
+    只汇总按天预先统计好的数据，耗时与用户的提交数量无关。
     """
-    start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=time_delta_days)
+    start_day = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=time_delta_days)).date()
+    Stat = models.UserTopicDailyStat
+    wrong_total = func.sum(Stat.wrong)
+    rows = (
+        db.query(models.Topic.name, wrong_total.label('wrong'))
+        .join(Stat, Stat.topic_id == models.Topic.id)
+        .filter(Stat.user_id == user_id, Stat.day >= start_day)
+        .group_by(models.Topic.id, models.Topic.name)
+        .having(wrong_total > 0)
+        .order_by(wrong_total.desc(), models.Topic.id)
+        .limit(limit)
+        .all()
+    )
+    return [row.name for row in rows]
 
-    wrong_submissions = db.query(models.TestSubmission).join(models.Question).filter(
-        models.TestSubmission.user_id == user_id,
-        models.TestSubmission.is_correct == False,
-        models.TestSubmission.submitted_at >= start_date
-    ).all()
 
-    if not wrong_submissions:
-        return []
+def backfill_user_topic_stats(db: Session) -> int:
+    """
+    根据全部历史提交重建每日知识点统计，返回写入的行数。需要先建立题目与知识点的关联（backfill-topics）。
+    """
+    Stat = models.UserTopicDailyStat
+    Submission = models.TestSubmission
+    question_topics = models.question_topics
+    day = func.date(Submission.submitted_at)
+    history = (
+        db.query(
+            Submission.user_id,
+            question_topics.c.topic_id,
+            day,
+            func.count(),
+            func.sum(case((Submission.is_correct == False, 1), else_=0)),
+            func.max(Submission.submitted_at)
+        )
+        .join(question_topics, question_topics.c.question_id == Submission.question_id)
+        .group_by(Submission.user_id, question_topics.c.topic_id, day)
+    )
+    db.query(Stat).delete(synchronize_session=False)
+    stmt = pg_insert(Stat).from_select(
+        ['user_id', 'topic_id', 'day', 'attempts', 'wrong', 'last_attempt_at'], history.statement
+    )
+    # 重建期间新提交写入的行以历史汇总为准（汇总已包含已提交的记录）
+    result = db.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'topic_id', 'day'],
+        set_={
+            'attempts': stmt.excluded.attempts,
+            'wrong': stmt.excluded.wrong,
+            'last_attempt_at': stmt.excluded.last_attempt_at
+        }
+    ))
+    db.commit()
+    return result.rowcount
+
+
+# --- AnalysisResult CRUD ---
+def create_analysis_result(db: Session, analysis_id: str, user_id: int, expired_before: datetime.datetime) -> None:
+    """登记一条生成中的分析，顺带删除 expired_before 之前创建的过期分析。"""
+    db.query(models.AnalysisResult).filter(models.AnalysisResult.created_at < expired_before) \
+        .delete(synchronize_session=False)
+    db.add(models.AnalysisResult(id=analysis_id, user_id=user_id, status='pending'))
+    db.commit()
+
+
+def finish_analysis_result(db: Session, analysis_id: str, status: str, analysis: Optional[str]) -> None:
+    db.execute(
+        update(models.AnalysisResult)
+        .where(models.AnalysisResult.id == analysis_id)
+        .values(status=status, analysis=analysis,
+                finished_at=datetime.datetime.now(datetime.timezone.utc))
+    )
+    db.commit()
+
+
+def claim_analysis_result(db: Session, analysis_id: str, user_id: int) -> Optional[Tuple[str, Optional[str]]]:
+    """标记某个用户自己的分析已被领取，返回 (状态, 分析文本)；不存在时返回 None。"""
+    row = db.execute(
+        update(models.AnalysisResult)
+        .where(models.AnalysisResult.id == analysis_id, models.AnalysisResult.user_id == user_id)
+        .values(claimed=True)
+        .returning(models.AnalysisResult.status, models.AnalysisResult.analysis)
+    ).first()
+    db.commit()
+    return (row.status, row.analysis) if row else None
 
-    topic_errors = Counter()
-    for sub in wrong_submissions:
-        topics = [topic.strip() for topic in sub.question.topics.split(',')]
-        topic_errors.update(topics)
 
-    return [topic for topic, count in topic_errors.most_common(3)]
+def is_analysis_result_claimed(db: Session, analysis_id: str) -> bool:
+    claimed = db.query(models.AnalysisResult.claimed).filter(models.AnalysisResult.id == analysis_id).scalar()
+    return bool(claimed)
+
+
+def get_analysis_result(db: Session, analysis_id: str, user_id: int) -> Optional[Tuple[str, Optional[str]]]:
+    """返回某个用户自己的分析的 (状态, 分析文本)；不存在时返回 None。"""
+    row = db.query(models.AnalysisResult.status, models.AnalysisResult.analysis).filter(
+        models.AnalysisResult.id == analysis_id, models.AnalysisResult.user_id == user_id
+    ).first()
+    return (row.status, row.analysis) if row else None
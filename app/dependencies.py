@@ -8,12 +8,14 @@ from jose import JWTError, jwt
 from . import crud, models
 from .database import get_db
 from .security import SECRET_KEY, ALGORITHM
+from .services import principal_cache
+from .services.principal_cache import Principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    """获取当前登录的用户模型"""
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """获取当前登录用户的身份（ID、用户名、是否管理员）。命中缓存时不查询数据库。"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
@@ -27,15 +29,33 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = crud.get_user_by_username(db, username=username)
+    token_version = payload.get("exp")
+    principal = principal_cache.get(username, token_version)
+    if principal is None:
+        user = crud.get_user_by_username(db, username=username)
+        if user is None:
+            raise credentials_exception
+        principal = Principal(id=user.id, username=user.username, is_admin=bool(user.is_admin))
+        principal_cache.put(username, token_version, principal)
+    return principal
+
 
+def get_current_user(principal: Principal = Depends(get_current_principal),
+                     db: Session = Depends(get_db)) -> models.User:
+    """获取当前登录的用户模型，只有需要密码哈希、积分等完整用户信息的接口才使用。"""
+    # 身份缓存未命中时，同一个会话里已经加载过这个用户，这里不会再查询
+    user = db.get(models.User, principal.id)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
 # --- 新增依赖 ---
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_admin_user(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """
     获取当前登录的用户，并验证其是否为管理员。
     如果不是管理员，则抛出403 Forbidden错误。
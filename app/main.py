@@ -1,9 +1,14 @@
 # 作用: FastAPI应用的入口文件。
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from . import models
 from .database import app_engine
+from .services import llm_service
+from .services.sandbox_pool import sandbox_pool
+from .services.chat_history_writer import chat_history_writer
+from .services.index_refresher import topic_index_refresher, leaderboard_refresher
 # 【重要】确保导入了所有重构后的路由
 from .routers import auth, chat, test, admin, daily
 
@@ -11,10 +16,29 @@ from .routers import auth, chat, test, admin, daily
 # 提示：由于模型已重构，您需要删除旧的 .db 文件再重启，以生成新表结构
 models.Base.metadata.create_all(bind=app_engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建共享的LLM客户端连接池
+    llm_service.init_llm_clients()
+    chat_history_writer.start()
+    # 内存中的知识点索引和积分排行榜在后台加载和定期重建
+    topic_index_refresher.start()
+    leaderboard_refresher.start()
+    yield
+    # 关闭时写完队列中剩余的聊天记录，释放LLM连接并回收SQL评测工作进程
+    await topic_index_refresher.stop()
+    await leaderboard_refresher.stop()
+    await chat_history_writer.stop()
+    await llm_service.close_llm_clients()
+    sandbox_pool.shutdown()
+
+
 app = FastAPI(
     title="SQL学习助手",
     description="一个集成了大模型的智能SQL学习与测验平台",
     version="2.0.0", # 版本升级，代表重构完成
+    lifespan=lifespan,
 )
 
 # --- CORS中间件 ---
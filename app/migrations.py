@@ -0,0 +1,27 @@
+# 作用: 为已有数据库补齐新增的列和索引。create_all 只创建不存在的表，不会修改已有的表。
+
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from . import models
+
+# 按顺序执行，每条语句都可以重复执行
+UPGRADE_STATEMENTS = [
+    # 题目正确答案的预计算指纹
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS correct_result_hash VARCHAR",
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS correct_row_count INTEGER",
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS correct_column_count INTEGER",
+    # 排行榜冷启动时按 (积分降序, 用户ID) 顺序读取
+    "CREATE INDEX IF NOT EXISTS ix_users_points_id ON users (points DESC, id)",
+]
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """创建缺少的表，再补齐已有表上缺少的列和索引，返回执行过的语句。"""
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for statement in UPGRADE_STATEMENTS:
+            conn.execute(text(statement))
+    return list(UPGRADE_STATEMENTS)
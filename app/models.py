@@ -1,6 +1,6 @@
 # 作用: 定义数据库表结构 (ORM模型)。
 
-from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, ForeignKey, Date, Index, Table
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -22,6 +22,9 @@ class User(Base):
     # 新增：用户与能力测试提交记录的关系
     test_submissions = relationship("TestSubmission", back_populates="user")
 
+    # 排行榜冷启动时按 (积分降序, 用户ID) 顺序读取
+    __table_args__ = (Index('ix_users_points_id', points.desc(), id),)
+
 class ChatHistory(Base):
     __tablename__ = 'chat_history'
     id = Column(Integer, primary_key=True)
@@ -34,6 +37,24 @@ class ChatHistory(Base):
     user = relationship("User", back_populates="chat_histories")
 
 
+# 题目与知识点的多对多关联，按知识点查题目时走 topic_id 上的索引
+question_topics = Table(
+    'question_topics',
+    Base.metadata,
+    Column('question_id', Integer, ForeignKey('questions.id'), primary_key=True),
+    Column('topic_id', Integer, ForeignKey('topics.id'), primary_key=True, index=True),
+)
+
+
+class Topic(Base):
+    __tablename__ = 'topics'
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)  # 第一次出现时的写法，用于展示
+    key = Column(String, unique=True, index=True, nullable=False)  # 规范化后的名称，用于精确匹配
+
+    questions = relationship("Question", secondary=question_topics, back_populates="topic_entries")
+
+
 # 【核心重构】新增 Question 模型作为主题库
 class Question(Base):
     __tablename__ = 'questions'
@@ -47,6 +68,11 @@ class Question(Base):
     setup_sql = Column(Text, nullable=False)
 
     topics = Column(String, nullable=False)  # 知识点, e.g., "GROUP BY,JOIN"
+
+    # 正确答案结果的指纹，发布时预先计算，评测时只需运行用户的SQL
+    correct_result_hash = Column(String, nullable=True)
+    correct_row_count = Column(Integer, nullable=True)
+    correct_column_count = Column(Integer, nullable=True)
     status = Column(String, default='draft', index=True)  # 状态: 'draft', 'published'
 
     author_id = Column(Integer, ForeignKey('users.id'))
@@ -58,6 +84,8 @@ class Question(Base):
     approver = relationship("User", foreign_keys=[approver_id], back_populates="approved_questions")
     # 新增：题目与测试提交记录的关系
     submissions = relationship("TestSubmission", back_populates="question")
+    # topics 字段拆分后的知识点，由 crud 在写入 topics 时同步维护
+    topic_entries = relationship("Topic", secondary=question_topics, back_populates="questions")
 
 # 【模型简化】DailyQuestion 现在只引用 Question 表中的题目ID
 class DailyQuestion(Base):
@@ -84,6 +112,17 @@ class DailySubmission(Base):
     user = relationship("User", back_populates="daily_submissions")
     daily_question_entry = relationship("DailyQuestion", back_populates="submissions")
 
+
+class DailyPointAward(Base):
+    """每位用户每天最多一条：主键保证并发提交时每日积分也只发放一次。"""
+    __tablename__ = 'daily_point_awards'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    question_id = Column(Integer, ForeignKey('questions.id'))  # 获得积分时答对的题目
+    submitted_sql = Column(Text, nullable=False)
+    points = Column(Integer, nullable=False)
+    awarded_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
 # 原有的 GeneratedQuestion 模型已被移除
 
 # --- 【新增模型】用于记录能力测试的每一次提交 ---
@@ -96,4 +135,67 @@ class TestSubmission(Base):
     submitted_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), index=True)
 
     user = relationship("User", back_populates="test_submissions")
-    question = relationship("Question", back_populates="submissions")
\ No newline at end of file
+    question = relationship("Question", back_populates="submissions")
+
+
+# --- 每个用户每个知识点每天的答题统计，随能力测试提交增量更新 ---
+class UserTopicDailyStat(Base):
+    __tablename__ = 'user_topic_daily_stats'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    wrong = Column(Integer, default=0, nullable=False)
+    last_attempt_at = Column(DateTime, nullable=True)
+
+    # 按用户和日期范围汇总薄弱知识点
+    __table_args__ = (Index('ix_user_topic_daily_stats_user_day', 'user_id', 'day'),)
+
+
+# --- 批量生成题目的持久化任务队列 ---
+class GenerationJob(Base):
+    __tablename__ = 'generation_jobs'
+    id = Column(Integer, primary_key=True, index=True)
+    author_id = Column(Integer, ForeignKey('users.id'))
+    topics = Column(String, nullable=False)  # 知识点, e.g., "GROUP BY,JOIN"
+    llm_provider = Column(String, nullable=False)
+    total = Column(Integer, nullable=False)
+    status = Column(String, default='pending', index=True)  # 状态: 'pending', 'running', 'completed', 'failed'
+    succeeded = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    items = relationship("GenerationJobItem", back_populates="job")
+
+
+class GenerationJobItem(Base):
+    """任务中的一道题，是工作进程领取和重试的最小单位。"""
+    __tablename__ = 'generation_job_items'
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('generation_jobs.id'), nullable=False, index=True)
+    status = Column(String, default='pending', nullable=False)  # 状态: 'pending', 'running', 'succeeded', 'failed'
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))  # 重试前的等待
+    locked_by = Column(String, nullable=True)  # 领取该项的工作进程
+    locked_at = Column(DateTime, nullable=True)
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    job = relationship("GenerationJob", back_populates="items")
+
+    # 工作进程按状态和可执行时间领取任务
+    __table_args__ = (Index('ix_generation_job_items_claim', 'status', 'available_at'),)
+
+
+# --- 后台生成的AI导师分析：由发起的服务进程生成，其他服务进程通过这张表查询状态和结果 ---
+class AnalysisResult(Base):
+    __tablename__ = 'analysis_results'
+    id = Column(String, primary_key=True)  # 分析编号
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    status = Column(String, default='pending', nullable=False)  # 状态: 'pending', 'done', 'failed', 'cancelled'
+    analysis = Column(Text, nullable=True)
+    claimed = Column(Boolean, default=False, nullable=False)  # 是否已有客户端来取过结果
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), index=True)
+    finished_at = Column(DateTime, nullable=True)
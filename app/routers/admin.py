@@ -1,13 +1,18 @@
 # 作用: 定义仅供管理员访问的API路由。
 
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from .. import crud, models, schemas
+from .. import crud, schemas
+from ..config import settings
 from ..database import get_db
 from ..dependencies import get_current_admin_user
-from ..services import llm_service
+from ..services.principal_cache import Principal
+from ..services import sql_executor, question_audit, generation_jobs, verdict_cache, analysis_cache, analysis_jobs, explanation_cache, llm_gateway, llm_hedging, llm_metrics
+from ..services.sandbox_pool import sandbox_pool
+from ..services.chat_history_writer import chat_history_writer
 
 router = APIRouter(
     prefix="/admin",
@@ -17,41 +22,35 @@ router = APIRouter(
 
 # --- 题库管理 ---
 
-# 【重要修复】将函数声明为 async def
-async def background_task_generate_questions(db: Session, request: schemas.BatchGenerateRequest, author_id: int):
-    """后台任务：调用LLM生成题目并存入数据库"""
-    print(f"后台任务开始：为用户 {author_id} 生成 {request.count} 道关于 '{request.topics}' 的题目。")
-    for i in range(request.count):
-        print(f"正在生成第 {i+1}/{request.count} 道题...")
-        # 现在可以在这里安全地使用 await
-        question_data = await llm_service.generate_question_from_llm(
-            topics=request.topics,
-            llm_provider=request.llm_provider
-        )
-        if "error" not in question_data.correct_sql:
-            # 注意：crud 操作是同步的，在后台任务的异步函数中调用是可行的，
-            # 但在高性能场景下需注意不要长时间阻塞事件循环。
-            crud.create_question_draft(
-                db=db,
-                question_data=question_data,
-                topics=",".join(request.topics),
-                author_id=author_id
-            )
-    print("后台任务完成。")
-
-
 @router.post("/questions/batch-generate")
-async def batch_generate_questions(
+def batch_generate_questions(
     request: schemas.BatchGenerateRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(get_current_admin_user)
+    admin_user: Principal = Depends(get_current_admin_user)
 ):
     """
-    管理员请求批量生成题目。该请求会立即返回，并在后台执行生成任务。
+    管理员请求批量生成题目。该请求只把任务写入队列并立即返回任务ID，由独立的工作进程执行生成。
     """
-    background_tasks.add_task(background_task_generate_questions, db, request, admin_user.id)
-    return {"message": f"已开始在后台生成 {request.count} 道题目，请稍后在审核列表查看。"}
+    job = crud.create_generation_job(db, request, author_id=admin_user.id)
+    return {
+        "message": f"已将 {request.count} 道题目的生成任务加入队列，请稍后在审核列表查看。",
+        "job_id": job.id
+    }
+
+
+@router.get("/questions/generation-jobs", response_model=List[schemas.GenerationJobView])
+def list_generation_jobs(limit: int = 20, db: Session = Depends(get_db)):
+    """查看最近的批量生成任务"""
+    return [generation_jobs.to_view(db, job) for job in crud.get_generation_jobs(db, limit=limit)]
+
+
+@router.get("/questions/generation-jobs/{job_id}", response_model=schemas.GenerationJobView)
+def get_generation_job(job_id: int, db: Session = Depends(get_db)):
+    """查看批量生成任务的进度、失败原因和耗时"""
+    job = crud.get_generation_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="未找到该任务")
+    return generation_jobs.to_view(db, job)
 
 
 @router.get("/questions/drafts", response_model=List[schemas.QuestionAdminView])
@@ -77,7 +76,7 @@ def update_draft_question(
 def publish_a_question(
     question_id: int,
     db: Session = Depends(get_db),
-    admin_user: models.User = Depends(get_current_admin_user)
+    admin_user: Principal = Depends(get_current_admin_user)
 ):
     """管理员审核通过并发布一个题目"""
     published_question = crud.publish_question(db, question_id, admin_user.id)
@@ -86,6 +85,95 @@ def publish_a_question(
     return published_question
 
 
+@router.post("/questions/backfill-fingerprints")
+def backfill_question_fingerprints(db: Session = Depends(get_db)):
+    """为缺少正确答案指纹的旧题目补齐指纹"""
+    return crud.backfill_question_fingerprints(db)
+
+
+@router.post("/questions/audit")
+async def audit_questions(request: schemas.QuestionAuditRequest, db: Session = Depends(get_db)):
+    """
+    在后台通过评测进程池检查题目能否正常评测（setup_sql 能否加载、correct_sql 能否执行），立即返回审计编号。
+    用 GET /admin/questions/audit/{audit_id} 查看进度，完成后返回失效题目、最慢题目和结果最大的题目。
+    """
+    questions = await run_in_threadpool(crud.get_questions_for_audit, db, request.question_ids)
+    concurrency = settings.QUESTION_AUDIT_CONCURRENCY or max(1, settings.SANDBOX_MAX_WORKERS // 2)
+    job = question_audit.start_audit(questions, concurrency=concurrency)
+    return question_audit.audit_view(job)
+
+
+@router.get("/questions/audit/{audit_id}")
+def get_question_audit(audit_id: str):
+    """查看后台题库审计的进度和报告"""
+    job = question_audit.get_audit(audit_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="审计不存在或已过期")
+    return question_audit.audit_view(job)
+
+
+# --- 评测沙箱 ---
+@router.get("/sandbox/stats")
+def get_sandbox_stats():
+    """查看SQL评测沙箱的进程池状态，以及快照缓存和评测结论缓存的命中情况"""
+    return {
+        "pool": sandbox_pool.stats(),
+        # 仅包含Web进程内的快照缓存（例如发布题目时计算指纹），工作进程的命中情况见 pool 中的计数
+        "snapshot_cache": sql_executor.get_snapshot_cache_stats(),
+        "verdict_cache": verdict_cache.stats(),
+    }
+
+
+# --- 大模型服务 ---
+@router.get("/llm/stats")
+def get_llm_stats():
+    """查看各LLM提供商的排队、拒绝和熔断状态，对冲请求的次数，以及分析缓存和讲解缓存的命中率"""
+    return {
+        "providers": llm_gateway.stats(),
+        "hedging": llm_hedging.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "analysis_jobs": analysis_jobs.stats(),
+        "explanation_cache": explanation_cache.stats(),
+        "chat_history_writer": chat_history_writer.stats(),
+    }
+
+
+@router.get("/llm/metrics")
+def get_llm_metrics():
+    """按提供商、模型和调用用途汇总的LLM调用明细：排队、首个分块和总耗时的直方图，输出速度，token用量和错误类型"""
+    return {"calls": llm_metrics.snapshot()}
+
+
+@router.delete("/llm/metrics")
+def reset_llm_metrics():
+    """清空LLM调用统计，便于按时间段观察"""
+    llm_metrics.reset()
+    return {"message": "已清空LLM调用统计。"}
+
+
+@router.post("/llm/explanations/prewarm")
+async def prewarm_explanations(request: schemas.ExplanationPrewarmRequest, background_tasks: BackgroundTasks):
+    """在后台为一组常见知识点预先生成讲解，之后的请求可以直接从缓存回放"""
+    background_tasks.add_task(
+        explanation_cache.prewarm,
+        request.topics,
+        request.llm_providers,
+        settings.EXPLANATION_PREWARM_CONCURRENCY,
+        request.fresh
+    )
+    return {"message": f"已开始在后台预热 {len(request.topics)} 个知识点的讲解。"}
+
+
+@router.delete("/llm/explanations")
+def clear_explanations(topic: Optional[str] = None):
+    """清除知识点讲解缓存；指定 topic 时只清除该知识点"""
+    if topic is None:
+        explanation_cache.clear()
+        return {"message": "已清空知识点讲解缓存。"}
+    removed = explanation_cache.invalidate_topic(topic)
+    return {"message": f"已清除 {removed} 条讲解缓存。"}
+
+
 # --- 用户管理相关 ---
 @router.get("/users", response_model=List[schemas.User])
 def list_all_users(db: Session = Depends(get_db)):
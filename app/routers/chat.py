@@ -1,28 +1,52 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from .. import crud, models, schemas
+from .. import crud, schemas
 from ..database import get_db
-from ..dependencies import get_current_user
-from ..services import llm_service
+from ..dependencies import get_current_principal
+from ..services.principal_cache import Principal
+from ..services import explanation_cache, llm_service
+from ..services.chat_history_writer import chat_history_writer
 
 router = APIRouter(
     prefix="/chat",
     tags=["Chat"],
-    dependencies=[Depends(get_current_user)]
+    dependencies=[Depends(get_current_principal)]
 )
 
 
 @router.post("/explain")
-async def explain_sql_topic_stream(request: schemas.ExplanationRequest):
+async def explain_sql_topic_stream(
+    request: schemas.ExplanationRequest,
+    current_user: Principal = Depends(get_current_principal)
+):
     """
     用户输入一个SQL知识点，以流式方式调用LLM进行解释。
+    相同知识点的讲解会被缓存并直接回放，fresh 为 True 时重新生成。
+    完整的问答在响应发送完毕后交给后台写入器保存，不增加聊天延迟。
     """
+    chunks = []
+    completed = False
+    user_id = current_user.id
 
     # 【重要修复】将流式调用包装在一个显式的异步生成器函数中。
     # 这是一个健壮的模式，可以避免框架对返回类型的混淆。
     async def stream_generator():
-        async for chunk in llm_service.get_llm_explanation(request.topic, request.llm_provider):
+        nonlocal completed
+        async for chunk in explanation_cache.stream_explanation(request.topic, request.llm_provider, request.fresh):
+            chunks.append(chunk)
             yield chunk
+        completed = True
 
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    async def record_history():
+        # 客户端中途断开或调用失败时不保存
+        response_message = "".join(chunks)
+        if completed and not llm_service.is_error_response(response_message):
+            await chat_history_writer.submit(user_id, request.topic, response_message, request.llm_provider)
+
+    return StreamingResponse(
+        stream_generator(),
+        media_type="text/event-stream",
+        background=BackgroundTask(record_history)
+    )
@@ -1,14 +1,16 @@
 # 作用: 定义与个性化每日一题和排行榜相关的API路由。
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-import datetime
+from typing import List, Optional
 
-from .. import crud, models, schemas
+from .. import crud, schemas
 from ..database import get_db
-from ..dependencies import get_current_user
-from ..services import sql_executor
+from ..dependencies import get_current_principal
+from ..services.principal_cache import Principal
+from ..services.grading import grade_submission
+from ..services.sandbox_pool import SandboxBusyError
 
 router = APIRouter(
     prefix="/daily",
@@ -21,7 +23,7 @@ POINTS_FOR_DAILY_QUESTION = 10
 @router.get("/get-personalized-question", response_model=schemas.QuestionPublicView)
 def get_personalized_daily_question(
         db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_principal)
 ):
     """
     为用户推荐一道个性化的“每日”题目。
@@ -42,63 +44,79 @@ def get_personalized_daily_question(
 
 
 @router.post("/submit-personalized-answer", response_model=schemas.DailyAnswerEvaluationResponse)
-def submit_personalized_answer(
+async def submit_personalized_answer(
         request: schemas.TestAnswerSubmissionRequest,
         db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_principal)
 ):
     """用户提交个性化题目的答案"""
-    question = crud.get_question_by_id(db, request.question_id)
+    # 同步的数据库操作放到线程池中执行，事件循环只负责等待评测结果
+    question = await run_in_threadpool(crud.get_question_by_id, db, request.question_id)
     if not question:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到该题目")
 
-    evaluation = sql_executor.evaluate_sql_in_isolation(
-        setup_sql=question.setup_sql,
-        correct_sql=question.correct_sql,
-        user_sql=request.user_sql
-    )
+    try:
+        evaluation = await grade_submission(question, request.user_sql)
+    except SandboxBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
 
-    is_correct = evaluation.get("is_correct", False)
+    is_correct = evaluation.is_correct
 
     # 如果回答错误，直接返回结果
     if not is_correct:
-        if evaluation["status"] == "syntax_error":
+        if evaluation.status == "syntax_error":
             return schemas.DailyAnswerEvaluationResponse(status="syntax_error",
-                                                         message=f"语法错误: {evaluation['error']}")
+                                                         message=f"语法错误: {evaluation.error}")
+        elif evaluation.status in ("timeout", "resource_limit"):
+            return schemas.DailyAnswerEvaluationResponse(status=evaluation.status,
+                                                         message=f"执行失败: {evaluation.error}")
         else:
             return schemas.DailyAnswerEvaluationResponse(status="result_error", message="答案错误，再接再厉！")
 
     # --- 【核心修改】如果回答正确，执行以下积分逻辑 ---
-
-    # 1. 检查用户今天是否已经获得过每日积分
-    has_received_points = crud.has_user_received_daily_points_today(db, user_id=current_user.id)
-
-    if has_received_points:
+    # 查重、加分和发放记录在同一个事务里完成，今天已经发放过时什么也不改
+    total_points = await run_in_threadpool(crud.award_daily_points, db, current_user.id, question.id,
+                                           request.user_sql, POINTS_FOR_DAILY_QUESTION)
+    if total_points is None:
         return schemas.DailyAnswerEvaluationResponse(status="correct",
                                                      message="回答正确！不过今天已经获得过每日积分了哦。")
-    else:
-        # 2. 如果今天没得过分，现在就给分
-        crud.add_points_to_user(db, current_user.id, POINTS_FOR_DAILY_QUESTION)
+    return schemas.DailyAnswerEvaluationResponse(status="correct",
+                                                 message=f"回答正确！恭喜你获得了 {POINTS_FOR_DAILY_QUESTION} 积分！")
 
-        # 3. 为了“标记”今天已得分，我们需要在 daily_submissions 表中创建一条记录。
-        #    为此，我们找到或创建一个“今天”的 DailyQuestion 锚点记录。
-        today_daily_entry = crud.get_daily_question_by_date(db, date=datetime.date.today())
-        if not today_daily_entry:
-            # 如果不存在，就用当前用户答对的这道题作为今天的“锚点”
-            today_daily_entry = crud.create_daily_question(db, question_id=question.id)
 
-        # 4. 创建提交记录
-        crud.create_daily_submission(db, current_user.id, today_daily_entry.id, request.user_sql, is_correct)
-
-        return schemas.DailyAnswerEvaluationResponse(status="correct",
-                                                     message=f"回答正确！恭喜你获得了 {POINTS_FOR_DAILY_QUESTION} 积分！")
+def _entries(standings) -> List[schemas.LeaderboardEntry]:
+    return [schemas.LeaderboardEntry(rank=s.rank, username=s.username, points=s.points) for s in standings]
 
 
 @router.get("/leaderboard", response_model=List[schemas.LeaderboardEntry])
 def get_leaderboard_endpoint(limit: int = 10, db: Session = Depends(get_db)):
-    """获取积分排行榜。"""
-    users = crud.get_leaderboard(db, limit=limit)
-    return [
-        schemas.LeaderboardEntry(rank=i + 1, username=user.username, points=user.points)
-        for i, user in enumerate(users)
-    ]
+    """获取积分排行榜的前 limit 名（不限上限，人数很多时请使用 /leaderboard/page 翻页）。"""
+    return _entries(crud.get_leaderboard(db, limit=limit))
+
+
+@router.get("/leaderboard/page", response_model=schemas.LeaderboardPage)
+def get_leaderboard_page_endpoint(
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_db)
+):
+    """按游标翻页获取排行榜：第一页不传 cursor，之后传上一页返回的 next_cursor。"""
+    try:
+        standings, next_cursor = crud.get_leaderboard_page(db, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的翻页游标")
+    return schemas.LeaderboardPage(entries=_entries(standings), next_cursor=next_cursor)
+
+
+@router.get("/leaderboard/me", response_model=schemas.LeaderboardAroundMe)
+def get_my_leaderboard_position(
+        radius: int = Query(2, ge=0, le=20),
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_principal)
+):
+    """获取当前用户的名次，以及排在其前后各 radius 名的用户。"""
+    me = crud.get_user_standing(db, current_user.id)
+    return schemas.LeaderboardAroundMe(
+        me=_entries([me])[0] if me else None,
+        entries=_entries(crud.get_leaderboard_around_user(db, current_user.id, radius))
+    )
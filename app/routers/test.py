@@ -1,18 +1,28 @@
 # 作用: 定义用户进行SQL能力测试的相关API路由。
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import re
 
-from .. import crud, schemas, models
+from .. import crud, schemas
+from ..config import settings
 from ..database import get_db
-from ..dependencies import get_current_user
-from ..services import llm_service, sql_executor
+from ..dependencies import get_current_principal
+from ..services.principal_cache import Principal
+from ..services import llm_service, analysis_cache, analysis_jobs
+from ..services.grading import grade_submission
+from ..services.sandbox_pool import SandboxBusyError
+
+# 长轮询单次最多等待的秒数，以及SSE等待期间发送保活注释的间隔
+ANALYSIS_MAX_WAIT_SECONDS = 30
+SSE_KEEPALIVE_SECONDS = 15
 
 router = APIRouter(
     prefix="/test",
     tags=["SQL Testing"],
-    dependencies=[Depends(get_current_user)]
+    dependencies=[Depends(get_current_principal)]
 )
 
 # 【重要修改】这个函数不再需要，我们将直接返回完整的建表语句
@@ -45,58 +55,132 @@ def get_a_question_for_test(
 async def submit_test_answer(
     request: schemas.TestAnswerSubmissionRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """用户提交能力测试的答案并获取评测结果"""
-    question = crud.get_question_by_id(db, request.question_id)
+    # 同步的数据库操作放到线程池中执行，事件循环只负责等待评测结果
+    question = await run_in_threadpool(crud.get_question_by_id, db, request.question_id)
     if not question:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到该题目")
 
-    evaluation = sql_executor.evaluate_sql_in_isolation(
-        setup_sql=question.setup_sql,
-        correct_sql=question.correct_sql,
-        user_sql=request.user_sql
-    )
+    try:
+        evaluation = await grade_submission(question, request.user_sql, with_preview=request.include_preview)
+    except SandboxBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
 
-    crud.create_test_submission(
+    # 提交记录会让会话中的题目对象过期，之后再读取字段会在事件循环中查询数据库，所以先取出需要的字段
+    question_id, question_text, correct_sql = question.id, question.question_text, question.correct_sql
+    await run_in_threadpool(
+        crud.create_test_submission,
         db=db,
         user_id=current_user.id,
-        question_id=question.id,
-        is_correct=evaluation.get("is_correct", False)
+        question_id=question_id,
+        is_correct=evaluation.is_correct
     )
 
-    evaluation_status = evaluation["status"]
+    evaluation_status = evaluation.status
     message = ""
     analysis = None
+    analysis_id = None
 
+    # 分析在后台生成，只使用上面取出的字段，不让后台任务引用请求结束后就会失效的数据库对象
+    llm_provider = settings.ANALYSIS_LLM_PROVIDER
+    user_sql = request.user_sql
     if evaluation_status == "syntax_error":
         message = "你的SQL语句存在语法错误，看看AI导师的分析吧！"
-        analysis = await llm_service.analyze_syntax_error(
-            user_sql=request.user_sql,
-            db_error=evaluation["error"],
-            llm_provider="deepseek"
+        db_error = evaluation.error
+        analysis_key = analysis_cache.make_key(question_id, "syntax_error", llm_provider, user_sql, db_error)
+        compute = lambda: llm_service.analyze_syntax_error(
+            user_sql=user_sql,
+            db_error=db_error,
+            llm_provider=llm_provider
         )
     elif evaluation_status == "result_error":
         message = "语法没问题，但结果不对哦。看看AI导师对你的逻辑分析吧！"
-        analysis = await llm_service.analyze_result_error(
-            question=question.question_text,
-            user_sql=request.user_sql,
-            correct_sql=question.correct_sql,
-            llm_provider="deepseek"
+        analysis_key = analysis_cache.make_key(question_id, "result_error", llm_provider, user_sql)
+        compute = lambda: llm_service.analyze_result_error(
+            question=question_text,
+            user_sql=user_sql,
+            correct_sql=correct_sql,
+            llm_provider=llm_provider
         )
     elif evaluation_status == "correct":
         message = "太棒了，完全正确！来看看AI导师有没有更好的建议吧！"
-        analysis = await llm_service.analyze_for_improvement(
-            question=question.question_text,
-            user_sql=request.user_sql,
-            correct_sql=question.correct_sql,
-            llm_provider="deepseek"
+        analysis_key = analysis_cache.make_key(question_id, "improvement", llm_provider, user_sql)
+        compute = lambda: llm_service.analyze_for_improvement(
+            question=question_text,
+            user_sql=user_sql,
+            correct_sql=correct_sql,
+            llm_provider=llm_provider
         )
+    elif evaluation_status in ("timeout", "resource_limit"):
+        message = f"你的SQL执行时间过长或占用资源过多，请检查是否存在笛卡尔积或无限递归。({evaluation.error})"
+        analysis_key = None
     else: # setup_error
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=evaluation["error"])
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=evaluation.error)
+
+    if analysis_key is not None:
+        # 缓存中已有分析时直接返回，否则在后台生成，客户端凭 analysis_id 获取
+        analysis = analysis_cache.get_cached(analysis_key)
+        if analysis is None:
+            analysis_id = await analysis_jobs.start(current_user.id, analysis_key, compute)
+
+    result_preview = None
+    if request.include_preview and evaluation.user_row_count is not None:
+        result_preview = schemas.ResultPreview(
+            columns=evaluation.columns,
+            rows=evaluation.preview(),
+            total_rows=evaluation.user_row_count,
+            truncated=evaluation.preview_truncated
+        )
 
     return schemas.TestAnswerEvaluationResponse(
         status=evaluation_status,
         message=message,
-        analysis=analysis
+        analysis=analysis,
+        analysis_id=analysis_id,
+        result_preview=result_preview
     )
+
+
+async def _claim_analysis(analysis_id: str, current_user: Principal) -> analysis_jobs.AnalysisHandle:
+    handle = await analysis_jobs.claim(analysis_id, current_user.id)
+    if handle is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="分析不存在或已过期")
+    return handle
+
+
+def _analysis_view(handle: analysis_jobs.AnalysisHandle) -> schemas.AnalysisView:
+    return schemas.AnalysisView(analysis_id=handle.id, status=handle.status, analysis=handle.analysis)
+
+
+@router.get("/analysis/{analysis_id}", response_model=schemas.AnalysisView)
+async def get_analysis(
+    analysis_id: str,
+    wait: float = Query(0, ge=0, le=ANALYSIS_MAX_WAIT_SECONDS),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """查询AI导师分析的结果；wait 大于0时最多等待 wait 秒（长轮询）"""
+    handle = await _claim_analysis(analysis_id, current_user)
+    await analysis_jobs.wait(handle, wait)
+    return _analysis_view(handle)
+
+
+@router.get("/analysis/{analysis_id}/stream")
+async def stream_analysis(
+    analysis_id: str,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """以SSE方式订阅AI导师分析，生成完毕后推送一条 analysis 事件并结束"""
+    handle = await _claim_analysis(analysis_id, current_user)
+
+    async def event_generator():
+        # 等待期间定期发送注释行，防止代理因空闲断开连接
+        while handle.status == "pending":
+            await analysis_jobs.wait(handle, SSE_KEEPALIVE_SECONDS)
+            if handle.status == "pending":
+                yield ": keep-alive\n\n"
+        payload = _analysis_view(handle).model_dump_json()
+        yield f"event: analysis\ndata: {payload}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -41,12 +41,18 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 
+# 可选的大模型提供商；mock 仅在开启 MOCK_LLM_ENABLED 时可用，用于压测
+LLMProvider = Literal["deepseek", "qwen", "mock"]
+
+
 # --- Chat Schema ---
 class ExplanationRequest(BaseModel):
     topic: str
-    llm_provider: Literal["deepseek", "qwen"]
+    llm_provider: LLMProvider
     # 新增：用户可以选择是否开启个性化推荐
     personalized: bool = False
+    # 为 True 时不使用缓存中的讲解，重新调用LLM生成
+    fresh: bool = False
 
 class QuestionPublicView(BaseModel):
     question_id: int
@@ -91,8 +97,24 @@ class LLMGeneratedQuestionData(BaseModel):
 
 class BatchGenerateRequest(BaseModel):
     topics: List[str]
-    count: int = Field(gt=0, le=10)
-    llm_provider: Literal["deepseek", "qwen"] = "deepseek"
+    # 由独立的工作进程执行，单个任务可以包含大量题目
+    count: int = Field(gt=0, le=5000)
+    llm_provider: LLMProvider = "deepseek"
+
+class GenerationJobView(BaseModel):
+    job_id: int
+    status: Literal["pending", "running", "completed", "failed"]
+    topics: List[str]
+    llm_provider: str
+    total: int
+    pending: int  # 等待领取或等待重试
+    in_flight: int
+    succeeded: int
+    failed: int
+    question_ids: List[int]
+    errors: List[str]
+    created_at: datetime.datetime
+    elapsed_seconds: float
 
 # 【重要修复】为抽题功能新增一个专门的请求模型
 class GetQuestionRequest(BaseModel):
@@ -111,19 +133,51 @@ class QuestionAdminView(QuestionUpdate):
     status: str
     author_id: int
     created_at: datetime.datetime
+    correct_row_count: Optional[int] = None
+    correct_column_count: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class ExplanationPrewarmRequest(BaseModel):
+    topics: List[str] = Field(..., min_length=1)
+    llm_providers: List[LLMProvider] = ["deepseek"]
+    # 为 True 时即使已有缓存也重新生成
+    fresh: bool = False
+
+
+class QuestionAuditRequest(BaseModel):
+    # 为空时检查全部已发布题目
+    question_ids: Optional[List[int]] = None
+
+
 class TestAnswerSubmissionRequest(BaseModel):
     question_id: int
     user_sql: str
+    # 是否在评测结果中附带用户查询结果的预览
+    include_preview: bool = False
+
+
+class ResultPreview(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]  # 最多 SANDBOX_PREVIEW_ROWS 行
+    total_rows: int
+    truncated: bool
 
 
 class TestAnswerEvaluationResponse(BaseModel):
-    status: Literal["correct", "syntax_error", "result_error"]
+    status: Literal["correct", "syntax_error", "result_error", "timeout", "resource_limit"]
     message: str
+    # 缓存中已有分析时直接返回 analysis，否则分析在后台生成，凭 analysis_id 获取
+    analysis: Optional[str] = None
+    analysis_id: Optional[str] = None
+    result_preview: Optional[ResultPreview] = None
+
+
+class AnalysisView(BaseModel):
+    analysis_id: str
+    status: Literal["pending", "done", "failed", "cancelled"]
     analysis: Optional[str] = None
 
 
@@ -146,7 +200,7 @@ class DailyAnswerSubmissionRequest(BaseModel):
 
 
 class DailyAnswerEvaluationResponse(BaseModel):
-    status: Literal["correct", "syntax_error", "result_error", "already_solved"]
+    status: Literal["correct", "syntax_error", "result_error", "already_solved", "timeout", "resource_limit"]
     message: str
 
 
@@ -158,6 +212,16 @@ class LeaderboardEntry(BaseModel):
     class Config:
         from_attributes = True
 
+
+class LeaderboardPage(BaseModel):
+    entries: List[LeaderboardEntry]
+    next_cursor: Optional[str] = None  # 传给下一次请求的 cursor 参数；为空表示没有更多了
+
+
+class LeaderboardAroundMe(BaseModel):
+    me: Optional[LeaderboardEntry] = None
+    entries: List[LeaderboardEntry]
+
 # --- 【新增】Stats Schema ---
 class ChartDataResponse(BaseModel):
     # key是日期字符串 "YYYY-MM-DD", value是当天的答题数
@@ -0,0 +1,107 @@
+# 作用: 缓存AI导师的分析结果，并把同时发起的相同分析请求合并为一次LLM调用。
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from ..config import settings
+from . import llm_service
+from .cache import LRUCache
+from .sql_normalizer import sql_fingerprint
+
+# 值为 (分析文本, 生成耗时秒数)，按文本的UTF-8字节数计入缓存大小
+_analyses = LRUCache(
+    max_entries=settings.ANALYSIS_CACHE_SIZE,
+    ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+    max_bytes=settings.ANALYSIS_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=lambda entry: len(entry[0].encode('utf-8')),
+)
+_in_flight: Dict[Hashable, "asyncio.Task[Tuple[str, float]]"] = {}
+# 每个进行中的上游调用还有多少等待者，全部取消后上游调用也随之取消
+_waiters: Dict[Hashable, int] = {}
+_stats = {
+    "upstream_calls": 0,
+    "upstream_seconds": 0.0,
+    "coalesced": 0,
+    "saved_seconds": 0.0,
+}
+
+
+def make_key(question_id: int, kind: str, llm_provider: str, user_sql: str, error: Optional[str] = None) -> Hashable:
+    return question_id, kind, llm_provider, sql_fingerprint(user_sql), error or ""
+
+
+async def _compute(key: Hashable, compute: Callable[[], Awaitable[str]]) -> Tuple[str, float]:
+    started = time.perf_counter()
+    text = await compute()
+    duration = time.perf_counter() - started
+    _stats["upstream_calls"] += 1
+    _stats["upstream_seconds"] += duration
+    # 调用失败时返回的是兜底提示，不能缓存
+    if not llm_service.is_error_response(text):
+        _analyses.set(key, (text, duration))
+    return text, duration
+
+
+def _on_done(key: Hashable, task: "asyncio.Task") -> None:
+    _in_flight.pop(key, None)
+    # 所有等待者都已取消时，避免出现 "exception was never retrieved" 警告
+    if not task.cancelled():
+        task.exception()
+
+
+def get_cached(key: Hashable) -> Optional[str]:
+    """只查缓存，不触发LLM调用。"""
+    cached = _analyses.get(key)
+    if cached is None:
+        return None
+    text, duration = cached
+    _stats["saved_seconds"] += duration
+    return text
+
+
+async def _wait(key: Hashable, task: "asyncio.Task[Tuple[str, float]]") -> Tuple[str, float]:
+    _waiters[key] = _waiters.get(key, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # 最后一个等待者也放弃了，没有必要继续等待上游
+        if _waiters[key] == 1 and not task.done():
+            task.cancel()
+        raise
+    finally:
+        _waiters[key] -= 1
+        if not _waiters[key]:
+            del _waiters[key]
+
+
+async def get_or_compute(key: Hashable, compute: Callable[[], Awaitable[str]]) -> str:
+    """
+    返回缓存中的分析；未命中时调用 compute 生成。
+    相同 key 的并发请求共享同一次上游调用，某个等待者取消不会影响其他等待者，所有等待者都取消时上游调用才会被取消。
+    """
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_compute(key, compute))
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _on_done(key, t))
+        text, _ = await _wait(key, task)
+        return text
+
+    _stats["coalesced"] += 1
+    text, duration = await _wait(key, task)
+    _stats["saved_seconds"] += duration
+    return text
+
+
+def invalidate_question(question_id: int) -> None:
+    """题目被修改后调用，丢弃该题目下缓存的所有分析。"""
+    _analyses.invalidate_where(lambda key: key[0] == question_id)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_analyses.stats(), **_stats, "in_flight": len(_in_flight)}
@@ -0,0 +1,201 @@
+# 作用: 在后台生成AI导师分析，提交答案的接口先返回评测结论和分析编号，客户端再轮询或订阅分析结果。
+# 分析由发起的服务进程生成，状态和结果同时写入 analysis_results 表，轮询请求落到其他服务进程时从表中查询。
+
+import asyncio
+import datetime
+import functools
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from .. import crud
+from ..config import settings
+from ..database import AppSessionLocal
+from . import analysis_cache
+
+# 等待其他服务进程生成的分析时，每隔多少秒查询一次数据库
+_POLL_INTERVAL_SECONDS = 0.5
+
+
+@dataclass
+class AnalysisHandle:
+    id: str
+    user_id: int
+    # 本进程中生成分析的任务；分析由其他服务进程生成时为 None，状态和结果来自数据库
+    task: Optional["asyncio.Task[str]"] = None
+    stored_status: str = "pending"
+    stored_analysis: Optional[str] = None
+    # 是否已有客户端来取过结果；超时仍无人领取的分析会被取消
+    collected: bool = False
+    timer: Optional[asyncio.TimerHandle] = field(default=None, repr=False)
+
+    @property
+    def status(self) -> str:
+        if self.task is None:
+            return self.stored_status
+        if not self.task.done():
+            return "pending"
+        if self.task.cancelled():
+            return "cancelled"
+        return "failed" if self.task.exception() is not None else "done"
+
+    @property
+    def analysis(self) -> Optional[str]:
+        if self.status != "done":
+            return None
+        return self.stored_analysis if self.task is None else self.task.result()
+
+
+_handles: "OrderedDict[str, AnalysisHandle]" = OrderedDict()
+# 后台执行的数据库读写，保留引用以免任务被垃圾回收
+_background: Set["asyncio.Task[Any]"] = set()
+_stats = {
+    "started": 0,
+    "collected": 0,
+    "cancelled_unclaimed": 0,
+}
+
+
+def _discard(analysis_id: str) -> None:
+    handle = _handles.pop(analysis_id, None)
+    if handle is None:
+        return
+    if handle.timer is not None:
+        handle.timer.cancel()
+    if not handle.task.done():
+        handle.task.cancel()
+        if not handle.collected:
+            _stats["cancelled_unclaimed"] += 1
+
+
+def _in_session(func: Callable[..., Any], *args: Any) -> Any:
+    # 在线程池中使用独立的会话执行 crud 函数
+    with AppSessionLocal() as db:
+        return func(db, *args)
+
+
+async def _store(func: Callable[..., Any], *args: Any) -> None:
+    try:
+        await asyncio.to_thread(_in_session, func, *args)
+    except Exception as e:
+        # 写入失败不影响本进程内的分析，只是其他服务进程查不到
+        print(f"保存AI导师分析状态失败: {e}")
+
+
+def _in_background(coro: Awaitable[Any]) -> None:
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _expire_unclaimed(handle: AnalysisHandle) -> None:
+    try:
+        # 客户端可能从其他服务进程领取了分析
+        claimed = await asyncio.to_thread(_in_session, crud.is_analysis_result_claimed, handle.id)
+    except Exception as e:
+        print(f"查询AI导师分析的领取状态失败: {e}")
+        claimed = True
+    if _handles.get(handle.id) is not handle:
+        return
+    if not claimed and not handle.task.done():
+        # 一直没有客户端来取，不再继续生成
+        _discard(handle.id)
+        return
+    # 已经生成完或已被其他服务进程领取，再保留一段时间
+    handle.timer = asyncio.get_running_loop().call_later(
+        settings.ANALYSIS_RESULT_RETENTION_SECONDS, _discard, handle.id
+    )
+
+
+def _on_timeout(analysis_id: str) -> None:
+    handle = _handles.get(analysis_id)
+    if handle is None:
+        return
+    if handle.task.done():
+        # 已经生成完但还没人来取，再保留一段时间
+        handle.timer = asyncio.get_running_loop().call_later(
+            settings.ANALYSIS_RESULT_RETENTION_SECONDS, _discard, analysis_id
+        )
+        return
+    _in_background(_expire_unclaimed(handle))
+
+
+def _on_done(analysis_id: str, task: "asyncio.Task[str]") -> None:
+    if task.cancelled():
+        status, analysis = "cancelled", None
+    elif task.exception() is not None:
+        # 取出异常，避免出现 "exception was never retrieved" 警告
+        status, analysis = "failed", None
+    else:
+        status, analysis = "done", task.result()
+    _in_background(_store(crud.finish_analysis_result, analysis_id, status, analysis))
+
+
+async def start(user_id: int, key: Hashable, compute: Callable[[], Awaitable[str]]) -> str:
+    """
+    在后台开始生成分析，返回分析编号。compute 不能引用请求结束后会失效的对象（例如数据库会话中的模型）。
+    返回前先把分析登记到数据库，客户端之后的请求落到其他服务进程时也能查到。
+    """
+    analysis_id = uuid.uuid4().hex
+    expired_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=settings.ANALYSIS_UNCLAIMED_TIMEOUT_SECONDS + settings.ANALYSIS_RESULT_RETENTION_SECONDS
+    )
+    await _store(crud.create_analysis_result, analysis_id, user_id, expired_before)
+
+    task = asyncio.create_task(analysis_cache.get_or_compute(key, compute))
+    task.add_done_callback(functools.partial(_on_done, analysis_id))
+    handle = AnalysisHandle(id=analysis_id, user_id=user_id, task=task)
+    handle.timer = asyncio.get_running_loop().call_later(
+        settings.ANALYSIS_UNCLAIMED_TIMEOUT_SECONDS, _on_timeout, handle.id
+    )
+    _handles[handle.id] = handle
+    _stats["started"] += 1
+    while len(_handles) > settings.ANALYSIS_MAX_PENDING:
+        _discard(next(iter(_handles)))
+    return handle.id
+
+
+async def claim(analysis_id: str, user_id: int) -> Optional[AnalysisHandle]:
+    """取得某个用户自己的分析，并标记为已领取；不存在或已过期时返回 None。"""
+    handle = _handles.get(analysis_id)
+    if handle is None:
+        # 分析由其他服务进程生成，从数据库查询
+        stored = await asyncio.to_thread(_in_session, crud.claim_analysis_result, analysis_id, user_id)
+        if stored is None:
+            return None
+        status, analysis = stored
+        return AnalysisHandle(id=analysis_id, user_id=user_id, stored_status=status, stored_analysis=analysis,
+                              collected=True)
+    if handle.user_id != user_id:
+        return None
+    if not handle.collected:
+        handle.collected = True
+        _stats["collected"] += 1
+        if handle.timer is not None:
+            handle.timer.cancel()
+        handle.timer = asyncio.get_running_loop().call_later(
+            settings.ANALYSIS_RESULT_RETENTION_SECONDS, _discard, analysis_id
+        )
+    return handle
+
+
+async def wait(handle: AnalysisHandle, timeout: float) -> None:
+    """最多等待 timeout 秒，直到分析生成完毕。等待方断开连接不会取消分析本身。"""
+    if handle.status != "pending" or timeout <= 0:
+        return
+    if handle.task is not None:
+        await asyncio.wait({handle.task}, timeout=timeout)
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while handle.stored_status == "pending" and loop.time() < deadline:
+        await asyncio.sleep(min(_POLL_INTERVAL_SECONDS, deadline - loop.time()))
+        stored = await asyncio.to_thread(_in_session, crud.get_analysis_result, handle.id, handle.user_id)
+        # 记录已过期被删除时按已取消处理
+        handle.stored_status, handle.stored_analysis = stored or ("cancelled", None)
+
+
+def stats() -> Dict[str, Any]:
+    pending = sum(1 for handle in _handles.values() if not handle.task.done())
+    return {**_stats, "tracked": len(_handles), "pending": pending}
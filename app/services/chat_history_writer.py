@@ -0,0 +1,115 @@
+# 作用: 在后台批量写入聊天记录，聊天接口只需把记录放入队列，不等待数据库。
+
+import asyncio
+import datetime
+from typing import Any, Dict, List, Optional
+
+from .. import crud
+from ..config import settings
+from ..database import AppSessionLocal
+
+# 放入队列表示停止，后台任务写完它之前的记录后退出
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """
+    聊天记录的后台写入器：攒够 batch_size 条或距离第一条记录超过 flush_interval_seconds 时，
+    用一条多行 INSERT 写入。队列已满时 submit 会等待，从而对调用方形成背压。
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, flush_interval_seconds: float):
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._batch_ready = asyncio.Event()
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "failed": 0,
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, user_id: int, request_message: str, response_message: str, llm_provider: str) -> None:
+        self._stats["submitted"] += 1
+        await self._queue.put({
+            "user_id": user_id,
+            "request_message": request_message,
+            "response_message": response_message,
+            "llm_provider": llm_provider,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+        })
+        # 后台任务手上还拿着一条，所以这里加一
+        if self._queue.qsize() + 1 >= self.batch_size:
+            self._batch_ready.set()
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        with AppSessionLocal() as db:
+            crud.create_chat_histories(db, rows)
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            await asyncio.to_thread(self._write, rows)
+            self._stats["written"] += len(rows)
+            self._stats["batches"] += 1
+        except Exception as e:
+            # 聊天记录不影响主流程，写入失败只记录数量
+            self._stats["failed"] += len(rows)
+            print(f"写入聊天记录失败: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+            # 等到攒够一批或超过最长等待时间
+            if self._queue.qsize() + 1 < self.batch_size:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            rows, stopping = [row], False
+            while len(rows) < self.batch_size and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is _STOP:
+                    stopping = True
+                    break
+                rows.append(row)
+            await self._flush(rows)
+            if stopping:
+                return
+
+    async def stop(self) -> None:
+        """停止后台任务，并把队列中剩余的记录全部写入。"""
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        # 停止过程中才提交的记录
+        rows = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not _STOP:
+                rows.append(row)
+            if len(rows) >= self.batch_size:
+                await self._flush(rows)
+                rows = []
+        if rows:
+            await self._flush(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queued": self._queue.qsize(), "max_queue": self._queue.maxsize}
+
+
+chat_history_writer = ChatHistoryWriter(
+    max_queue=settings.CHAT_HISTORY_QUEUE_SIZE,
+    batch_size=settings.CHAT_HISTORY_BATCH_SIZE,
+    flush_interval_seconds=settings.CHAT_HISTORY_FLUSH_INTERVAL_MS / 1000
+)
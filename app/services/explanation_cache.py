@@ -0,0 +1,104 @@
+# 作用: 缓存知识点讲解的完整流式输出，相同知识点的后续请求直接从缓存回放，不再调用LLM。
+
+import asyncio
+from typing import Any, AsyncGenerator, Dict, Hashable, List, Tuple
+
+from ..config import settings
+from . import llm_service
+from .cache import LRUCache
+
+# 值为讲解的分块元组，回放时按原来的分块依次输出；按UTF-8字节数计入缓存大小
+_explanations = LRUCache(
+    max_entries=settings.EXPLANATION_CACHE_SIZE,
+    ttl_seconds=settings.EXPLANATION_CACHE_TTL_SECONDS,
+    max_bytes=settings.EXPLANATION_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=lambda chunks: sum(len(chunk.encode('utf-8')) for chunk in chunks),
+)
+_stats = {
+    "upstream_calls": 0,
+    "replays": 0,
+    "bypassed": 0,
+    "prewarmed": 0,
+}
+
+# 回放时把过碎的分块合并到这个大小附近，减少向客户端写入的次数
+_REPLAY_CHUNK_CHARS = 512
+
+
+def normalize_topic(topic: str) -> str:
+    """去掉首尾空白和末尾问号，连续空白合并为一个空格，大小写不敏感（"group by" 与 "GROUP BY？" 视为同一知识点）。"""
+    return " ".join(topic.split()).rstrip("?？ ").casefold()
+
+
+def make_key(topic: str, llm_provider: str) -> Hashable:
+    return normalize_topic(topic), llm_provider
+
+
+def _coalesce(chunks: List[str]) -> Tuple[str, ...]:
+    merged, buffer, size = [], [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= _REPLAY_CHUNK_CHARS:
+            merged.append("".join(buffer))
+            buffer, size = [], 0
+    if buffer:
+        merged.append("".join(buffer))
+    return tuple(merged)
+
+
+async def stream_explanation(topic: str, llm_provider: str, fresh: bool = False) -> AsyncGenerator[str, None]:
+    """
+    以流式方式返回知识点讲解。命中缓存时直接回放；否则调用LLM，把输出原样转发给调用方，
+    完整结束且没有出错时写入缓存。fresh 为 True 时跳过缓存读取，但新的结果仍会覆盖旧缓存。
+    """
+    key = make_key(topic, llm_provider)
+    if fresh:
+        _stats["bypassed"] += 1
+    else:
+        cached = _explanations.get(key)
+        if cached is not None:
+            _stats["replays"] += 1
+            for chunk in cached:
+                yield chunk
+            return
+
+    _stats["upstream_calls"] += 1
+    chunks = []
+    # 客户端中途断开时生成器会被关闭，不完整的讲解不会写入缓存
+    async for chunk in llm_service.get_llm_explanation(topic, llm_provider):
+        chunks.append(chunk)
+        yield chunk
+    if not llm_service.is_error_response("".join(chunks)):
+        _explanations.set(key, _coalesce(chunks))
+
+
+async def prewarm(topics: List[str], llm_providers: List[str], concurrency: int, fresh: bool = False) -> None:
+    """为一组知识点预先生成讲解并写入缓存，已缓存的知识点默认跳过。"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm_one(topic: str, llm_provider: str) -> None:
+        if not fresh and _explanations.get(make_key(topic, llm_provider)) is not None:
+            return
+        async with semaphore:
+            async for _ in stream_explanation(topic, llm_provider, fresh=True):
+                pass
+        _stats["prewarmed"] += 1
+
+    # 去掉规范化后重复的知识点
+    unique_topics = list({normalize_topic(topic): topic for topic in topics}.values())
+    await asyncio.gather(*(warm_one(topic, provider) for topic in unique_topics for provider in llm_providers))
+
+
+def invalidate_topic(topic: str) -> int:
+    """丢弃某个知识点在所有提供商下的缓存，返回删除的数量。"""
+    normalized = normalize_topic(topic)
+    return _explanations.invalidate_where(lambda key: key[0] == normalized)
+
+
+def clear() -> None:
+    _explanations.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return {**_explanations.stats(), **_stats}
@@ -0,0 +1,154 @@
+# 作用: 批量生成题目的任务队列。接口只负责写入任务，由独立的工作进程领取后并发调用LLM、在沙箱中校验并写入草稿。
+
+import asyncio
+import datetime
+import os
+import signal
+import socket
+from typing import Dict, Optional
+
+from .. import crud, models, schemas
+from ..config import settings
+from ..database import AppSessionLocal
+from . import llm_service
+from .sandbox_pool import sandbox_pool
+
+
+def to_view(db, job: models.GenerationJob) -> schemas.GenerationJobView:
+    progress = crud.get_generation_job_progress(db, job.id)
+    counts = progress["counts"]
+    elapsed_seconds = 0.0
+    if job.started_at is not None:
+        end = job.finished_at
+        if end is None:
+            end = datetime.datetime.now(datetime.timezone.utc)
+            if job.started_at.tzinfo is None:
+                end = end.replace(tzinfo=None)
+        elapsed_seconds = (end - job.started_at).total_seconds()
+    return schemas.GenerationJobView(
+        job_id=job.id,
+        status=job.status,
+        topics=job.topics.split(","),
+        llm_provider=job.llm_provider,
+        total=job.total,
+        pending=counts.get("pending", 0),
+        in_flight=counts.get("running", 0),
+        succeeded=job.succeeded,
+        failed=job.failed,
+        question_ids=progress["question_ids"],
+        errors=progress["errors"],
+        created_at=job.created_at,
+        elapsed_seconds=elapsed_seconds,
+    )
+
+
+async def validate_generated_question(question_data: schemas.LLMGeneratedQuestionData) -> Optional[str]:
+    """在沙箱中执行生成的 setup_sql 和 correct_sql，校验通过返回 None，否则返回错误原因。"""
+    if question_data.correct_sql.strip() == "-- error":
+        return question_data.question
+    # 以正确答案作为"用户答案"评测一次：能得到 correct 说明建表脚本和答案都能正常执行
+    evaluation = await sandbox_pool.evaluate(
+        setup_sql=question_data.setup_sql,
+        correct_sql=question_data.correct_sql,
+        user_sql=question_data.correct_sql
+    )
+    if evaluation.status != "correct":
+        return f"{evaluation.status}: {evaluation.error}"
+    if not evaluation.user_row_count:
+        return "正确答案的查询结果为空"
+    return None
+
+
+class GenerationWorker:
+    """
+    从数据库领取待生成的题目并执行，最多同时处理 concurrency 道题。
+    可以在多台机器上启动多个工作进程来提高吞吐量，领取时互不冲突。
+    """
+
+    def __init__(self, concurrency: int, poll_interval_seconds: float):
+        self.concurrency = concurrency
+        self.poll_interval_seconds = poll_interval_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    def stop(self) -> None:
+        """停止领取新题目，已领取的题目处理完后退出。"""
+        self._stopping.set()
+
+    # 数据库操作是同步的，放到线程中执行，避免阻塞同时进行的LLM请求
+    def _claim(self, limit: int):
+        with AppSessionLocal() as db:
+            return crud.claim_generation_items(db, self.worker_id, limit, settings.GENERATION_LEASE_SECONDS)
+
+    def _complete(self, claimed: Dict, question_data: schemas.LLMGeneratedQuestionData) -> None:
+        with AppSessionLocal() as db:
+            crud.complete_generation_item(db, claimed, self.worker_id, question_data)
+
+    def _fail(self, claimed: Dict, error: str) -> bool:
+        with AppSessionLocal() as db:
+            return crud.fail_generation_item(db, claimed, self.worker_id, error,
+                                             max_attempts=settings.GENERATION_MAX_ATTEMPTS,
+                                             retry_delay_seconds=settings.GENERATION_RETRY_DELAY_SECONDS)
+
+    async def _process(self, claimed: Dict) -> None:
+        try:
+            question_data = await llm_service.generate_question_from_llm(
+                topics=claimed["topics"].split(","),
+                llm_provider=claimed["llm_provider"]
+            )
+            error = await validate_generated_question(question_data)
+            if not error:
+                await asyncio.to_thread(self._complete, claimed, question_data)
+                self.succeeded += 1
+                return
+        except Exception as e:
+            # LLM调用、沙箱排队或写库失败都只影响这一道题
+            error = f"{type(e).__name__}: {e}"
+        error = f"第 {claimed['attempts']} 次尝试: {error}"
+        if await asyncio.to_thread(self._fail, claimed, error):
+            self.retried += 1
+        else:
+            self.failed += 1
+
+    async def run(self, once: bool = False) -> None:
+        """持续领取并处理题目；once 为 True 时队列为空就退出。"""
+        tasks = set()
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(tasks)
+                claimed = await asyncio.to_thread(self._claim, free) if free else []
+                for item in claimed:
+                    task = asyncio.create_task(self._process(item))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if once and not claimed and not tasks:
+                    break
+                if claimed and len(tasks) < self.concurrency:
+                    # 还有空闲名额，立即继续领取
+                    continue
+                waiters = [asyncio.ensure_future(self._stopping.wait()), *tasks]
+                try:
+                    await asyncio.wait(waiters, timeout=self.poll_interval_seconds,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiters[0].cancel()
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_worker(concurrency: int, poll_interval_seconds: float, once: bool = False) -> GenerationWorker:
+    """工作进程入口：收到 SIGINT/SIGTERM 后不再领取新题目，处理完已领取的题目再退出。"""
+    worker = GenerationWorker(concurrency, poll_interval_seconds)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run(once=once)
+    finally:
+        await llm_service.close_llm_clients()
+        sandbox_pool.shutdown()
+    return worker
@@ -0,0 +1,90 @@
+# 作用: 用户答案评测的统一入口。先查评测结论缓存，未命中时再交给沙箱进程池。
+
+import asyncio
+import hashlib
+from typing import Dict, Hashable, Optional
+
+from .. import crud, models
+from ..config import settings
+from ..database import AppSessionLocal
+from . import verdict_cache
+from .cache import LRUCache
+from .sandbox_pool import sandbox_pool
+from .sql_executor import EvaluationResult
+
+# 正确答案无法计算指纹的题目，过期前不再重复计算（评测时由 correct_sql 自行报告错误）
+_fingerprint_failures = LRUCache(max_entries=1_000, ttl_seconds=settings.FINGERPRINT_FAILURE_TTL_SECONDS)
+# 正在计算中的指纹，同一道题目的并发提交共用一次计算
+_fingerprints_in_flight: Dict[Hashable, "asyncio.Future[Optional[Dict]]"] = {}
+
+
+def _save_fingerprint(question_id: int, setup_sql: str, correct_sql: str, fingerprint: Dict) -> None:
+    # 使用独立的会话，不让提交操作使请求会话中的题目对象过期
+    with AppSessionLocal() as db:
+        crud.save_question_fingerprint(db, question_id, setup_sql, correct_sql, fingerprint)
+
+
+async def _compute_fingerprint(key: Hashable, question_id: int, setup_sql: str, correct_sql: str) -> Optional[Dict]:
+    fingerprint = await sandbox_pool.fingerprint(setup_sql=setup_sql, sql=correct_sql, question_id=question_id)
+    if fingerprint["status"] != "ok":
+        _fingerprint_failures.set(key, fingerprint["error"])
+        return None
+    try:
+        await asyncio.to_thread(_save_fingerprint, question_id, setup_sql, correct_sql, fingerprint)
+    except Exception as e:
+        # 保存失败不影响本次评测，下次评测会重新计算
+        print(f"保存题目 {question_id} 的正确答案指纹失败: {e}")
+    return {
+        "result_hash": fingerprint["result_hash"],
+        "row_count": fingerprint["row_count"],
+        "column_count": fingerprint["column_count"],
+    }
+
+
+async def _expected_fingerprint(question: models.Question) -> Optional[Dict]:
+    """
+    获取题目正确答案的指纹。旧数据没有指纹（或指纹由旧版算法生成）时在进程池中懒加载计算并保存；
+    正确SQL无法执行时返回 None，由评测流程自行报告错误。
+    """
+    stored = crud.get_stored_question_fingerprint(question)
+    if stored is not None:
+        return stored
+
+    digest = hashlib.sha256(f"{question.setup_sql}\0{question.correct_sql}".encode('utf-8')).hexdigest()
+    key = (question.id, digest)
+    if _fingerprint_failures.get(key) is not None:
+        return None
+    future = _fingerprints_in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(
+            _compute_fingerprint(key, question.id, question.setup_sql, question.correct_sql)
+        )
+        _fingerprints_in_flight[key] = future
+        future.add_done_callback(lambda _: _fingerprints_in_flight.pop(key, None))
+    # 某个请求被取消时不影响其他等待同一计算的请求
+    return await asyncio.shield(future)
+
+
+async def grade_submission(question: models.Question, user_sql: str,
+                           with_preview: bool = False) -> EvaluationResult:
+    """
+    评测用户对某道题目的答案。不访问请求的数据库会话，可以直接在事件循环中调用。
+    需要结果预览时跳过缓存查找（缓存中不保存结果行），但评测结论仍会写入缓存。
+    队列已满时抛出 SandboxBusyError。
+    """
+    key = verdict_cache.make_key(question.id, question.setup_sql, question.correct_sql, user_sql)
+    if not with_preview:
+        cached = verdict_cache.get(key)
+        if cached is not None:
+            return cached
+
+    evaluation = await sandbox_pool.evaluate(
+        setup_sql=question.setup_sql,
+        correct_sql=question.correct_sql,
+        user_sql=user_sql,
+        question_id=question.id,
+        expected=await _expected_fingerprint(question),
+        with_preview=with_preview
+    )
+    verdict_cache.put(key, evaluation)
+    return evaluation
@@ -0,0 +1,62 @@
+# 作用: 在后台定期从数据库重建进程内的内存索引，重建耗时不落在任何请求上。
+
+import asyncio
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..config import settings
+from ..database import AppSessionLocal
+
+
+class IndexRefresher:
+    """
+    启动后立即加载一次，之后每隔 interval_seconds 在线程池中调用 load 重建一次。
+    多个服务进程之间不共享内存，其他进程写入的变化最多延迟一个间隔后可见。
+    """
+
+    def __init__(self, name: str, interval_seconds: float, load: Callable[[Session], None]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._load = load
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _reload(self) -> None:
+        with AppSessionLocal() as db:
+            self._load(db)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._reload)
+            except Exception as e:
+                # 重建失败时继续使用旧的索引，下个周期再试
+                print(f"重建{self.name}失败: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+topic_index_refresher = IndexRefresher(
+    name="知识点索引",
+    interval_seconds=settings.TOPIC_INDEX_REFRESH_SECONDS,
+    load=crud.load_topic_index
+)
+
+leaderboard_refresher = IndexRefresher(
+    name="积分排行榜",
+    interval_seconds=settings.LEADERBOARD_REFRESH_SECONDS,
+    load=crud.load_leaderboard
+)
@@ -0,0 +1,108 @@
+# 作用: 内存中的积分排行榜，按积分从高到低排序，查询前N名、翻页、名次和"我附近的用户"都不需要访问数据库。
+
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Standing(NamedTuple):
+    rank: int
+    user_id: int
+    username: str
+    points: int
+
+
+def encode_cursor(points: int, user_id: int) -> str:
+    return f"{points}_{user_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """解析翻页游标，格式不对时抛出 ValueError。"""
+    points, user_id = cursor.split("_")
+    return int(points), int(user_id)
+
+
+class Leaderboard:
+    """
+    按 (-积分, 用户ID) 排好序的列表：积分相同时用户ID小的排在前面，所以名次是确定的。
+    积分变化时由 crud 增量更新；多个服务进程之间不共享内存，因此由 index_refresher 在后台
+    每隔 LEADERBOARD_REFRESH_SECONDS 从数据库整体重建一次。
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._users: Dict[int, Tuple[str, int]] = {}  # 用户ID -> (用户名, 积分)
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def load(self, rows: Iterable[Tuple[int, str, int]]) -> None:
+        """用 (用户ID, 用户名, 积分) 行重建排行榜，行已按积分降序、用户ID升序排列时排序只需线性时间。"""
+        users = {user_id: (username, points or 0) for user_id, username, points in rows}
+        keys = sorted((-points, user_id) for user_id, (_, points) in users.items())
+        with self._lock:
+            self._keys, self._users = keys, users
+            self._loaded_at = time.monotonic()
+
+    def update(self, user_id: int, username: str, points: int) -> None:
+        """设置用户的最新积分（绝对值，而不是增量），新用户直接加入。"""
+        with self._lock:
+            old = self._users.get(user_id)
+            if old is not None:
+                index = bisect.bisect_left(self._keys, (-old[1], user_id))
+                if index < len(self._keys) and self._keys[index] == (-old[1], user_id):
+                    del self._keys[index]
+            bisect.insort(self._keys, (-points, user_id))
+            self._users[user_id] = (username, points)
+
+    def _standings(self, start: int, stop: int) -> List[Standing]:
+        return [
+            Standing(rank=index + 1, user_id=user_id, username=self._users[user_id][0], points=-neg_points)
+            for index, (neg_points, user_id) in enumerate(self._keys[start:stop], start=start)
+        ]
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Standing], Optional[str]]:
+        """
+        从游标之后取 limit 个用户，返回这一页和下一页的游标（没有下一页时为 None）。
+        游标记录的是上一页最后一个用户的 (积分, 用户ID)，翻页期间积分变化也不会重复或跳过太多用户。
+        """
+        with self._lock:
+            start = 0
+            if cursor:
+                points, user_id = decode_cursor(cursor)
+                start = bisect.bisect_right(self._keys, (-points, user_id))
+            standings = self._standings(start, start + limit)
+            has_more = start + limit < len(self._keys)
+        next_cursor = encode_cursor(standings[-1].points, standings[-1].user_id) if standings and has_more else None
+        return standings, next_cursor
+
+    def top(self, limit: int) -> List[Standing]:
+        # limit 不大于0时返回空列表，而不是被当作负数切片
+        return self.page(max(0, limit))[0]
+
+    def rank(self, user_id: int) -> Optional[Standing]:
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            index = bisect.bisect_left(self._keys, (-user[1], user_id))
+            return self._standings(index, index + 1)[0]
+
+    def around(self, user_id: int, radius: int) -> List[Standing]:
+        """用户自己以及排在其前后各 radius 名的用户。"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return []
+            index = bisect.bisect_left(self._keys, (-user[1], user_id))
+            return self._standings(max(0, index - radius), index + radius + 1)
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._keys)}
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,221 @@
+# 作用: LLM提供商的准入控制：每个提供商限制同时进行的请求数和请求速率，并在提供商不可用时通过熔断快速失败。
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+import openai
+
+from ..config import settings
+
+
+class ProviderUnavailableError(Exception):
+    """提供商已熔断、排队已满或等待超时，请求未发送给提供商。"""
+
+    def __init__(self, llm_provider: str, reason: str):
+        super().__init__(f"{llm_provider}: {reason}")
+        self.llm_provider = llm_provider
+        self.reason = reason
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """只有提供商自身的问题（连接失败、超时、限流、5xx）才计入熔断；请求参数错误等不算。"""
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, Exception)
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，最多允许 burst 个突发请求。"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """预订一个令牌，返回需要等待的秒数（令牌可以预支，按预订顺序依次放行）。"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens += 1
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后熔断（open），cooldown_seconds 内的请求直接拒绝；
+    冷却结束后进入半开（half_open）状态，只放行一个探测请求，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_count += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """请求既没成功也没失败（例如调用方取消），释放探测名额。"""
+        self._probing = False
+
+
+class ProviderGate:
+    """单个提供商的准入控制。"""
+
+    def __init__(self, llm_provider: str, max_in_flight: int, max_queued: int, queue_timeout_seconds: float,
+                 rate: float, burst: int, failure_threshold: int, cooldown_seconds: float):
+        self.llm_provider = llm_provider
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown_seconds)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.counters = {
+            "admitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "rejected_circuit_open": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "queue_wait_seconds": 0.0,
+        }
+
+    def _reject(self, reason: str) -> ProviderUnavailableError:
+        self.counters[f"rejected_{reason}"] += 1
+        return ProviderUnavailableError(self.llm_provider, reason)
+
+    async def _acquire(self) -> None:
+        wait = self.bucket.reserve()
+        if wait > self.queue_timeout_seconds:
+            self.bucket.refund()
+            raise self._reject("timeout")
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout_seconds - wait)
+        except asyncio.TimeoutError:
+            raise self._reject("timeout") from None
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[float]:
+        """
+        取得调用提供商的许可，返回排队等待的秒数；被拒绝时抛出 ProviderUnavailableError。
+        退出时根据是否抛出异常记录成功或失败。
+        """
+        if not self.breaker.allow():
+            raise self._reject("circuit_open")
+        if self.queued >= self.max_queued:
+            self.breaker.release()
+            raise self._reject("queue_full")
+
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await self._acquire()
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            self.queued -= 1
+        queue_wait = time.monotonic() - started
+        self.counters["admitted"] += 1
+        self.counters["queue_wait_seconds"] += queue_wait
+
+        self.in_flight += 1
+        try:
+            yield queue_wait
+        except BaseException as e:
+            if is_provider_failure(e):
+                self.counters["failed"] += 1
+                self.breaker.record_failure()
+            else:
+                # 调用方取消或提前关闭流，不代表提供商有问题
+                self.breaker.release()
+            raise
+        else:
+            self.counters["succeeded"] += 1
+            self.breaker.record_success()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "breaker_opened": self.breaker.opened_count,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            **self.counters,
+        }
+
+
+_gates: Dict[str, ProviderGate] = {}
+
+
+def _provider_limits(llm_provider: str) -> Dict[str, Any]:
+    limits = {
+        "deepseek": (settings.DEEPSEEK_MAX_IN_FLIGHT, settings.DEEPSEEK_RATE_LIMIT_PER_SECOND),
+        "qwen": (settings.QWEN_MAX_IN_FLIGHT, settings.QWEN_RATE_LIMIT_PER_SECOND),
+    }
+    max_in_flight, rate = limits.get(llm_provider, (settings.LLM_MAX_IN_FLIGHT, settings.LLM_RATE_LIMIT_PER_SECOND))
+    return {"max_in_flight": max_in_flight, "rate": rate}
+
+
+def get_gate(llm_provider: str) -> ProviderGate:
+    gate = _gates.get(llm_provider)
+    if gate is None:
+        gate = ProviderGate(
+            llm_provider,
+            max_queued=settings.LLM_MAX_QUEUED,
+            queue_timeout_seconds=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+            burst=settings.LLM_RATE_LIMIT_BURST,
+            failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+            cooldown_seconds=settings.LLM_BREAKER_COOLDOWN_SECONDS,
+            **_provider_limits(llm_provider),
+        )
+        _gates[llm_provider] = gate
+    return gate
+
+
+def stats() -> Dict[str, Any]:
+    return {llm_provider: gate.stats() for llm_provider, gate in _gates.items()}
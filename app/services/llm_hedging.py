@@ -0,0 +1,103 @@
+# 作用: 对冲请求：主提供商迟迟没有返回首个token时，再向另一个提供商发同样的请求，先返回的一方胜出，另一方被取消。
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from ..config import settings
+
+# 每个提供商保留最近多少次首个token的耗时，样本不足时使用默认延迟
+_SAMPLE_SIZE = 200
+_MIN_SAMPLES = 20
+
+_first_token_seconds: Dict[str, Deque[float]] = {}
+_stats = {
+    "requests": 0,
+    "hedges_fired": 0,
+    "hedges_won": 0,
+}
+
+
+def record_first_token(llm_provider: str, seconds: float) -> None:
+    samples = _first_token_seconds.setdefault(llm_provider, deque(maxlen=_SAMPLE_SIZE))
+    samples.append(seconds)
+
+
+def hedge_delay(llm_provider: str) -> float:
+    """主请求等待多久仍没有首个token就发出对冲请求：取最近首个token耗时的分位数，并限制在上下限之间。"""
+    samples = _first_token_seconds.get(llm_provider)
+    if not samples or len(samples) < _MIN_SAMPLES:
+        return settings.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(len(ordered) * settings.LLM_HEDGE_PERCENTILE / 100))
+    return min(settings.LLM_HEDGE_MAX_DELAY_SECONDS, max(settings.LLM_HEDGE_MIN_DELAY_SECONDS, ordered[index]))
+
+
+async def _race(tasks: Dict[str, "asyncio.Task[str]"], first_tokens: Dict[str, asyncio.Event],
+                timeout: Optional[float]) -> Optional[str]:
+    """
+    返回最先产出首个token（或直接成功完成）的提供商。
+    超时返回 None；给定 timeout 时所有请求都已失败也返回 None（以便立即发出对冲请求），否则抛出最后一个错误。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        for llm_provider, task in tasks.items():
+            if first_tokens[llm_provider].is_set():
+                return llm_provider
+            if task.done() and not task.cancelled() and task.exception() is None:
+                return llm_provider
+        alive = [task for task in tasks.values() if not task.done()]
+        if not alive:
+            if timeout is not None:
+                return None
+            raise list(tasks.values())[-1].exception()
+
+        waiters = [asyncio.ensure_future(first_tokens[llm_provider].wait()) for llm_provider in tasks]
+        try:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait(alive + waiters, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if not done:
+            return None
+
+
+async def hedged(primary: str, secondary: str,
+                 attempt: Callable[[str, asyncio.Event], Awaitable[str]]) -> str:
+    """
+    用 attempt(提供商, 首个token事件) 向 primary 发起请求；超过 hedge_delay(primary) 仍没有首个token时，
+    再向 secondary 发起同样的请求。先产出首个token的一方胜出，另一方立即取消。
+    """
+    _stats["requests"] += 1
+    first_tokens = {primary: asyncio.Event(), secondary: asyncio.Event()}
+    tasks = {primary: asyncio.create_task(attempt(primary, first_tokens[primary]))}
+    try:
+        winner = await _race(tasks, first_tokens, timeout=hedge_delay(primary))
+        if winner is None:
+            _stats["hedges_fired"] += 1
+            tasks[secondary] = asyncio.create_task(attempt(secondary, first_tokens[secondary]))
+            winner = await _race(tasks, first_tokens, timeout=None)
+            if winner == secondary:
+                _stats["hedges_won"] += 1
+        for llm_provider, task in tasks.items():
+            if llm_provider != winner:
+                task.cancel()
+        return await tasks[winner]
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # 失败的一方已被放弃，避免出现 "exception was never retrieved" 警告
+                task.exception()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "enabled": settings.LLM_HEDGING_ENABLED,
+        "delay_seconds": {llm_provider: hedge_delay(llm_provider) for llm_provider in _first_token_seconds},
+        "samples": {llm_provider: len(samples) for llm_provider, samples in _first_token_seconds.items()},
+    }
@@ -0,0 +1,155 @@
+# 作用: 记录每一次LLM调用的排队、首个分块、总耗时、输出量和错误类型，按提供商和调用用途汇总成直方图。
+
+import json
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger("app.llm_calls")
+
+# 耗时直方图的桶上界（毫秒），最后一个桶收集所有更慢的调用
+_LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1_000, 2_000, 5_000, 10_000, 20_000, 60_000, float("inf")]
+
+
+@dataclass
+class CallRecord:
+    llm_provider: str
+    model: str
+    purpose: str  # explanation / generation / syntax_analysis / result_analysis / improvement_analysis
+    queue_wait_seconds: float = 0.0
+    first_chunk_seconds: Optional[float] = None  # 从发起调用（含排队）到收到第一个分块
+    duration_seconds: float = 0.0
+    chunks: int = 0
+    output_chars: int = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    error: Optional[str] = None
+
+
+def error_class(exc: BaseException) -> str:
+    """把异常归类为简短的错误类型，例如 "ProviderUnavailableError:circuit_open"、"APIStatusError:429"。"""
+    if isinstance(exc, GeneratorExit):
+        return "closed"  # 调用方提前结束了流
+    name = type(exc).__name__
+    reason = getattr(exc, "reason", None) or getattr(exc, "status_code", None)
+    return f"{name}:{reason}" if reason else name
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        按桶估算分位数，返回所在桶的上界，但不超过观测到的最大值。
+        落在最后一个（无上界）桶时返回最大值，保证结果可以序列化为JSON。
+        """
+        if not self.count:
+            return None
+        target = self.count * pct / 100
+        seen = 0
+        for upper, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(upper, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": {("+Inf" if upper == float("inf") else str(upper)): count
+                        for upper, count in zip(self.buckets, self.counts)},
+        }
+
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors: Dict[str, int] = {}
+        self.chunks = 0
+        self.output_chars = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.generation_seconds = 0.0  # 第一个分块之后用于生成输出的时间
+        self.queue_wait_ms = Histogram(_LATENCY_BUCKETS_MS)
+        self.first_chunk_ms = Histogram(_LATENCY_BUCKETS_MS)
+        self.duration_ms = Histogram(_LATENCY_BUCKETS_MS)
+
+    def add(self, call: CallRecord) -> None:
+        self.calls += 1
+        if call.error:
+            self.errors[call.error] = self.errors.get(call.error, 0) + 1
+        self.chunks += call.chunks
+        self.output_chars += call.output_chars
+        self.prompt_tokens += call.prompt_tokens or 0
+        self.completion_tokens += call.completion_tokens or 0
+        self.queue_wait_ms.observe(call.queue_wait_seconds * 1000)
+        self.duration_ms.observe(call.duration_seconds * 1000)
+        if call.first_chunk_seconds is not None:
+            self.first_chunk_ms.observe(call.first_chunk_seconds * 1000)
+            self.generation_seconds += call.duration_seconds - call.first_chunk_seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "chunks": self.chunks,
+            "output_chars": self.output_chars,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            # 流式输出速度：有token用量时按token计算，否则按字符计算
+            "tokens_per_second": self.completion_tokens / self.generation_seconds if self.generation_seconds else None,
+            "chars_per_second": self.output_chars / self.generation_seconds if self.generation_seconds else None,
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "first_chunk_ms": self.first_chunk_ms.snapshot(),
+            "duration_ms": self.duration_ms.snapshot(),
+        }
+
+
+_stats: Dict[Tuple[str, str, str], _CallStats] = {}
+_lock = threading.Lock()
+
+
+def record(call: CallRecord) -> None:
+    with _lock:
+        key = (call.llm_provider, call.model, call.purpose)
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = _CallStats()
+        stats.add(call)
+    if settings.LLM_CALL_LOG_ENABLED:
+        logger.info(json.dumps(asdict(call), ensure_ascii=False))
+
+
+def snapshot() -> List[Dict[str, Any]]:
+    with _lock:
+        return [
+            {"llm_provider": llm_provider, "model": model, "purpose": purpose, **stats.snapshot()}
+            for (llm_provider, model, purpose), stats in sorted(_stats.items())
+        ]
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
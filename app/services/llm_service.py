@@ -1,69 +1,230 @@
 # 作用: 封装与大模型API的交互逻辑。
 
 import openai
-import dashscope
+import httpx
 import json
 import re # 导入正则表达式模块
-from typing import List, AsyncGenerator
+import asyncio
+import time
+from contextlib import aclosing
+from typing import Dict, List, AsyncGenerator, Optional
 from ..config import settings
+from . import llm_gateway, llm_hedging, llm_metrics, mock_llm
 # 【重要修复】导入了正确的模型名称 LLMGeneratedQuestionData
 from ..schemas import LLMGeneratedQuestionData
 
+# 调用失败时返回给用户的兜底提示
+LLM_ERROR_MESSAGE = "抱歉，调用大模型服务时出现问题，请稍后再试。"
+UNSUPPORTED_PROVIDER_MESSAGE = "错误：不支持的大模型提供商。"
+LLM_BUSY_MESSAGE = "抱歉，AI服务当前繁忙，请稍后再试。"
+_API_ERROR_PREFIX = "API Error: "
+
+
+def is_error_response(text: str) -> bool:
+    """判断一段LLM输出是否以错误提示结束（这样的结果不应被缓存）。"""
+    return (
+        not text
+        or text.endswith(LLM_ERROR_MESSAGE)
+        or text.endswith(UNSUPPORTED_PROVIDER_MESSAGE)
+        or text.endswith(LLM_BUSY_MESSAGE)
+        or _API_ERROR_PREFIX in text
+    )
+
+
+# --- LLM客户端 ---
+# 各提供商的客户端在应用启动时创建一次，所有请求共享同一个连接池（复用TCP/TLS连接）
+_clients: Dict[str, openai.AsyncOpenAI] = {}
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.LLM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+# 各提供商使用的模型；通义千问通过 DashScope 的 OpenAI 兼容接口调用，与 DeepSeek 共用同一套异步客户端
+_MODELS = {
+    "deepseek": "deepseek-chat",
+    "qwen": "qwen-max",
+}
+# 压测用的模拟提供商，不访问网络，只有显式开启时才可用
+if settings.MOCK_LLM_ENABLED:
+    _MODELS["mock"] = "mock"
+# 开启自动切换时，非流式调用在一个提供商不可用时改用另一个
+_FAILOVER = {
+    "deepseek": "qwen",
+    "qwen": "deepseek",
+}
+
+
+def init_llm_clients() -> None:
+    """创建各提供商的长连接客户端，在应用启动时调用。"""
+    credentials = {
+        "deepseek": (settings.DEEPSEEK_API_KEY, settings.DEEPSEEK_API_BASE),
+        "qwen": (settings.QWEN_API_KEY, settings.QWEN_API_BASE),
+    }
+    for llm_provider, (api_key, base_url) in credentials.items():
+        if llm_provider not in _clients:
+            _clients[llm_provider] = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_create_http_client(),
+            )
+
+
+async def close_llm_clients() -> None:
+    """关闭所有客户端及其连接池，在应用关闭时调用。"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+def _get_client(llm_provider: str) -> openai.AsyncOpenAI:
+    # 在未经过应用启动流程的场景（例如命令行工具）中按需创建
+    if llm_provider not in _clients:
+        init_llm_clients()
+    return _clients[llm_provider]
+
+
 # --- 底层LLM调用函数 ---
-async def _call_llm_stream(llm_provider: str, system_prompt: str, user_prompt: str) -> AsyncGenerator[str, None]:
-    """一个统一的LLM流式调用函数。"""
+async def _stream_from_provider(llm_provider: str, system_prompt: str, user_prompt: str,
+                                purpose: str) -> AsyncGenerator[str, None]:
+    """
+    经过准入控制后向提供商发起流式请求，出错时直接抛出异常。
+    全程使用异步HTTP客户端，不会阻塞事件循环；调用方提前关闭生成器时，上游连接随之关闭。
+    每次调用的排队、首个分块、总耗时、输出量和错误类型都记录到 llm_metrics。
+    """
+    call = llm_metrics.CallRecord(llm_provider=llm_provider, model=_MODELS[llm_provider], purpose=purpose)
+    started = time.monotonic()
     try:
-        if llm_provider == "deepseek":
-            client = openai.AsyncOpenAI(
-                api_key=settings.DEEPSEEK_API_KEY,
-                base_url=settings.DEEPSEEK_API_BASE,
-            )
-            stream = await client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
-            async for chunk in stream:
-                content = chunk.choices[0].delta.content or ""
-                yield content
-        elif llm_provider == "qwen":
-            dashscope.api_key = settings.QWEN_API_KEY
-            responses = dashscope.Generation.call(
-                model='qwen-max',
-                prompt=user_prompt,
-                system_prompt=system_prompt,
-                stream=True,
-                incremental_output=True
-            )
-            for response in responses:
-                if response.status_code == 200:
-                    if response.output and response.output.text:
-                        yield response.output.text
-                else:
-                    yield f"API Error: {response.code}, {response.message}"
-                    break
-        else:
-            yield "错误：不支持的大模型提供商。"
+        async with llm_gateway.get_gate(llm_provider).admit() as queue_wait:
+            call.queue_wait_seconds = queue_wait
+            if llm_provider == "mock":
+                contents = mock_llm.stream(purpose, user_prompt)
+            else:
+                contents = _openai_stream(call, system_prompt, user_prompt)
+            async with aclosing(contents):
+                async for content in contents:
+                    if call.first_chunk_seconds is None:
+                        call.first_chunk_seconds = time.monotonic() - started
+                    call.chunks += 1
+                    call.output_chars += len(content)
+                    yield content
+    except BaseException as e:
+        call.error = llm_metrics.error_class(e)
+        raise
+    finally:
+        call.duration_seconds = time.monotonic() - started
+        llm_metrics.record(call)
+
+
+async def _openai_stream(call: llm_metrics.CallRecord, system_prompt: str,
+                         user_prompt: str) -> AsyncGenerator[str, None]:
+    """通过 OpenAI 兼容接口流式调用，并把token用量记到 call 上。"""
+    client = _get_client(call.llm_provider)
+    stream = await client.chat.completions.create(
+        model=call.model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        stream=True,
+        # 最后一个分块附带本次调用的token用量
+        stream_options={"include_usage": True}
+    )
+    async with stream:
+        async for chunk in stream:
+            if chunk.usage:
+                call.prompt_tokens = chunk.usage.prompt_tokens
+                call.completion_tokens = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def _error_message(e: Exception) -> str:
+    if isinstance(e, llm_gateway.ProviderUnavailableError):
+        return LLM_BUSY_MESSAGE
+    if isinstance(e, openai.APIStatusError):
+        return f"{_API_ERROR_PREFIX}{e.status_code}, {e.message}"
+    return LLM_ERROR_MESSAGE
+
+
+async def _call_llm_stream(llm_provider: str, system_prompt: str, user_prompt: str,
+                           purpose: str) -> AsyncGenerator[str, None]:
+    """一个统一的LLM流式调用函数，出错时以一条提示结束，不抛出异常。"""
+    if llm_provider not in _MODELS:
+        yield UNSUPPORTED_PROVIDER_MESSAGE
+        return
+    try:
+        async with aclosing(_stream_from_provider(llm_provider, system_prompt, user_prompt, purpose)) as chunks:
+            async for chunk in chunks:
+                yield chunk
     except Exception as e:
         print(f"调用LLM流式API时发生错误: {e}")
-        yield "抱歉，调用大模型服务时出现问题，请稍后再试。"
+        yield _error_message(e)
+
+async def _collect(llm_provider: str, system_prompt: str, user_prompt: str, purpose: str,
+                   first_token: Optional[asyncio.Event] = None) -> str:
+    """拼接完整响应，并记录首个token的耗时（用于计算对冲延迟）。"""
+    started = time.monotonic()
+    chunks = []
+    async for chunk in _stream_from_provider(llm_provider, system_prompt, user_prompt, purpose):
+        if not chunks:
+            llm_hedging.record_first_token(llm_provider, time.monotonic() - started)
+            if first_token is not None:
+                first_token.set()
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+async def _call_llm(llm_provider: str, system_prompt: str, user_prompt: str, purpose: str) -> str:
+    """
+    一个统一的LLM非流式调用函数，它内部使用流式调用来构建完整响应。
+    开启 LLM_HEDGING_ENABLED 时，主提供商迟迟没有返回首个token会向另一个提供商发出对冲请求；
+    开启 LLM_FAILOVER_ENABLED 时，提供商不可用会自动改用另一个提供商重试一次。
+    """
+    if llm_provider not in _MODELS:
+        return UNSUPPORTED_PROVIDER_MESSAGE
+    if settings.LLM_HEDGING_ENABLED and llm_provider in _FAILOVER:
+        try:
+            return await llm_hedging.hedged(
+                llm_provider,
+                _FAILOVER[llm_provider],
+                lambda provider, first_token: _collect(provider, system_prompt, user_prompt, purpose, first_token)
+            )
+        except Exception as e:
+            print(f"调用LLM API ({llm_provider}, 对冲) 时发生错误: {e}")
+            return _error_message(e)
+
+    llm_providers = [llm_provider]
+    if settings.LLM_FAILOVER_ENABLED and llm_provider in _FAILOVER:
+        llm_providers.append(_FAILOVER[llm_provider])
 
-async def _call_llm(llm_provider: str, system_prompt: str, user_prompt: str) -> str:
-    """一个统一的LLM非流式调用函数，它内部使用流式调用来构建完整响应。"""
-    full_content = []
-    async for chunk in _call_llm_stream(llm_provider, system_prompt, user_prompt):
-        full_content.append(chunk)
-    return "".join(full_content)
+    error = None
+    for provider in llm_providers:
+        try:
+            return await _collect(provider, system_prompt, user_prompt, purpose)
+        except Exception as e:
+            print(f"调用LLM API ({provider}) 时发生错误: {e}")
+            error = e
+            # 请求本身有问题时换一个提供商也没有用
+            if not isinstance(e, llm_gateway.ProviderUnavailableError) and not llm_gateway.is_provider_failure(e):
+                break
+    return _error_message(error)
 
 
 async def get_llm_explanation(topic: str, llm_provider: str) -> AsyncGenerator[str, None]:
     """以流式方式获取关于SQL知识点的解释。"""
     system_prompt = "你是一个友好的SQL知识讲解专家。"
     user_prompt = f"请用简体中文，为一位SQL初学者详细解释一下'{topic}'这个知识点。请确保解释清晰易懂，并包含一个简单的代码示例。请使用Markdown格式进行排版。"
-    async for chunk in _call_llm_stream(llm_provider, system_prompt, user_prompt):
+    async for chunk in _call_llm_stream(llm_provider, system_prompt, user_prompt, purpose="explanation"):
         yield chunk
 
 
@@ -88,7 +249,7 @@ async def generate_question_from_llm(topics: List[str], llm_provider: str) -> LL
   "correct_sql": "SELECT ... FROM ...;"
 }}
 """
-    response_text = await _call_llm(llm_provider, system_prompt, user_prompt)
+    response_text = await _call_llm(llm_provider, system_prompt, user_prompt, purpose="generation")
 
     try:
         # 【重要修复】清洗LLM返回的文本，移除Markdown代码块标记
@@ -126,7 +287,7 @@ async def analyze_syntax_error(user_sql: str, db_error: str, llm_provider: str)
 
 请用友好、鼓励的语气，清晰地向这位初学者解释他/她的代码为什么会产生这个语法错误，并给出正确的代码示例。不要谈论其他无关话题。
 """
-    return await _call_llm(llm_provider, system_prompt, user_prompt)
+    return await _call_llm(llm_provider, system_prompt, user_prompt, purpose="syntax_analysis")
 
 async def analyze_result_error(question: str, user_sql: str, correct_sql: str, llm_provider: str) -> str:
     """调用LLM分析用户的SQL逻辑错误。"""
@@ -147,7 +308,7 @@ async def analyze_result_error(question: str, user_sql: str, correct_sql: str, l
 
 用户的SQL语句语法正确，但查询结果与正确答案不符。请仔细比对用户和正确答案的SQL，分析用户代码中可能存在的逻辑错误（例如：JOIN条件错误、聚合函数使用不当、WHERE子句过滤条件错误等）。请用清晰、有条理的方式向用户解释，并引导他/她思考如何修正。
 """
-    return await _call_llm(llm_provider, system_prompt, user_prompt)
+    return await _call_llm(llm_provider, system_prompt, user_prompt, purpose="result_analysis")
 
 async def analyze_for_improvement(question: str, user_sql: str, correct_sql: str, llm_provider: str) -> str:
     """
@@ -175,4 +336,4 @@ async def analyze_for_improvement(question: str, user_sql: str, correct_sql: str
 
 如果用户的写法已经非常优秀，请直接夸奖他们。你的回答将直接展示给用户。
 """
-    return await _call_llm(llm_provider, system_prompt, user_prompt)
+    return await _call_llm(llm_provider, system_prompt, user_prompt, purpose="improvement_analysis")
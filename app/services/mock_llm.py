@@ -0,0 +1,94 @@
+# 作用: 离线的模拟LLM提供商，用于压测。按配置的首个token延迟、分块间隔、错误率和卡顿概率流式输出确定的内容。
+
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+from typing import AsyncGenerator, Dict, List, Optional
+
+import httpx
+
+from ..config import settings
+
+
+class MockProviderError(Exception):
+    """模拟的上游错误，与真实提供商的错误一样计入熔断。"""
+
+
+_recorded: Optional[Dict[str, List[str]]] = None
+_rng = random.Random(settings.MOCK_LLM_SEED)
+# 生成题目时每次调用都换一个种子，批量生成才不会得到重复的题目
+_generation_calls = itertools.count()
+
+
+def _recorded_responses() -> Dict[str, List[str]]:
+    # 录制的响应文件格式: {"explanation": ["...", ...], "syntax_analysis": [...], ...}
+    global _recorded
+    if _recorded is None:
+        _recorded = {}
+        if settings.MOCK_LLM_RESPONSES_FILE:
+            with open(settings.MOCK_LLM_RESPONSES_FILE, encoding="utf-8") as f:
+                _recorded = json.load(f)
+    return _recorded
+
+
+def _generated_question(seed: int) -> str:
+    # 每个种子对应一道不同但都能通过沙箱校验的题目
+    table = f"orders_{seed % 1000}"
+    rows = ",\n".join(
+        f"({i}, 'customer_{(seed + i) % 7}', {(seed * 31 + i * 17) % 500 + 10})" for i in range(1, 9)
+    )
+    return json.dumps({
+        "question": f"统计表 {table} 中每位顾客的订单数量和订单总金额，按总金额从高到低排列。",
+        "setup_sql": f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, customer TEXT, amount INTEGER);\n"
+                     f"INSERT INTO {table} (id, customer, amount) VALUES\n{rows};",
+        "correct_sql": f"SELECT customer, COUNT(*) AS order_count, SUM(amount) AS total_amount "
+                       f"FROM {table} GROUP BY customer ORDER BY total_amount DESC, customer;",
+    }, ensure_ascii=False)
+
+
+def _response(purpose: str, user_prompt: str, seed: int) -> str:
+    recorded = _recorded_responses().get(purpose)
+    if recorded:
+        return recorded[seed % len(recorded)]
+    if purpose == "generation":
+        return _generated_question(seed)
+    paragraph = f"这是模拟的{purpose}输出（#{seed % 10000}）。" + "SQL 查询会先确定数据来源，再过滤、分组、排序。" * 4
+    return "\n\n".join(f"### 第 {i + 1} 部分\n{paragraph}" for i in range(settings.MOCK_LLM_PARAGRAPHS))
+
+
+def _split(text: str, chunk_chars: int) -> List[str]:
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+def _jittered(seconds: float, rng: random.Random) -> float:
+    jitter = settings.MOCK_LLM_JITTER
+    return max(0.0, seconds * (1 + rng.uniform(-jitter, jitter)))
+
+
+async def stream(purpose: str, user_prompt: str) -> AsyncGenerator[str, None]:
+    """
+    按配置的延迟流式输出模拟响应。相同的提示词总是得到相同的内容；
+    延迟、错误和卡顿是随机的，设置 MOCK_LLM_SEED 后整个进程的随机序列可以复现。
+    """
+    seed = int.from_bytes(hashlib.sha256(user_prompt.encode("utf-8")).digest()[:8], "little")
+    if purpose == "generation":
+        seed += next(_generation_calls)
+    await asyncio.sleep(_jittered(settings.MOCK_LLM_FIRST_TOKEN_SECONDS, _rng))
+    if _rng.random() < settings.MOCK_LLM_ERROR_RATE:
+        raise MockProviderError("模拟的上游错误")
+
+    chunks = _split(_response(purpose, user_prompt, seed), settings.MOCK_LLM_CHUNK_CHARS)
+    stall_at = _rng.randrange(len(chunks)) if _rng.random() < settings.MOCK_LLM_STALL_PROBABILITY else None
+    for index, chunk in enumerate(chunks):
+        if index == stall_at:
+            # 与真实客户端一样，两次数据之间的等待超过读取超时就报错
+            if settings.MOCK_LLM_STALL_SECONDS >= settings.LLM_TIMEOUT_SECONDS:
+                await asyncio.sleep(settings.LLM_TIMEOUT_SECONDS)
+                raise httpx.ReadTimeout("模拟的上游卡顿超时")
+            await asyncio.sleep(settings.MOCK_LLM_STALL_SECONDS)
+        elif index:
+            await asyncio.sleep(_jittered(settings.MOCK_LLM_INTER_CHUNK_SECONDS, _rng))
+        yield chunk
+
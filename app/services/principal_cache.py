@@ -0,0 +1,39 @@
+# 作用: 缓存已登录用户的身份信息（ID、用户名、是否管理员），认证时不必每个请求都查询用户表。
+
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional
+
+from ..config import settings
+from .cache import LRUCache
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    is_admin: bool
+
+
+_principals = LRUCache(max_entries=settings.AUTH_CACHE_SIZE, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS)
+
+
+def _key(subject: str, token_version: Any) -> Hashable:
+    # 令牌版本用令牌的过期时间：同一用户重新登录得到的新令牌是独立的条目
+    return subject, token_version
+
+
+def get(subject: str, token_version: Any) -> Optional[Principal]:
+    return _principals.get(_key(subject, token_version))
+
+
+def put(subject: str, token_version: Any, principal: Principal) -> None:
+    _principals.set(_key(subject, token_version), principal)
+
+
+def invalidate_user(username: str) -> None:
+    """用户的权限或密码被修改后调用，丢弃该用户所有令牌的缓存。"""
+    _principals.invalidate_where(lambda key: key[0] == username)
+
+
+def stats() -> Dict[str, Any]:
+    return _principals.stats()
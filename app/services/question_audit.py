@@ -0,0 +1,158 @@
+# 作用: 并行回归检查题库中的题目，找出无法加载、无法执行或执行过慢的题目。
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from . import sql_executor
+from .sandbox_pool import SandboxBusyError, sandbox_pool
+
+# 内存中最多保留的后台审计数量，超出后丢弃最早已结束的审计
+_MAX_AUDITS = 20
+
+
+def _profile(question: Dict) -> Dict:
+    return sql_executor.profile_question(
+        question_id=question["id"],
+        setup_sql=question["setup_sql"],
+        correct_sql=question["correct_sql"],
+        max_vm_steps=question["max_vm_steps"],
+        time_limit_seconds=question["time_limit_seconds"],
+    )
+
+
+def run_question_audit(questions: List[Dict], max_workers: Optional[int] = None, top_n: int = 10,
+                       max_vm_steps: Optional[int] = sql_executor.DEFAULT_MAX_VM_STEPS,
+                       time_limit_seconds: Optional[float] = sql_executor.DEFAULT_TIME_LIMIT_SECONDS) -> Dict:
+    """
+    在多进程中逐题执行 setup_sql 和 correct_sql，返回汇总报告。
+    questions 中每一项需包含 id、setup_sql、correct_sql，可选 correct_result_hash（用于发现过期指纹）。
+    默认占用全部CPU核，只用于命令行；服务进程中请使用 start_audit。
+    """
+    started = time.perf_counter()
+    max_workers = max_workers or os.cpu_count() or 1
+    tasks = [
+        {
+            "id": q["id"],
+            "setup_sql": q["setup_sql"],
+            "correct_sql": q["correct_sql"],
+            "max_vm_steps": max_vm_steps,
+            "time_limit_seconds": time_limit_seconds,
+        }
+        for q in questions
+    ]
+
+    if len(tasks) <= 1 or max_workers == 1:
+        results = [_profile(task) for task in tasks]
+    else:
+        # 每个进程一次领取一批题目，减少进程间通信的开销
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_profile, tasks, chunksize=chunksize))
+    return _summarize(questions, results, top_n, max_workers, started)
+
+
+def _summarize(questions: List[Dict], results: List[Dict], top_n: int, workers: int, started: float) -> Dict:
+    stored_hashes = {q["id"]: q.get("correct_result_hash") for q in questions}
+    stale_ids = [
+        r["question_id"] for r in results
+        if r["status"] == "ok"
+        and sql_executor.is_current_fingerprint(stored_hashes[r["question_id"]])
+        and stored_hashes[r["question_id"]] != r["result_hash"]
+    ]
+    broken = [r for r in results if r["status"] != "ok"]
+
+    def _total_ms(r: Dict) -> float:
+        return (r["setup_ms"] or 0) + (r["query_ms"] or 0)
+
+    return {
+        "total": len(results),
+        "ok": len(results) - len(broken),
+        "broken": broken,
+        # 已保存的正确答案指纹与当前执行结果不一致，需要重新计算
+        "stale_fingerprint_ids": stale_ids,
+        "slowest": sorted(results, key=_total_ms, reverse=True)[:top_n],
+        "largest_results": sorted(
+            (r for r in results if r["row_count"] is not None), key=lambda r: r["row_count"], reverse=True
+        )[:top_n],
+        "workers": workers,
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+@dataclass
+class AuditJob:
+    id: str
+    total: int
+    done: int = 0
+    status: str = "running"  # running / completed / failed
+    report: Optional[Dict] = None
+    error: Optional[str] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+_audits: "OrderedDict[str, AuditJob]" = OrderedDict()
+
+
+async def _profile_in_sandbox(question: Dict) -> Dict:
+    while True:
+        try:
+            return await sandbox_pool.profile(
+                question_id=question["id"],
+                setup_sql=question["setup_sql"],
+                correct_sql=question["correct_sql"]
+            )
+        except SandboxBusyError:
+            # 评测队列已满时让用户的评测优先，稍后再试
+            await asyncio.sleep(1)
+
+
+async def _run_in_sandbox(job: AuditJob, questions: List[Dict], top_n: int, concurrency: int) -> None:
+    started = time.perf_counter()
+    results: List[Optional[Dict]] = [None] * len(questions)
+    pending = iter(enumerate(questions))
+
+    async def worker() -> None:
+        for index, question in pending:
+            results[index] = await _profile_in_sandbox(question)
+            job.done += 1
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        job.report = _summarize(questions, results, top_n, concurrency, started)
+        job.status = "completed"
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+
+
+def start_audit(questions: List[Dict], concurrency: int, top_n: int = 10) -> AuditJob:
+    """
+    在后台通过评测进程池逐题检查，立即返回审计任务。
+    同时最多占用 concurrency 个评测进程，其余进程继续处理用户的评测。
+    """
+    job = AuditJob(id=uuid.uuid4().hex, total=len(questions))
+    job.task = asyncio.create_task(_run_in_sandbox(job, questions, top_n, max(1, concurrency)))
+    _audits[job.id] = job
+    for audit_id in [k for k, v in _audits.items() if v.status != "running"][:max(0, len(_audits) - _MAX_AUDITS)]:
+        del _audits[audit_id]
+    return job
+
+
+def get_audit(audit_id: str) -> Optional[AuditJob]:
+    return _audits.get(audit_id)
+
+
+def audit_view(job: AuditJob) -> Dict[str, Any]:
+    return {
+        "audit_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "done": job.done,
+        "report": job.report,
+        "error": job.error,
+    }
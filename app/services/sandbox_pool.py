@@ -0,0 +1,226 @@
+# 作用: 在独立的工作进程池中执行SQL评测，避免阻塞事件循环。
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..config import settings
+from . import sql_executor
+
+
+class SandboxBusyError(Exception):
+    """等待评测的请求已达到队列上限。"""
+
+
+class SandboxPool:
+    """
+    SQL评测进程池。
+    同时执行的评测数量受 max_workers 限制，排队数量受 max_queue 限制。
+    查询的指令数和时间预算由 sql_executor 在工作进程内执行；如果工作进程仍然卡死，
+    超过 hard_timeout_seconds 后整个进程池会被强制重建，同时被中断的其他评测会重试一次。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, max_vm_steps: int,
+                 time_limit_seconds: float, memory_limit_mb: int, snapshot_cache_size: int,
+                 max_user_rows: int, preview_rows: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_vm_steps = max_vm_steps
+        self.time_limit_seconds = time_limit_seconds
+        self.max_user_rows = max_user_rows
+        self.preview_rows = preview_rows
+        self.memory_limit_mb = memory_limit_mb
+        self.snapshot_cache_size = snapshot_cache_size
+        # 正确答案和用户SQL各有一份时间预算，再留出进程调度的余量
+        self.hard_timeout_seconds = time_limit_seconds * 2 + 5
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._pending = 0
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "resource_limits": 0,
+            "pool_restarts": 0,
+            "retries": 0,  # 进程池被重建后重新执行的评测数量
+            "snapshot_hits": 0,
+            "snapshot_misses": 0,
+            "fingerprints": 0,  # 评测时懒加载计算的正确答案指纹数量
+            "total_queue_wait_ms": 0.0,
+            "total_exec_ms": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=sql_executor.init_worker,
+                initargs=(self.memory_limit_mb * 1024 * 1024, self.snapshot_cache_size),
+            )
+        return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        """强制结束所有工作进程并丢弃进程池，下一次评测时会重新创建。"""
+        if executor is not self._executor:
+            # 其他请求已经重建过进程池
+            return
+        self._executor = None
+        self._stats["pool_restarts"] += 1
+        # ProcessPoolExecutor 没有公开终止单个任务的接口，只能直接结束其工作进程
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        # 仍在等待的任务会以 BrokenProcessPool 结束，由各自的调用方处理
+        executor.shutdown(wait=False)
+
+    async def _submit(self, func: Callable[..., Any], kwargs: Dict[str, Any]) -> Tuple[Any, Optional[str], float, float]:
+        """
+        排队并在进程池中执行 func，返回 (返回值, 失败状态, 排队毫秒数, 执行毫秒数)。
+        工作进程超时或异常退出时返回值为 None，失败状态为 "timeout" 或 "resource_limit"；
+        因进程池被重建而中断的任务会在新的进程池中重试一次。
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            self._stats["rejected"] += 1
+            raise SandboxBusyError("当前评测请求过多，请稍后再试。")
+
+        self._pending += 1
+        enqueued_at = time.perf_counter()
+        value, failure = None, None
+        try:
+            async with self._semaphore:
+                started_at = time.perf_counter()
+                loop = asyncio.get_running_loop()
+                call = functools.partial(func, **kwargs)
+                for attempt in range(2):
+                    executor = self._get_executor()
+                    try:
+                        value = await asyncio.wait_for(
+                            loop.run_in_executor(executor, call),
+                            timeout=self.hard_timeout_seconds
+                        )
+                        failure = None
+                    except asyncio.TimeoutError:
+                        self._restart(executor)
+                        failure = "timeout"
+                    except BrokenProcessPool:
+                        # 工作进程被系统杀死（例如内存耗尽），或者进程池因其他评测超时被重建，
+                        # 同一时间在执行的评测都会失败；在新的进程池中重试一次，不让它们被误判
+                        self._restart(executor)
+                        failure = "resource_limit"
+                        if attempt == 0:
+                            self._stats["retries"] += 1
+                            continue
+                    break
+                finished_at = time.perf_counter()
+        finally:
+            self._pending -= 1
+        return value, failure, (started_at - enqueued_at) * 1000, (finished_at - started_at) * 1000
+
+    async def run(self, func: Callable[..., sql_executor.EvaluationResult],
+                  **kwargs: Any) -> sql_executor.EvaluationResult:
+        """在进程池中执行一个评测函数，返回的结果附带排队时间和执行时间（毫秒）。"""
+        result, failure, queue_wait_ms, exec_ms = await self._submit(func, kwargs)
+        if failure == "timeout":
+            result = sql_executor.EvaluationResult(status="timeout", error="评测执行超时")
+        elif failure == "resource_limit":
+            result = sql_executor.EvaluationResult(status="resource_limit", error="评测进程异常退出")
+        result.queue_wait_ms = queue_wait_ms
+        result.exec_ms = exec_ms
+        self._record(result)
+        return result
+
+    async def fingerprint(self, setup_sql: str, sql: str, question_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        异步版本的 sql_executor.compute_result_fingerprint，使用配置中的查询预算。
+        工作进程超时或异常退出时返回 status 为 "timeout" / "resource_limit" 的结果。
+        """
+        self._stats["fingerprints"] += 1
+        fingerprint, failure, _, _ = await self._submit(sql_executor.compute_result_fingerprint, dict(
+            setup_sql=setup_sql,
+            sql=sql,
+            question_id=question_id,
+            max_vm_steps=self.max_vm_steps,
+            time_limit_seconds=self.time_limit_seconds,
+        ))
+        if failure is not None:
+            return {"status": failure, "error": "计算正确答案指纹时评测进程超时或异常退出"}
+        return fingerprint
+
+    async def profile(self, question_id: int, setup_sql: str, correct_sql: str) -> Dict[str, Any]:
+        """
+        异步版本的 sql_executor.profile_question，使用配置中的查询预算，供题库审计在服务进程中使用。
+        工作进程超时或异常退出时返回 status 为 "timeout" / "resource_limit" 的报告。
+        """
+        report, failure, _, _ = await self._submit(sql_executor.profile_question, dict(
+            question_id=question_id,
+            setup_sql=setup_sql,
+            correct_sql=correct_sql,
+            max_vm_steps=self.max_vm_steps,
+            time_limit_seconds=self.time_limit_seconds,
+        ))
+        if failure is not None:
+            return {
+                "question_id": question_id,
+                "status": failure,
+                "error": "检查题目时评测进程超时或异常退出",
+                "setup_ms": None,
+                "query_ms": None,
+                "row_count": None,
+                "column_count": None,
+                "result_hash": None,
+            }
+        return report
+
+    def _record(self, result: sql_executor.EvaluationResult) -> None:
+        self._stats["completed"] += 1
+        self._stats["total_queue_wait_ms"] += result.queue_wait_ms
+        self._stats["total_exec_ms"] += result.exec_ms
+        if result.status == "timeout":
+            self._stats["timeouts"] += 1
+        elif result.status == "resource_limit":
+            self._stats["resource_limits"] += 1
+        if result.snapshot_hit is not None:
+            self._stats["snapshot_hits" if result.snapshot_hit else "snapshot_misses"] += 1
+
+    async def evaluate(self, with_preview: bool = False, **kwargs: Any) -> sql_executor.EvaluationResult:
+        """
+        异步版本的 sql_executor.evaluate_sql_in_isolation，使用配置中的查询预算。
+        with_preview 为 True 时，结果中附带用户结果的前 preview_rows 行。
+        """
+        kwargs.setdefault("max_vm_steps", self.max_vm_steps)
+        kwargs.setdefault("time_limit_seconds", self.time_limit_seconds)
+        kwargs.setdefault("max_user_rows", self.max_user_rows)
+        if with_preview:
+            kwargs.setdefault("preview_limit", self.preview_rows)
+        return await self.run(sql_executor.evaluate_sql_in_isolation, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self._stats["completed"]
+        return {
+            **self._stats,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "avg_queue_wait_ms": self._stats["total_queue_wait_ms"] / completed if completed else 0.0,
+            "avg_exec_ms": self._stats["total_exec_ms"] / completed if completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+sandbox_pool = SandboxPool(
+    max_workers=settings.SANDBOX_MAX_WORKERS,
+    max_queue=settings.SANDBOX_MAX_QUEUE,
+    max_vm_steps=settings.SANDBOX_MAX_VM_STEPS,
+    time_limit_seconds=settings.SANDBOX_TIME_LIMIT_SECONDS,
+    memory_limit_mb=settings.SANDBOX_MEMORY_LIMIT_MB,
+    snapshot_cache_size=settings.SANDBOX_SNAPSHOT_CACHE_SIZE,
+    max_user_rows=settings.SANDBOX_MAX_USER_ROWS,
+    preview_rows=settings.SANDBOX_PREVIEW_ROWS,
+)
@@ -2,83 +2,443 @@
 
 import sqlite3
 import hashlib
-import json
-from typing import List, Any, Tuple, Dict
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, Any, Tuple, Dict, List, Optional
 
+# 快照缓存最多保留的题目数据库镜像数量
+SNAPSHOT_CACHE_SIZE = 64
 
-def _hash_result(result: List[Dict]) -> str:
+# 单条查询的默认资源预算：SQLite虚拟机指令数与墙钟时间
+DEFAULT_MAX_VM_STEPS = 50_000_000
+DEFAULT_TIME_LIMIT_SECONDS = 5.0
+# 用户查询最多读取的行数，超出视为资源超限
+DEFAULT_MAX_USER_ROWS = 100_000
+# 每执行这么多条虚拟机指令检查一次预算
+_PROGRESS_INTERVAL = 1000
+
+# 结果指纹的版本前缀，算法变化后旧指纹会被识别为过期并重新计算
+FINGERPRINT_VERSION_PREFIX = "v2:"
+# 流式计算指纹时每批从游标读取的行数
+_FETCH_BATCH_SIZE = 500
+_ROW_DIGEST_MODULUS = 1 << 256
+
+# 部分Python/SQLite构建不支持 serialize/deserialize，此时退回到每次重放 setup_sql
+_SNAPSHOT_SUPPORTED = hasattr(sqlite3.Connection, "serialize") and hasattr(sqlite3.Connection, "deserialize")
+
+
+def _setup_sql_digest(setup_sql: str) -> str:
+    return hashlib.sha256(setup_sql.encode('utf-8')).hexdigest()
+
+
+class _SnapshotCache:
     """
-    健壮的哈希算法，忽略行、列顺序和列别名。
+    题目数据库快照的LRU缓存。
+    键为 (题目ID, setup_sql哈希)，值为执行完 setup_sql 后序列化得到的数据库镜像。
+    每个评测工作进程各有一份缓存，Web进程无法直接清理它们；因此题目的 setup_sql 修改后，
+    各进程第一次遇到新的哈希时会顺带丢弃这道题目的旧快照，旧镜像不会再被使用，也不会占着位置等LRU淘汰。
     """
-    if not result:
-        return hashlib.sha256(b"[]").hexdigest()
 
-    standardized_rows = []
-    for row in result:
-        sorted_values = sorted([str(v) for v in row.values()])
-        standardized_rows.append(tuple(sorted_values))
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._images: "OrderedDict[Tuple[Optional[int], str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    standardized_rows.sort()
-    final_string_to_hash = json.dumps(standardized_rows)
-    return hashlib.sha256(final_string_to_hash.encode('utf-8')).hexdigest()
+    def get_image(self, question_id: Optional[int], setup_sql: str) -> Tuple[bytes, bool]:
+        """返回题目的数据库镜像及是否命中缓存，未命中时执行 setup_sql 构建并放入缓存。"""
+        key = (question_id, _setup_sql_digest(setup_sql))
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image, True
+            self.misses += 1
 
+        # 构建过程可能较慢，放在锁外执行；setup_sql 出错时异常直接抛给调用方
+        image = _build_image(setup_sql)
 
-def evaluate_sql_in_isolation(setup_sql: str, correct_sql: str, user_sql: str) -> Dict:
+        with self._lock:
+            if question_id is not None:
+                # 同一道题目只保留当前 setup_sql 的快照
+                for stale in [k for k in self._images if k[0] == question_id and k != key]:
+                    del self._images[stale]
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image, False
+
+    def invalidate(self, question_id: int) -> None:
+        """移除某道题目的所有快照。"""
+        with self._lock:
+            for key in [k for k in self._images if k[0] == question_id]:
+                del self._images[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._images),
+                "max_entries": self.max_entries,
+                "bytes": sum(len(image) for image in self._images.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def _build_image(setup_sql: str) -> bytes:
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript(setup_sql)
+        conn.commit()
+        return conn.serialize()
+    finally:
+        conn.close()
+
+
+_snapshot_cache = _SnapshotCache(SNAPSHOT_CACHE_SIZE)
+
+
+def invalidate_question_snapshot(question_id: int) -> None:
+    """丢弃当前进程中该题目已缓存的快照（不影响评测工作进程），用于基准测试测量冷启动。"""
+    _snapshot_cache.invalidate(question_id)
+
+
+def get_snapshot_cache_stats() -> Dict[str, Any]:
+    """返回快照缓存的命中/未命中等统计信息。"""
+    return _snapshot_cache.stats()
+
+
+def init_worker(memory_limit_bytes: Optional[int] = None, snapshot_cache_size: Optional[int] = None) -> None:
     """
-    在隔离的内存数据库中评测用户的SQL。
-    返回一个包含评测结果的字典。
+    评测工作进程的初始化函数。
+    hard_heap_limit 对整个进程内的SQLite生效，超出后查询会因内存不足而失败。
     """
-    # 1. 创建一个内存中的SQLite数据库
-    try:
+    global _snapshot_cache
+    if snapshot_cache_size is not None:
+        _snapshot_cache = _SnapshotCache(snapshot_cache_size)
+    if memory_limit_bytes:
         conn = sqlite3.connect(":memory:")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        conn.execute(f"PRAGMA hard_heap_limit = {int(memory_limit_bytes)}")
+        conn.close()
 
-        # 2. 执行建表和插入数据脚本
-        cursor.executescript(setup_sql)
-        conn.commit()
+
+class _QueryBudget:
+    """挂在 progress handler 上的查询预算，超出指令数或时间后中断查询。"""
+
+    def __init__(self, max_vm_steps: Optional[int], time_limit_seconds: Optional[float]):
+        self.max_ticks = max_vm_steps // _PROGRESS_INTERVAL if max_vm_steps else None
+        self.time_limit_seconds = time_limit_seconds
+        self.deadline = None
+        self.ticks = 0
+        self.exceeded: Optional[str] = None
+
+    def start(self) -> None:
+        self.ticks = 0
+        self.exceeded = None
+        if self.time_limit_seconds:
+            self.deadline = time.monotonic() + self.time_limit_seconds
+
+    def __call__(self) -> int:
+        self.ticks += 1
+        if self.max_ticks is not None and self.ticks > self.max_ticks:
+            self.exceeded = "resource_limit"
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = "timeout"
+            return 1
+        return 0
+
+
+@dataclass
+class EvaluationResult:
+    """
+    一次评测的结果。
+    默认不保留任何结果行；评测时指定 preview_limit 后，只保留用户结果的前若干行（元组形式），
+    需要展示时再通过 preview() 转成字典。
+    """
+    status: str
+    is_correct: bool = False
+    error: Optional[str] = None
+    user_row_count: Optional[int] = None  # 用户结果的总行数；提前判定错误时为 None
+    columns: List[str] = field(default_factory=list)
+    preview_rows: List[Tuple] = field(default_factory=list)
+    snapshot_hit: Optional[bool] = None
+    queue_wait_ms: Optional[float] = None
+    exec_ms: Optional[float] = None
+    from_cache: bool = False  # 结论来自评测结论缓存，没有进入沙箱
+
+    @property
+    def preview_truncated(self) -> bool:
+        return self.user_row_count is not None and self.user_row_count > len(self.preview_rows)
+
+    def preview(self) -> List[Dict[str, Any]]:
+        """以字典列表的形式返回预览行，BLOB 值转为十六进制字符串以便序列化。"""
+        return [
+            {column: value.hex() if isinstance(value, bytes) else value for column, value in zip(self.columns, row)}
+            for row in self.preview_rows
+        ]
+
+
+def _budget_exceeded_result(status: str, budget: "_QueryBudget") -> EvaluationResult:
+    if status == "timeout":
+        error = f"查询执行超时（超过 {budget.time_limit_seconds} 秒）"
+    else:
+        error = "查询消耗的资源超出限制"
+    return EvaluationResult(status=status, error=error)
+
+
+def _open_sandbox(setup_sql: str, question_id: Optional[int]) -> Tuple[sqlite3.Connection, bool]:
+    """打开一个已装载好题目数据的内存数据库连接，同时返回是否命中了快照缓存。"""
+    conn = sqlite3.connect(":memory:")
+    snapshot_hit = False
+    try:
+        if _SNAPSHOT_SUPPORTED:
+            # deserialize 会把镜像复制一份，每次评测拿到的都是独立的数据库
+            image, snapshot_hit = _snapshot_cache.get_image(question_id, setup_sql)
+            conn.deserialize(image)
+        else:
+            conn.executescript(setup_sql)
+            conn.commit()
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn, snapshot_hit
+
+
+def _row_digest(values: Iterable[Any]) -> int:
+    """单行的哈希值。值先转为字符串再排序，因此与列顺序和列别名无关。"""
+    canonical = "\x00".join(sorted(map(str, values)))
+    return int.from_bytes(hashlib.blake2b(canonical.encode('utf-8'), digest_size=32).digest(), 'little')
+
+
+def _combine_digest(row_count: int, accumulator: int) -> str:
+    combined = f"{row_count}:{accumulator % _ROW_DIGEST_MODULUS:064x}"
+    return FINGERPRINT_VERSION_PREFIX + hashlib.sha256(combined.encode('utf-8')).hexdigest()
+
+
+def is_current_fingerprint(result_hash: Optional[str]) -> bool:
+    """判断一个已保存的结果指纹是否由当前版本的算法生成。"""
+    return result_hash is not None and result_hash.startswith(FINGERPRINT_VERSION_PREFIX)
+
+
+def _hash_result(rows: Iterable[Any]) -> str:
+    """
+    健壮的哈希算法，忽略行、列顺序和列别名。
+    每行单独哈希后按模 2^256 求和（多重集哈希），因此天然与行顺序无关，且无需排序或保留全部结果。
+    rows 中的每一行可以是 dict，也可以是元组或 sqlite3.Row。
+    """
+    accumulator = 0
+    row_count = 0
+    for row in rows:
+        accumulator += _row_digest(row.values() if isinstance(row, dict) else row)
+        row_count += 1
+    return _combine_digest(row_count, accumulator)
+
+
+def _fingerprint_cursor(cursor: sqlite3.Cursor, max_rows: Optional[int] = None,
+                        preview: Optional[List[Tuple]] = None,
+                        preview_limit: int = 0) -> Tuple[Optional[str], int]:
+    """
+    用 fetchmany 逐批读取游标结果并计算指纹，内存占用与结果大小无关。
+    读到的行数超过 max_rows 时立即停止，返回 (None, 已读取行数)。
+    传入 preview 列表时，顺带把前 preview_limit 行追加进去。
+    """
+    accumulator = 0
+    row_count = 0
+    while True:
+        batch = cursor.fetchmany(_FETCH_BATCH_SIZE)
+        if not batch:
+            break
+        if preview is not None and len(preview) < preview_limit:
+            preview.extend(batch[:preview_limit - len(preview)])
+        row_count += len(batch)
+        if max_rows is not None and row_count > max_rows:
+            return None, row_count
+        for row in batch:
+            accumulator += _row_digest(row)
+    return _combine_digest(row_count, accumulator), row_count
+
+
+def compute_result_fingerprint(setup_sql: str, sql: str, question_id: Optional[int] = None,
+                               max_vm_steps: Optional[int] = DEFAULT_MAX_VM_STEPS,
+                               time_limit_seconds: Optional[float] = DEFAULT_TIME_LIMIT_SECONDS) -> Dict:
+    """
+    在题目数据库上执行一条SQL，返回其结果指纹（哈希、行数、列数）。
+    用于在发布题目时预先计算正确答案的指纹。
+    """
+    try:
+        conn, _ = _open_sandbox(setup_sql, question_id)
     except sqlite3.Error as e:
         return {
             "status": "setup_error",
             "error": f"题目设置脚本执行失败: {e}",
         }
 
-    # 3. 执行用户的SQL
-    user_result = None
+    budget = _QueryBudget(max_vm_steps, time_limit_seconds)
+    conn.set_progress_handler(budget, _PROGRESS_INTERVAL)
     try:
-        cursor.execute(user_sql)
-        user_result = [dict(row) for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        conn.close()
+        budget.start()
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        column_count = len(cursor.description) if cursor.description else 0
+        result_hash, row_count = _fingerprint_cursor(cursor)
+    except (sqlite3.Error, MemoryError) as e:
         return {
-            "status": "syntax_error",
-            "error": str(e),
+            "status": "setup_error",
+            "error": f"题库中的正确SQL执行失败: {budget.exceeded or e}",
         }
+    finally:
+        conn.close()
 
-    # 4. 执行正确的SQL
-    correct_result = None
+    return {
+        "status": "ok",
+        "result_hash": result_hash,
+        "row_count": row_count,
+        "column_count": column_count,
+        "error": None
+    }
+
+
+def evaluate_sql_in_isolation(setup_sql: str, correct_sql: str, user_sql: str,
+                              question_id: Optional[int] = None,
+                              expected: Optional[Dict] = None,
+                              max_vm_steps: Optional[int] = DEFAULT_MAX_VM_STEPS,
+                              time_limit_seconds: Optional[float] = DEFAULT_TIME_LIMIT_SECONDS,
+                              max_user_rows: Optional[int] = DEFAULT_MAX_USER_ROWS,
+                              preview_limit: int = 0) -> EvaluationResult:
+    """
+    在隔离的内存数据库中评测用户的SQL。
+    传入 question_id 时，题目数据库会从快照缓存中恢复，而不是重新执行 setup_sql。
+    传入 expected（正确答案的预计算指纹，见 compute_result_fingerprint）时，不再执行 correct_sql。
+    每条查询都受 max_vm_steps 和 time_limit_seconds 约束，用户结果超过 max_user_rows 行时同样视为资源超限。
+    preview_limit 大于0时，结果中保留用户结果的前 preview_limit 行，并统计完整的总行数。
+    """
+    # 1. 创建一个装载好题目数据的内存数据库
     try:
-        cursor.execute(correct_sql)
-        correct_result = [dict(row) for row in cursor.fetchall()]
+        conn, snapshot_hit = _open_sandbox(setup_sql, question_id)
+        cursor = conn.cursor()
     except sqlite3.Error as e:
+        return EvaluationResult(status="setup_error", error=f"题目设置脚本执行失败: {e}")
+
+    budget = _QueryBudget(max_vm_steps, time_limit_seconds)
+    conn.set_progress_handler(budget, _PROGRESS_INTERVAL)
+    try:
+        result = _evaluate_on_connection(cursor, budget, correct_sql, user_sql, expected,
+                                         max_user_rows, preview_limit)
+    finally:
         conn.close()
-        return {
-            "status": "setup_error",  # 正确SQL出错也算题目设置问题
-            "error": f"题库中的正确SQL执行失败: {e}",
-        }
+    result.snapshot_hit = snapshot_hit
+    return result
 
-    conn.close()
 
-    # 5. 比对结果
-    user_hash = _hash_result(user_result)
-    correct_hash = _hash_result(correct_result)
+def _evaluate_on_connection(cursor: sqlite3.Cursor, budget: _QueryBudget, correct_sql: str, user_sql: str,
+                            expected: Optional[Dict], max_user_rows: Optional[int],
+                            preview_limit: int) -> EvaluationResult:
+    row_limit = max_user_rows
+    # 需要预览时要统计完整行数，因此不能在超过正确答案行数时提前结束
+    if expected is not None and not preview_limit:
+        row_limit = expected["row_count"] if row_limit is None else min(row_limit, expected["row_count"])
+    preview: List[Tuple] = []
+
+    # 2. 执行用户的SQL并流式计算指纹；已知正确答案行数时，超出即可判定错误
+    try:
+        budget.start()
+        cursor.execute(user_sql)
+        columns = [column[0] for column in cursor.description] if cursor.description else []
+        if expected is not None and expected["row_count"] > 0 and len(columns) != expected["column_count"] \
+                and not preview_limit:
+            # 正确答案有数据时，列数不同必然是错误结果，无需再取数据
+            return EvaluationResult(status="result_error")
+        user_hash, user_row_count = _fingerprint_cursor(cursor, row_limit, preview, preview_limit)
+    except MemoryError:
+        return _budget_exceeded_result("resource_limit", budget)
+    except sqlite3.Error as e:
+        if budget.exceeded:
+            return _budget_exceeded_result(budget.exceeded, budget)
+        return EvaluationResult(status="syntax_error", error=str(e))
 
+    if user_hash is None:
+        if max_user_rows is not None and user_row_count > max_user_rows:
+            return EvaluationResult(status="resource_limit", error=f"查询结果超过 {max_user_rows} 行的上限")
+        # 用户结果行数已超过正确答案，提前结束
+        return EvaluationResult(status="result_error")
+
+    # 3. 已有预计算指纹时直接比对，不再执行正确的SQL
+    if expected is not None:
+        correct_hash = expected["result_hash"]
+    else:
+        # 4. 执行正确的SQL
+        try:
+            budget.start()
+            cursor.execute(correct_sql)
+            correct_hash, _ = _fingerprint_cursor(cursor)
+        except (sqlite3.Error, MemoryError) as e:
+            # 正确SQL出错也算题目设置问题
+            return EvaluationResult(status="setup_error", error=f"题库中的正确SQL执行失败: {budget.exceeded or e}")
+
+    # 5. 比对结果
     is_correct = user_hash == correct_hash
 
-    return {
-        "status": "correct" if is_correct else "result_error",
-        "is_correct": is_correct,
-        "user_result": user_result,
-        "correct_result": correct_result,
-        "error": None
+    return EvaluationResult(
+        status="correct" if is_correct else "result_error",
+        is_correct=is_correct,
+        user_row_count=user_row_count,
+        columns=columns,
+        preview_rows=preview,
+    )
+
+
+def profile_question(question_id: int, setup_sql: str, correct_sql: str,
+                     max_vm_steps: Optional[int] = DEFAULT_MAX_VM_STEPS,
+                     time_limit_seconds: Optional[float] = DEFAULT_TIME_LIMIT_SECONDS) -> Dict:
+    """
+    检查一道题目能否正常评测：setup_sql 能否加载、correct_sql 能否执行，以及各自的耗时。
+    不经过快照缓存，因此测得的是真实的建库时间。
+    """
+    report = {
+        "question_id": question_id,
+        "status": "ok",
+        "error": None,
+        "setup_ms": None,
+        "query_ms": None,
+        "row_count": None,
+        "column_count": None,
+        "result_hash": None,
     }
+    conn = sqlite3.connect(":memory:")
+    try:
+        started = time.perf_counter()
+        try:
+            conn.executescript(setup_sql)
+            conn.commit()
+        except sqlite3.Error as e:
+            report.update(status="setup_error", error=f"题目设置脚本执行失败: {e}")
+            return report
+        finally:
+            report["setup_ms"] = (time.perf_counter() - started) * 1000
+
+        budget = _QueryBudget(max_vm_steps, time_limit_seconds)
+        conn.set_progress_handler(budget, _PROGRESS_INTERVAL)
+        started = time.perf_counter()
+        try:
+            budget.start()
+            cursor = conn.execute(correct_sql)
+            report["column_count"] = len(cursor.description) if cursor.description else 0
+            report["result_hash"], report["row_count"] = _fingerprint_cursor(cursor)
+        except (sqlite3.Error, MemoryError) as e:
+            report.update(
+                status=budget.exceeded or "answer_error",
+                error=f"题库中的正确SQL执行失败: {budget.exceeded or e}"
+            )
+        finally:
+            report["query_ms"] = (time.perf_counter() - started) * 1000
+    finally:
+        conn.close()
+    return report
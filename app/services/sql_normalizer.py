@@ -0,0 +1,54 @@
+# 作用: 把用户提交的SQL规范化，使空白、关键字大小写、注释和末尾分号不同的写法得到同一个指纹。
+
+import hashlib
+import re
+
+# 字符串、带引号的标识符和注释需要原样保留或整体丢弃，其余部分可以安全地规范化
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*'?)             # '...'，'' 表示转义的单引号
+    | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)  # "标识符"、`标识符`、[标识符]
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?(?:\*/|$))
+    | (?P<space>\s+)
+    | (?P<other>[^'"`\[\s/-]+|[/-])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# SQLite 只对 ASCII 字母大小写不敏感，因此不能用 str.lower() 处理其他字符
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+# 这些符号两侧的空白不影响语义，可以去掉
+_TIGHT_PUNCTUATION = set(",()")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    返回规范化后的SQL：去掉注释和末尾的一个分号，连续空白合并为一个空格，
+    引号外的 ASCII 字母转为小写，逗号和括号两侧不留空白。字符串字面量和带引号的标识符保持不变。
+    """
+    parts = []
+    pending_space = False
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ("space", "line_comment", "block_comment"):
+            pending_space = True
+            continue
+        if kind == "other":
+            text = text.translate(_ASCII_LOWER)
+        if pending_space and parts and parts[-1][-1] not in _TIGHT_PUNCTUATION and text[0] not in _TIGHT_PUNCTUATION:
+            parts.append(" ")
+        pending_space = False
+        parts.append(text)
+    normalized = "".join(parts).strip()
+    # 只去掉一个末尾分号：SQLite 接受 "SELECT ...;"，但拒绝 "SELECT ...;;"，两者不能得到同一个指纹
+    if normalized.endswith(";"):
+        normalized = normalized[:-1].rstrip()
+    return normalized
+
+
+def sql_fingerprint(sql: str) -> str:
+    """规范化后SQL的SHA-256摘要，用作缓存键。"""
+    return hashlib.sha256(normalize_sql(sql).encode('utf-8')).hexdigest()
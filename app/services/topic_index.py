@@ -0,0 +1,123 @@
+# 作用: 内存中的"知识点 -> 已发布题目ID"索引，随机抽题时不需要扫描题目表。
+
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def topic_key(name: str) -> str:
+    """知识点的规范化名称：去掉首尾空白，连续空白合并，大小写不敏感。"""
+    return " ".join(name.split()).casefold()
+
+
+def split_topics(topics: str) -> List[str]:
+    """把逗号分隔的 topics 字段拆成去重后的知识点列表（保留原写法）。"""
+    seen, result = set(), []
+    for name in topics.replace("，", ",").split(","):
+        name = " ".join(name.split())
+        if name and topic_key(name) not in seen:
+            seen.add(topic_key(name))
+            result.append(name)
+    return result
+
+
+class _IdSet:
+    """支持 O(1) 添加、删除和随机选取的整数集合。"""
+
+    def __init__(self):
+        self._items: List[int] = []
+        self._positions: Dict[int, int] = {}
+
+    def add(self, item: int) -> None:
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: int) -> None:
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self) -> int:
+        return random.choice(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class TopicIndex:
+    """
+    每个知识点对应一个已发布题目ID的集合。发布、修改题目时由 crud 增量更新；
+    多个服务进程之间不共享内存，因此由 index_refresher 在后台每隔 TOPIC_INDEX_REFRESH_SECONDS 从数据库整体重建一次。
+    """
+
+    def __init__(self):
+        self._by_topic: Dict[str, _IdSet] = {}
+        self._topics_of: Dict[int, List[str]] = {}
+        self._all = _IdSet()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def load(self, rows: Iterable[Tuple[int, str]]) -> None:
+        """用 (题目ID, 知识点key) 行重建索引。"""
+        by_topic: Dict[str, _IdSet] = {}
+        topics_of: Dict[int, List[str]] = {}
+        all_ids = _IdSet()
+        for question_id, key in rows:
+            by_topic.setdefault(key, _IdSet()).add(question_id)
+            topics_of.setdefault(question_id, []).append(key)
+            all_ids.add(question_id)
+        with self._lock:
+            self._by_topic, self._topics_of, self._all = by_topic, topics_of, all_ids
+            self._loaded_at = time.monotonic()
+
+    def add(self, question_id: int, keys: List[str]) -> None:
+        with self._lock:
+            self._remove(question_id)
+            for key in keys:
+                self._by_topic.setdefault(key, _IdSet()).add(question_id)
+            self._topics_of[question_id] = list(keys)
+            self._all.add(question_id)
+
+    def remove(self, question_id: int) -> None:
+        with self._lock:
+            self._remove(question_id)
+
+    def _remove(self, question_id: int) -> None:
+        for key in self._topics_of.pop(question_id, []):
+            ids = self._by_topic.get(key)
+            if ids is not None:
+                ids.discard(question_id)
+                if not ids:
+                    del self._by_topic[key]
+        self._all.discard(question_id)
+
+    def random_question_id(self, topics: List[str]) -> Optional[int]:
+        """
+        随机选一道包含任一知识点的已发布题目；topics 为空时从全部已发布题目中选。
+        先按题目数量加权选知识点，再在该知识点中随机选题，耗时与题库大小无关。
+        """
+        with self._lock:
+            if not topics:
+                return self._all.choice() if len(self._all) else None
+            candidates = [self._by_topic[key] for key in {topic_key(topic) for topic in topics}
+                          if key in self._by_topic]
+            if not candidates:
+                return None
+            ids = random.choices(candidates, weights=[len(ids) for ids in candidates])[0]
+            return ids.choice()
+
+    def stats(self) -> Dict[str, int]:
+        return {"topics": len(self._by_topic), "published_questions": len(self._all)}
+
+
+topic_index = TopicIndex()
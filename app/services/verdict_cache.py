@@ -0,0 +1,44 @@
+# 作用: 缓存用户答案的评测结论。同一道题目下规范化后相同的SQL直接复用结论，无需再进入沙箱。
+
+import dataclasses
+import hashlib
+from typing import Any, Dict, Hashable, Optional
+
+from ..config import settings
+from .cache import LRUCache
+from .sql_executor import EvaluationResult
+from .sql_normalizer import sql_fingerprint
+
+# 只缓存由题目数据和SQL本身决定的结论；超时、资源超限等与当时负载有关的结果不缓存
+_CACHEABLE_STATUSES = {"correct", "result_error", "syntax_error"}
+
+_verdicts = LRUCache(max_entries=settings.VERDICT_CACHE_SIZE)
+
+
+def make_key(question_id: int, setup_sql: str, correct_sql: str, user_sql: str) -> Hashable:
+    """缓存键: (题目ID, 题目数据与正确答案的摘要, 规范化后用户SQL的摘要)。"""
+    question_digest = hashlib.sha256(f"{setup_sql}\0{correct_sql}".encode('utf-8')).hexdigest()
+    return question_id, question_digest, sql_fingerprint(user_sql)
+
+
+def get(key: Hashable) -> Optional[EvaluationResult]:
+    cached = _verdicts.get(key)
+    if cached is None:
+        return None
+    return dataclasses.replace(cached, from_cache=True, queue_wait_ms=0.0, exec_ms=0.0)
+
+
+def put(key: Hashable, evaluation: EvaluationResult) -> None:
+    if evaluation.status not in _CACHEABLE_STATUSES:
+        return
+    # 预览行只对本次请求有意义，不放进缓存
+    _verdicts.set(key, dataclasses.replace(evaluation, preview_rows=[]))
+
+
+def invalidate_question(question_id: int) -> None:
+    """题目被修改后调用，丢弃该题目下的所有缓存结论。"""
+    _verdicts.invalidate_where(lambda key: key[0] == question_id)
+
+
+def stats() -> Dict[str, Any]:
+    return _verdicts.stats()
@@ -0,0 +1,222 @@
+# 作用: 评测热路径 (sql_executor.evaluate_sql_in_isolation / _hash_result) 的基准测试套件。
+#
+# 只依赖标准库和SQLite，可离线运行。每个场景在独立的子进程中执行，以便分别统计内存峰值。
+#
+# 用法:
+#   python benchmarks/bench_grading.py                     # 快速模式
+#   python benchmarks/bench_grading.py --full -o a.json    # 完整规模，并保存JSON结果
+#   python benchmarks/bench_grading.py --only setup_rows concurrency
+#   python benchmarks/compare.py a.json b.json             # 比较两次结果
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import sql_executor  # noqa: E402
+from generators import make_question  # noqa: E402
+
+QUICK = {
+    "setup_rows": [10, 1_000, 10_000],
+    "result_rows": [0, 1_000, 100_000],
+    "width": [(10_000, 2), (10_000, 20)],
+    "concurrency": [1, 2, 4],
+    "iterations": 20,
+}
+FULL = {
+    "setup_rows": [10, 1_000, 10_000, 100_000],
+    "result_rows": [0, 1_000, 100_000, 1_000_000],
+    "width": [(100_000, 2), (100_000, 20)],
+    "concurrency": [1, 2, 4, 8, 16],
+    "iterations": 50,
+}
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 的单位是KB，macOS 下是字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / scale
+
+
+def _summary(latencies_s: List[float], wall_s: float) -> Dict:
+    latencies_ms = [t * 1000 for t in latencies_s]
+    return {
+        "iterations": len(latencies_ms),
+        "throughput_per_s": len(latencies_ms) / wall_s if wall_s else 0.0,
+        "p50_ms": _percentile(latencies_ms, 50),
+        "p99_ms": _percentile(latencies_ms, 99),
+        "mean_ms": statistics.fmean(latencies_ms),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _time_evaluations(question: Dict, iterations: int, use_fingerprint: bool = True) -> Dict:
+    """对同一道题目重复评测，第一次调用会构建快照，单独记录为冷启动耗时。"""
+    expected = None
+    if use_fingerprint:
+        expected = sql_executor.compute_result_fingerprint(question["setup_sql"], question["correct_sql"], 1,
+                                                           max_vm_steps=None, time_limit_seconds=None)
+    sql_executor.invalidate_question_snapshot(1)
+
+    kwargs = dict(question_id=1, expected=expected, max_vm_steps=None, time_limit_seconds=None, max_user_rows=None)
+    started = time.perf_counter()
+    result = sql_executor.evaluate_sql_in_isolation(**question, **kwargs)
+    cold_ms = (time.perf_counter() - started) * 1000
+    assert result.status == "correct", result
+
+    latencies = []
+    wall_started = time.perf_counter()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        sql_executor.evaluate_sql_in_isolation(**question, **kwargs)
+        latencies.append(time.perf_counter() - started)
+    summary = _summary(latencies, time.perf_counter() - wall_started)
+    summary["cold_ms"] = cold_ms
+    return summary
+
+
+def scenario_setup_rows(rows: int, iterations: int) -> Dict:
+    """setup_sql 规模对评测的影响（快照命中后应基本与规模无关）。"""
+    return _time_evaluations(make_question(setup_rows=rows), iterations)
+
+
+def scenario_result_rows(rows: int, iterations: int) -> Dict:
+    """结果集大小对评测的影响。"""
+    question = make_question(setup_rows=10, result_rows=rows)
+    return _time_evaluations(question, max(3, iterations // max(1, rows // 100_000)))
+
+
+def scenario_width(rows: int, columns: int, iterations: int) -> Dict:
+    """宽表和窄表结果的指纹计算开销。"""
+    question = make_question(setup_rows=10, result_rows=rows, result_columns=columns)
+    return _time_evaluations(question, max(3, iterations // 5))
+
+
+def scenario_hash_result(rows: int, iterations: int) -> Dict:
+    """_hash_result 单独的吞吐量（输入为已取出的行）。"""
+    conn = sqlite3.connect(":memory:")
+    result_rows = conn.execute(make_question(result_rows=rows)["correct_sql"]).fetchall()
+    conn.close()
+    latencies = []
+    wall_started = time.perf_counter()
+    for _ in range(max(3, iterations // 5)):
+        started = time.perf_counter()
+        sql_executor._hash_result(result_rows)
+        latencies.append(time.perf_counter() - started)
+    summary = _summary(latencies, time.perf_counter() - wall_started)
+    summary["rows_per_s"] = rows / summary["p50_ms"] * 1000 if summary["p50_ms"] else 0.0
+    return summary
+
+
+def _evaluate_once(question: Dict) -> float:
+    started = time.perf_counter()
+    sql_executor.evaluate_sql_in_isolation(**question, question_id=1)
+    return time.perf_counter() - started
+
+
+def scenario_concurrency(submitters: int, iterations: int) -> Dict:
+    """多个提交者同时评测同一道题目（与线上一样，每个工作进程各自维护快照缓存）。"""
+    question = make_question(setup_rows=1_000)
+    total = submitters * iterations
+    with ProcessPoolExecutor(max_workers=submitters, initializer=sql_executor.init_worker) as executor:
+        # 预热：让每个工作进程先建立快照
+        list(executor.map(_evaluate_once, [question] * submitters))
+        wall_started = time.perf_counter()
+        latencies = list(executor.map(_evaluate_once, [question] * total))
+        wall = time.perf_counter() - wall_started
+    return _summary(latencies, wall)
+
+
+def _build_scenarios(profile: Dict) -> List[Dict]:
+    iterations = profile["iterations"]
+    scenarios = []
+    for rows in profile["setup_rows"]:
+        scenarios.append({"name": f"setup_rows={rows}", "group": "setup_rows",
+                          "func": scenario_setup_rows, "kwargs": {"rows": rows, "iterations": iterations}})
+    for rows in profile["result_rows"]:
+        scenarios.append({"name": f"result_rows={rows}", "group": "result_rows",
+                          "func": scenario_result_rows, "kwargs": {"rows": rows, "iterations": iterations}})
+        scenarios.append({"name": f"hash_result rows={rows}", "group": "hash_result",
+                          "func": scenario_hash_result, "kwargs": {"rows": rows, "iterations": iterations}})
+    for rows, columns in profile["width"]:
+        scenarios.append({"name": f"width rows={rows} columns={columns}", "group": "width",
+                          "func": scenario_width,
+                          "kwargs": {"rows": rows, "columns": columns, "iterations": iterations}})
+    for submitters in profile["concurrency"]:
+        scenarios.append({"name": f"concurrency submitters={submitters}", "group": "concurrency",
+                          "func": scenario_concurrency,
+                          "kwargs": {"submitters": submitters, "iterations": iterations}})
+    return scenarios
+
+
+def _run_isolated(func: Callable[..., Dict], kwargs: Dict) -> Dict:
+    # 每个场景一个新进程，内存峰值互不影响
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(func, **kwargs).result()
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="评测热路径基准测试")
+    parser.add_argument("--full", action="store_true", help="使用完整规模（耗时较长）")
+    parser.add_argument("--only", nargs="+", help="只运行指定分组: setup_rows result_rows hash_result width concurrency")
+    parser.add_argument("-o", "--output", help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    profile = FULL if args.full else QUICK
+    results = []
+    print(f"{'scenario':<40} {'thr/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    for scenario in _build_scenarios(profile):
+        if args.only and scenario["group"] not in args.only:
+            continue
+        summary = _run_isolated(scenario["func"], scenario["kwargs"])
+        results.append({"name": scenario["name"], "group": scenario["group"], **scenario["kwargs"], **summary})
+        print(f"{scenario['name']:<40} {summary['throughput_per_s']:>9.1f} {summary['p50_ms']:>9.2f} "
+              f"{summary['p99_ms']:>9.2f} {summary['peak_rss_mb']:>8.1f}")
+
+    if args.output:
+        report = {
+            "revision": _git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "profile": "full" if args.full else "quick",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# 作用: 对比旧版(全量 fetchall + 排序 + json)与流式多重集结果指纹的耗时和内存峰值。
+#
+# 用法: python benchmarks/bench_hash_result.py [--rows 10000 100000 1000000]
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import sql_executor  # noqa: E402
+
+
+def _legacy_hash_result(result):
+    """旧版 _hash_result（fetchall 后排序再序列化为JSON计算哈希），仅用于对比。"""
+    if not result:
+        return hashlib.sha256(b"[]").hexdigest()
+
+    standardized_rows = []
+    for row in result:
+        sorted_values = sorted([str(v) for v in row.values()])
+        standardized_rows.append(tuple(sorted_values))
+
+    standardized_rows.sort()
+    final_string_to_hash = json.dumps(standardized_rows)
+    return hashlib.sha256(final_string_to_hash.encode('utf-8')).hexdigest()
+
+
+def _legacy(conn, sql):
+    conn.row_factory = sqlite3.Row
+    cursor = conn.execute(sql)
+    return _legacy_hash_result([dict(row) for row in cursor.fetchall()])
+
+
+def _streaming(conn, sql):
+    conn.row_factory = None
+    return sql_executor._fingerprint_cursor(conn.execute(sql))[0]
+
+
+def _measure(func, conn, sql):
+    # 先单独计时，再在 tracemalloc 下跑一遍取内存峰值，避免追踪开销影响耗时
+    started = time.perf_counter()
+    func(conn, sql)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func(conn, sql)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比旧版与流式结果指纹的性能")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER, name TEXT, score REAL, note TEXT)")
+    print(f"{'rows':>10} {'impl':>10} {'seconds':>10} {'peak MiB':>10}")
+    for rows in args.rows:
+        sql = (
+            "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < {n}) "
+            "SELECT x, 'user_' || x, x * 0.5, NULL FROM c"
+        ).format(n=rows)
+        for name, func in (("legacy", _legacy), ("streaming", _streaming)):
+            elapsed, peak = _measure(func, conn, sql)
+            print(f"{rows:>10} {name:>10} {elapsed:>10.3f} {peak / 1024 / 1024:>10.1f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
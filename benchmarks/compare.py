@@ -0,0 +1,51 @@
+# 作用: 比较两次 bench_grading.py 保存的JSON结果。
+#
+# 用法: python benchmarks/compare.py base.json new.json
+
+import argparse
+import json
+
+METRICS = [
+    ("throughput_per_s", "thr/s", True),
+    ("p50_ms", "p50 ms", False),
+    ("p99_ms", "p99 ms", False),
+    ("peak_rss_mb", "rss MB", False),
+]
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _change(base: float, new: float, higher_is_better: bool) -> str:
+    if not base:
+        return "n/a"
+    ratio = (new - base) / base * 100
+    better = ratio > 0 if higher_is_better else ratio < 0
+    return f"{ratio:+.1f}%{' ✓' if better and abs(ratio) >= 5 else ''}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="比较两次基准测试结果")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    base, new = _load(args.base), _load(args.new)
+    print(f"base: {base['revision']} ({base['created_at']})  new: {new['revision']} ({new['created_at']})")
+    base_results = {r["name"]: r for r in base["results"]}
+    for result in new["results"]:
+        previous = base_results.get(result["name"])
+        if previous is None:
+            print(f"{result['name']:<40} (新场景)")
+            continue
+        cells = [
+            f"{label} {previous[key]:.2f} -> {result[key]:.2f} ({_change(previous[key], result[key], higher)})"
+            for key, label, higher in METRICS
+        ]
+        print(f"{result['name']:<40} " + " | ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
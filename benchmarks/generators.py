@@ -0,0 +1,46 @@
+# 作用: 为基准测试生成不同规模的题目（建表脚本、正确答案SQL和用户SQL）。
+
+from typing import Dict
+
+
+def make_setup_sql(rows: int, columns: int = 3) -> str:
+    """生成一张包含 rows 行、columns 列（id + 若干数据列）的表的建表和插入脚本。"""
+    column_defs = ", ".join(["id INTEGER PRIMARY KEY"] + [f"c{i} TEXT" for i in range(1, columns)])
+    statements = [f"CREATE TABLE items ({column_defs});"]
+    # 与LLM生成的题目一致，使用多条 INSERT 语句，每条插入一批数据
+    batch = 500
+    for start in range(0, rows, batch):
+        values = []
+        for row_id in range(start + 1, min(start + batch, rows) + 1):
+            cells = [str(row_id)] + [f"'v{row_id % 97}_{i}'" for i in range(1, columns)]
+            values.append(f"({', '.join(cells)})")
+        statements.append(f"INSERT INTO items VALUES {', '.join(values)};")
+    return "\n".join(statements)
+
+
+def make_result_sql(rows: int, columns: int = 2) -> str:
+    """生成一条不依赖表数据、恰好返回 rows 行 columns 列的查询。"""
+    if rows == 0:
+        return "SELECT " + ", ".join(f"{i} AS c{i}" for i in range(columns)) + " WHERE 0"
+    select_list = ", ".join(["x"] + [f"'r' || (x % 101) || '_{i}'" for i in range(1, columns)])
+    return (
+        f"WITH RECURSIVE seq(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM seq WHERE x < {rows}) "
+        f"SELECT {select_list} FROM seq"
+    )
+
+
+def make_question(setup_rows: int = 100, setup_columns: int = 3,
+                  result_rows: int = None, result_columns: int = 2) -> Dict[str, str]:
+    """
+    生成一道题目。result_rows 为空时，正确答案是对建表数据的分组查询；
+    否则正确答案和用户答案都是返回 result_rows 行的查询，用于测试结果集大小的影响。
+    """
+    setup_sql = make_setup_sql(setup_rows, setup_columns)
+    if result_rows is None:
+        correct_sql = "SELECT c1, COUNT(*) FROM items GROUP BY c1"
+        # 同样的结果，不同的写法和列顺序
+        user_sql = "SELECT COUNT(id) AS n, c1 FROM items GROUP BY c1 ORDER BY n DESC"
+    else:
+        correct_sql = make_result_sql(result_rows, result_columns)
+        user_sql = correct_sql
+    return {"setup_sql": setup_sql, "correct_sql": correct_sql, "user_sql": user_sql}
@@ -0,0 +1,90 @@
+# 作用: 对运行中的服务压测 /chat/explain，统计首字节时间和完整响应时间。
+#
+# 配合模拟提供商使用时不需要真实的API Key:
+#   MOCK_LLM_ENABLED=true uvicorn app.main:app
+#   python benchmarks/load_chat.py --username alice --password secret --concurrency 50 --requests 500
+#
+# 每个请求使用不同的知识点并带 fresh=true，避免命中讲解缓存；加 --cached 测试缓存回放。
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _explain(client: httpx.AsyncClient, index: int, args: argparse.Namespace) -> Dict:
+    topic = "GROUP BY" if args.cached else f"GROUP BY #{index}"
+    body = {"topic": topic, "llm_provider": args.provider, "fresh": not args.cached}
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    async with client.stream("POST", "/chat/explain", json=body) as response:
+        async for chunk in response.aiter_text():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(chunk)
+    return {"status": response.status_code, "ttfb": first_byte, "total": time.perf_counter() - started,
+            "size": size}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="压测 /chat/explain")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--provider", default="mock")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--cached", action="store_true", help="所有请求使用同一个知识点，测试缓存回放")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=None) as client:
+        token = await _login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(index: int) -> Dict:
+            async with semaphore:
+                try:
+                    return await _explain(client, index, args)
+                except httpx.HTTPError as e:
+                    return {"status": type(e).__name__, "ttfb": None, "total": None, "size": 0}
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200 and r["ttfb"] is not None]
+    print(f"请求 {len(results)} 个，成功 {len(ok)} 个，用时 {wall:.1f} s，吞吐 {len(results) / wall:.1f} 个/秒")
+    if ok:
+        for name in ("ttfb", "total"):
+            samples = [r[name] * 1000 for r in ok]
+            print(f"{name:>6}: p50 {_percentile(samples, 50):8.1f} ms  p99 {_percentile(samples, 99):8.1f} ms  "
+                  f"mean {statistics.fmean(samples):8.1f} ms")
+    failures: Dict[str, int] = {}
+    for r in results:
+        if r not in ok:
+            failures[str(r["status"])] = failures.get(str(r["status"]), 0) + 1
+    if failures:
+        print(f"失败: {failures}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
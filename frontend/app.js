@@ -261,6 +261,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     content += `<p><strong>AI导师分析:</strong></p><pre>${response.analysis}</pre>`;
                 }
                 appendMessage('bot', content, 'html');
+                // 评测结论先展示，AI导师分析在后台生成，生成后再补充显示
+                if (response.analysis_id) {
+                    fetchAnalysis(response.analysis_id);
+                }
             }
         } catch (error) {
             appendMessage('bot', `评测失败: ${error.message}`);
@@ -271,6 +275,24 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function fetchAnalysis(analysisId) {
+        appendMessage('bot', 'AI导师正在分析你的答案...');
+        try {
+            let result = null;
+            // 长轮询：每次请求最多等待25秒，直到分析生成完毕
+            do {
+                result = await apiCall(`/test/analysis/${analysisId}?wait=25`);
+            } while (result && result.status === 'pending');
+            if (result && result.status === 'done') {
+                appendMessage('bot', `<p><strong>AI导师分析:</strong></p><pre>${result.analysis}</pre>`, 'html');
+            } else if (result) {
+                appendMessage('bot', 'AI导师分析生成失败，请稍后再试。');
+            }
+        } catch (error) {
+            appendMessage('bot', `获取AI导师分析失败: ${error.message}`);
+        }
+    }
+
     async function handleDailySubmit(sql) {
         appendMessage('bot', `正在提交答案...`);
         // 【重要修复】将请求体中的字段名从 daily_question_id 改为 question_id
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.services import analysis_jobs
+
+
+@pytest.fixture(autouse=True)
+def shared_store(monkeypatch):
+    # 用内存中的 SQLite 代替各服务进程共享的数据库
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine, tables=[models.AnalysisResult.__table__])
+    monkeypatch.setattr(analysis_jobs, "AppSessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(analysis_jobs, "_POLL_INTERVAL_SECONDS", 0.01)
+    yield
+    engine.dispose()
+
+
+def _forget_locally(analysis_id):
+    """模拟客户端的下一个请求落到了另一个服务进程：本进程中没有这个分析。"""
+    return analysis_jobs._handles.pop(analysis_id)
+
+
+def test_other_process_can_poll_until_done():
+    release = None
+
+    async def compute():
+        await release.wait()
+        return "分析结果"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        analysis_id = await analysis_jobs.start(1, ("analysis-jobs-test", 1), compute)
+        owner = _forget_locally(analysis_id)
+
+        handle = await analysis_jobs.claim(analysis_id, 1)
+        assert handle is not None and handle.task is None
+        assert handle.status == "pending"
+        assert await analysis_jobs.claim(analysis_id, 2) is None
+
+        release.set()
+        await owner.task
+        await analysis_jobs.wait(handle, 2)
+        owner.timer.cancel()
+        return handle
+
+    handle = asyncio.run(scenario())
+    assert (handle.status, handle.analysis) == ("done", "分析结果")
+
+
+def test_unclaimed_analysis_claimed_elsewhere_is_not_cancelled():
+    async def compute():
+        await asyncio.sleep(0.2)
+        return "分析结果"
+
+    async def scenario():
+        analysis_id = await analysis_jobs.start(1, ("analysis-jobs-test", 2), compute)
+        owner = analysis_jobs._handles[analysis_id]
+        # 另一个服务进程领取了分析，本进程的无人领取超时不能取消它
+        analysis_jobs._handles.pop(analysis_id)
+        assert await analysis_jobs.claim(analysis_id, 1) is not None
+        analysis_jobs._handles[analysis_id] = owner
+        await analysis_jobs._expire_unclaimed(owner)
+        assert not owner.task.cancelled()
+        assert await owner.task == "分析结果"
+        analysis_jobs._discard(analysis_id)
+
+    asyncio.run(scenario())
+
+
+def test_unknown_analysis_is_not_found():
+    assert asyncio.run(analysis_jobs.claim("missing", 1)) is None
@@ -0,0 +1,58 @@
+import datetime
+import os
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+
+# 发放记录依赖 PostgreSQL 的 ON CONFLICT，只在提供了测试数据库时运行
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="需要设置 TEST_DATABASE_URL 指向一个 PostgreSQL 测试库")
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(TEST_DATABASE_URL)
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def user_id(session_factory):
+    with session_factory() as db:
+        user = models.User(username=f"daily-{uuid.uuid4().hex[:12]}", hashed_password="x", points=0)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    yield user_id
+    with session_factory() as db:
+        db.query(models.DailyPointAward).filter(models.DailyPointAward.user_id == user_id).delete()
+        db.query(models.User).filter(models.User.id == user_id).delete()
+        db.commit()
+
+
+def test_concurrent_correct_submissions_award_points_once(session_factory, user_id):
+    barrier = threading.Barrier(4)
+    results = []
+
+    def submit():
+        with session_factory() as db:
+            barrier.wait()
+            results.append(crud.award_daily_points(db, user_id, None, "SELECT 1", 10))
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results, key=lambda points: points is not None) == [None, None, None, 10]
+    with session_factory() as db:
+        assert db.get(models.User, user_id).points == 10
+        awards = db.query(models.DailyPointAward).filter(models.DailyPointAward.user_id == user_id).all()
+        assert [award.day for award in awards] == [datetime.date.today()]
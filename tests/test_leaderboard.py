@@ -0,0 +1,67 @@
+import pytest
+
+from app.services.leaderboard import Leaderboard, decode_cursor
+
+ROWS = [(1, "alice", 30), (2, "bob", 20), (3, "carol", 20), (4, "dave", 20), (5, "erin", 10)]
+
+
+def _board():
+    board = Leaderboard()
+    board.load(ROWS)
+    return board
+
+
+def test_ties_are_ordered_by_user_id():
+    board = _board()
+    assert [(s.rank, s.user_id) for s in board.top(10)] == [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)]
+    assert board.rank(4).rank == 4
+
+
+def test_cursor_pages_cover_every_user_once():
+    board = _board()
+    seen, cursor = [], None
+    while True:
+        standings, cursor = board.page(2, cursor)
+        seen.extend(s.user_id for s in standings)
+        if cursor is None:
+            break
+    assert seen == [1, 2, 3, 4, 5]
+
+
+def test_cursor_splitting_a_tie_continues_after_the_last_user():
+    board = _board()
+    first, cursor = board.page(2)
+    assert decode_cursor(cursor) == (20, 2)
+    # 翻页期间排在前面的用户积分变化，不影响游标之后的顺序
+    board.update(1, "alice", 5)
+    second, _ = board.page(2, cursor)
+    assert [s.user_id for s in second] == [3, 4]
+
+
+def test_last_page_has_no_cursor():
+    standings, cursor = _board().page(5)
+    assert len(standings) == 5
+    assert cursor is None
+
+
+def test_update_moves_user_and_around_is_clipped():
+    board = _board()
+    board.update(5, "erin", 25)
+    assert board.rank(5).rank == 2
+    assert [s.user_id for s in board.around(1, 1)] == [1, 5]
+    board.update(6, "frank", 0)
+    assert board.rank(6).rank == 6
+    assert board.around(99, 1) == []
+
+
+def test_malformed_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        _board().page(2, "not-a-cursor")
+
+
+def test_top_is_not_capped():
+    board = Leaderboard()
+    board.load((user_id, f"user{user_id}", 1000 - user_id) for user_id in range(1, 251))
+    assert len(board.top(1000)) == 250
+    assert board.top(0) == []
+    assert board.top(-5) == []
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.services import llm_hedging
+from app.services.llm_gateway import CircuitBreaker, ProviderGate, ProviderUnavailableError
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # 半开状态下只放行一个探测请求
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened_count == 2
+
+
+def _gate():
+    return ProviderGate("test", max_in_flight=2, max_queued=4, queue_timeout_seconds=1.0,
+                        rate=100.0, burst=10, failure_threshold=2, cooldown_seconds=60.0)
+
+
+def test_gate_rejects_after_provider_failures():
+    gate = _gate()
+
+    async def call(exc):
+        async with gate.admit():
+            raise exc
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await call(ConnectionError())
+        with pytest.raises(ProviderUnavailableError) as info:
+            await call(ConnectionError())
+        return info.value
+
+    error = asyncio.run(scenario())
+    assert error.reason == "circuit_open"
+    stats = gate.stats()
+    assert (stats["failed"], stats["rejected_circuit_open"], stats["breaker_state"]) == (2, 1, "open")
+
+
+def test_cancelled_call_does_not_count_as_failure():
+    gate = _gate()
+
+    async def slow():
+        async with gate.admit():
+            await asyncio.sleep(10)
+
+    async def scenario():
+        task = asyncio.create_task(slow())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert gate.stats()["failed"] == 0
+    assert gate.stats()["in_flight"] == 0
+    assert gate.breaker.state == "closed"
+
+
+def _attempt(delays, cancelled):
+    """按提供商给定首个token前的延迟；延迟为 None 时直接失败。"""
+    async def attempt(llm_provider, first_token):
+        delay = delays[llm_provider]
+        if delay is None:
+            raise ConnectionError(llm_provider)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(llm_provider)
+            raise
+        first_token.set()
+        return llm_provider
+    return attempt
+
+
+def test_hedge_wins_when_primary_is_slow(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    cancelled = []
+    fired = llm_hedging.stats()["hedges_fired"]
+    winner = asyncio.run(llm_hedging.hedged("slow", "fast", _attempt({"slow": 5, "fast": 0.01}, cancelled)))
+    assert winner == "fast"
+    assert cancelled == ["slow"]
+    assert llm_hedging.stats()["hedges_fired"] == fired + 1
+
+
+def test_no_hedge_when_primary_is_fast(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.5)
+    fired = llm_hedging.stats()["hedges_fired"]
+    winner = asyncio.run(llm_hedging.hedged("fast", "other", _attempt({"fast": 0.01, "other": 0.01}, [])))
+    assert winner == "fast"
+    assert llm_hedging.stats()["hedges_fired"] == fired
+
+
+def test_failed_primary_hedges_immediately(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 5)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        winner = await llm_hedging.hedged("down", "up", _attempt({"down": None, "up": 0.01}, []))
+        return winner, asyncio.get_running_loop().time() - started
+
+    winner, elapsed = asyncio.run(scenario())
+    assert winner == "up"
+    assert elapsed < 1
+
+
+def test_both_failing_raises(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    with pytest.raises(ConnectionError):
+        asyncio.run(llm_hedging.hedged("down", "also_down", _attempt({"down": None, "also_down": None}, [])))
@@ -0,0 +1,23 @@
+import json
+
+from app.services import llm_metrics
+
+
+def test_overflow_bucket_percentile_is_json_serializable():
+    histogram = llm_metrics.Histogram(llm_metrics._LATENCY_BUCKETS_MS)
+    for value in (30, 40, 90_000, 120_000):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    # 超过最后一个有限上界的调用按观测到的最大值报告，而不是 inf
+    assert snapshot["p99"] == 120_000
+    assert snapshot["p50"] == 50
+    assert snapshot["buckets"]["+Inf"] == 2
+    json.dumps(snapshot, allow_nan=False)
+
+
+def test_snapshot_of_slow_calls_is_json_serializable():
+    llm_metrics.reset()
+    llm_metrics.record(llm_metrics.CallRecord(llm_provider="mock", model="m", purpose="explanation",
+                                              first_chunk_seconds=70.0, duration_seconds=90.0))
+    json.dumps(llm_metrics.snapshot(), allow_nan=False)
+    llm_metrics.reset()
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import llm_service
+
+CHUNKS = ["SQL ", "GROUP BY ", "按列分组", "。"]
+CHUNK_INTERVAL_SECONDS = 0.1
+
+
+class _SlowStream:
+    """模拟通义千问的流式响应：每个分块之间等待一段时间。"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for content in CHUNKS:
+            await asyncio.sleep(CHUNK_INTERVAL_SECONDS)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class _SlowClient:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        return _SlowStream()
+
+
+def test_other_requests_progress_while_qwen_stream_is_open(monkeypatch):
+    monkeypatch.setattr(llm_service, "_get_client", lambda llm_provider: _SlowClient())
+
+    async def scenario():
+        ticks = []
+        stream_open = asyncio.Event()
+        stream_done = asyncio.Event()
+
+        async def explain():
+            chunks = []
+            async for chunk in llm_service.get_llm_explanation("GROUP BY", "qwen"):
+                stream_open.set()
+                chunks.append(chunk)
+            stream_done.set()
+            return chunks
+
+        async def other_request():
+            # 另一个请求在流式响应进行期间持续推进
+            await stream_open.wait()
+            while not stream_done.is_set():
+                ticks.append(asyncio.get_running_loop().time())
+                await asyncio.sleep(0.01)
+
+        chunks, _ = await asyncio.gather(explain(), other_request())
+        return chunks, ticks
+
+    chunks, ticks = asyncio.run(scenario())
+    assert chunks == CHUNKS
+    # 流从第一个分块到结束大约持续 (len(CHUNKS) - 1) * CHUNK_INTERVAL_SECONDS，期间事件循环没有被阻塞
+    assert len(ticks) >= 10
+    assert ticks[-1] - ticks[0] >= (len(CHUNKS) - 2) * CHUNK_INTERVAL_SECONDS
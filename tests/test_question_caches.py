@@ -0,0 +1,47 @@
+from app.services import sql_executor, verdict_cache
+
+SETUP_SQL = "CREATE TABLE t (a INTEGER); INSERT INTO t (a) VALUES (1), (2);"
+EDITED_SETUP_SQL = "CREATE TABLE t (a INTEGER); INSERT INTO t (a) VALUES (1), (2), (3);"
+CORRECT_SQL = "SELECT a FROM t"
+
+
+def test_snapshot_is_rebuilt_after_setup_sql_edit():
+    cache = sql_executor._SnapshotCache(max_entries=8)
+    assert cache.get_image(501, SETUP_SQL)[1] is False
+    assert cache.get_image(501, SETUP_SQL)[1] is True
+
+    # setup_sql 修改后第一次评测重新构建快照，并丢弃这道题目的旧快照
+    image, hit = cache.get_image(501, EDITED_SETUP_SQL)
+    assert hit is False
+    assert cache.stats()["entries"] == 1
+    assert cache.get_image(501, EDITED_SETUP_SQL) == (image, True)
+
+
+def test_evaluation_uses_edited_setup_sql():
+    before = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, CORRECT_SQL, "SELECT a FROM t WHERE a < 3",
+                                                    question_id=502)
+    assert before.status == "correct"
+    after = sql_executor.evaluate_sql_in_isolation(EDITED_SETUP_SQL, CORRECT_SQL, "SELECT a FROM t WHERE a < 3",
+                                                   question_id=502)
+    assert after.snapshot_hit is False
+    assert after.status == "result_error"
+
+
+def test_verdicts_are_not_reused_after_question_edit():
+    user_sql = "SELECT a FROM t WHERE a < 3"
+    key = verdict_cache.make_key(503, SETUP_SQL, CORRECT_SQL, user_sql)
+    verdict_cache.put(key, sql_executor.evaluate_sql_in_isolation(SETUP_SQL, CORRECT_SQL, user_sql))
+    assert verdict_cache.get(key).status == "correct"
+
+    # 修改数据或正确答案后缓存键随之改变，旧结论不会被命中
+    assert verdict_cache.get(verdict_cache.make_key(503, EDITED_SETUP_SQL, CORRECT_SQL, user_sql)) is None
+    assert verdict_cache.get(verdict_cache.make_key(503, SETUP_SQL, "SELECT 1", user_sql)) is None
+
+    verdict_cache.invalidate_question(503)
+    assert verdict_cache.get(key) is None
+
+
+def test_load_dependent_verdicts_are_not_cached():
+    key = verdict_cache.make_key(504, SETUP_SQL, CORRECT_SQL, "SELECT a FROM t")
+    verdict_cache.put(key, sql_executor.EvaluationResult(status="timeout", error="评测执行超时"))
+    assert verdict_cache.get(key) is None
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+
+import pytest
+
+from app.services import sql_executor
+
+SETUP_SQL = """
+CREATE TABLE t (a INTEGER, b TEXT);
+INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y'), (2, 'y'), (3, NULL);
+"""
+
+
+def _legacy_hash_result(result):
+    """旧版 _hash_result（与 benchmarks/bench_hash_result.py 中的实现相同），作为比对基准。"""
+    if not result:
+        return hashlib.sha256(b"[]").hexdigest()
+
+    standardized_rows = []
+    for row in result:
+        sorted_values = sorted([str(v) for v in row.values()])
+        standardized_rows.append(tuple(sorted_values))
+
+    standardized_rows.sort()
+    final_string_to_hash = json.dumps(standardized_rows)
+    return hashlib.sha256(final_string_to_hash.encode('utf-8')).hexdigest()
+
+
+def _legacy_is_correct(correct_sql, user_sql):
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript(SETUP_SQL)
+        hashes = [_legacy_hash_result([dict(row) for row in conn.execute(sql).fetchall()])
+                  for sql in (correct_sql, user_sql)]
+    finally:
+        conn.close()
+    return hashes[0] == hashes[1]
+
+
+def _verdicts(correct_sql, user_sql):
+    """分别返回现场执行正确SQL、使用预计算指纹时的评测结论。"""
+    live = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, correct_sql, user_sql)
+    fingerprint = sql_executor.compute_result_fingerprint(SETUP_SQL, correct_sql)
+    assert fingerprint["status"] == "ok"
+    expected = {
+        "result_hash": fingerprint["result_hash"],
+        "row_count": fingerprint["row_count"],
+        "column_count": fingerprint["column_count"],
+    }
+    precomputed = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, correct_sql, user_sql, expected=expected)
+    return live, precomputed
+
+
+@pytest.mark.parametrize("correct_sql, user_sql", [
+    # 行顺序不同
+    ("SELECT a, b FROM t ORDER BY a", "SELECT a, b FROM t ORDER BY a DESC"),
+    # 列顺序不同
+    ("SELECT a, b FROM t", "SELECT b, a FROM t"),
+    # 列别名不同
+    ("SELECT a AS id FROM t", "SELECT a AS x FROM t"),
+    # 都没有结果
+    ("SELECT a FROM t WHERE a > 10", "SELECT a FROM t WHERE a < 0"),
+    ("SELECT a FROM t WHERE a > 10", "SELECT a, b FROM t WHERE a < 0"),
+    # NULL 和字符串 'None' 一样，都按 str() 之后的值比较
+    ("SELECT b FROM t WHERE a = 3", "SELECT 'None' AS b"),
+    # 值不同
+    ("SELECT a FROM t", "SELECT a + 1 FROM t"),
+    # 重复行的次数不同
+    ("SELECT a FROM t", "SELECT DISTINCT a FROM t"),
+    # 行数不同
+    ("SELECT a FROM t", "SELECT a FROM t WHERE a > 1"),
+    # 列数不同
+    ("SELECT a FROM t", "SELECT a, b FROM t"),
+])
+def test_verdict_matches_legacy_hash(correct_sql, user_sql):
+    legacy = _legacy_is_correct(correct_sql, user_sql)
+    for evaluation in _verdicts(correct_sql, user_sql):
+        assert evaluation.is_correct == legacy
+        assert evaluation.status == ("correct" if legacy else "result_error")
+
+
+def test_duplicate_column_names_are_no_longer_merged():
+    # 旧版把结果行转成字典，同名的列只剩一个，SELECT a, a 会被当成 SELECT a；现在按实际的列比较
+    correct_sql, user_sql = "SELECT a FROM t", "SELECT a, a FROM t"
+    assert _legacy_is_correct(correct_sql, user_sql)
+    for evaluation in _verdicts(correct_sql, user_sql):
+        assert evaluation.status == "result_error"
+
+
+def test_fingerprint_is_stable_across_row_order():
+    first = sql_executor.compute_result_fingerprint(SETUP_SQL, "SELECT a, b FROM t ORDER BY a")
+    second = sql_executor.compute_result_fingerprint(SETUP_SQL, "SELECT b, a FROM t ORDER BY a DESC")
+    assert first["result_hash"] == second["result_hash"]
+    assert (first["row_count"], first["column_count"]) == (4, 2)
+    assert sql_executor.is_current_fingerprint(first["result_hash"])
+
+
+INFINITE_SQL = "WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r) SELECT count(*) FROM r"
+
+
+def test_instruction_budget_reports_resource_limit():
+    evaluation = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, "SELECT 1", INFINITE_SQL,
+                                                        max_vm_steps=100_000, time_limit_seconds=None)
+    assert evaluation.status == "resource_limit"
+    assert not evaluation.is_correct
+
+
+def test_time_budget_reports_timeout():
+    evaluation = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, "SELECT 1", INFINITE_SQL,
+                                                        max_vm_steps=None, time_limit_seconds=0.2)
+    assert evaluation.status == "timeout"
+    assert not evaluation.is_correct
+
+
+def test_user_row_limit_reports_resource_limit():
+    evaluation = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, "SELECT a FROM t", "SELECT a FROM t",
+                                                        max_user_rows=2)
+    assert evaluation.status == "resource_limit"
+
+
+def test_broken_correct_sql_is_a_setup_error():
+    fingerprint = sql_executor.compute_result_fingerprint(SETUP_SQL, INFINITE_SQL,
+                                                          max_vm_steps=100_000, time_limit_seconds=None)
+    assert fingerprint["status"] == "setup_error"
+    evaluation = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, INFINITE_SQL, "SELECT 1",
+                                                        max_vm_steps=100_000, time_limit_seconds=None)
+    assert evaluation.status == "setup_error"
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from app.services import sql_executor
+from app.services.sandbox_pool import SandboxPool
+
+
+def _sleep_then_answer(seconds: float) -> sql_executor.EvaluationResult:
+    time.sleep(seconds)
+    return sql_executor.EvaluationResult(status="correct", is_correct=True)
+
+
+def _make_pool() -> SandboxPool:
+    pool = SandboxPool(max_workers=2, max_queue=2, max_vm_steps=1_000_000, time_limit_seconds=1,
+                       memory_limit_mb=0, snapshot_cache_size=4, max_user_rows=100, preview_rows=5)
+    pool.hard_timeout_seconds = 1
+    return pool
+
+
+def test_hard_timeout_does_not_fail_concurrent_evaluations():
+    # 卡死的评测超时后整个进程池被重建，同时在执行的评测应当在新的进程池中重试，而不是被判为 resource_limit
+    pool = _make_pool()
+
+    async def scenario():
+        stuck = asyncio.ensure_future(pool.run(_sleep_then_answer, seconds=30))
+        await asyncio.sleep(0.3)
+        innocent = asyncio.ensure_future(pool.run(_sleep_then_answer, seconds=0.8))
+        return await stuck, await innocent
+
+    try:
+        stuck, innocent = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert stuck.status == "timeout"
+    assert innocent.status == "correct"
+    assert pool.stats()["retries"] == 1
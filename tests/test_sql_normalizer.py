@@ -0,0 +1,27 @@
+from app.services import sql_executor, verdict_cache
+from app.services.sql_normalizer import normalize_sql, sql_fingerprint
+
+SETUP_SQL = "CREATE TABLE t (a INTEGER); INSERT INTO t (a) VALUES (1), (2);"
+CORRECT_SQL = "SELECT a FROM t"
+
+
+def test_single_trailing_semicolon_is_ignored():
+    assert normalize_sql("SELECT a FROM t;") == normalize_sql("select a from t")
+    assert normalize_sql("SELECT a FROM t ; -- 注释") == normalize_sql("SELECT a FROM t")
+
+
+def test_extra_trailing_semicolons_are_kept():
+    assert sql_fingerprint("SELECT a FROM t;;") != sql_fingerprint("SELECT a FROM t")
+    assert sql_fingerprint("SELECT a FROM t; ;") != sql_fingerprint("SELECT a FROM t;")
+
+
+def test_double_semicolon_verdict_does_not_leak_to_valid_query():
+    # 先评测会被 SQLite 拒绝的 ";;" 写法，它的结论不能被有效的查询复用
+    invalid = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, CORRECT_SQL, "SELECT a FROM t;;")
+    assert invalid.status == "syntax_error"
+    verdict_cache.put(verdict_cache.make_key(901, SETUP_SQL, CORRECT_SQL, "SELECT a FROM t;;"), invalid)
+
+    key = verdict_cache.make_key(901, SETUP_SQL, CORRECT_SQL, "SELECT a FROM t;")
+    assert verdict_cache.get(key) is None
+    valid = sql_executor.evaluate_sql_in_isolation(SETUP_SQL, CORRECT_SQL, "SELECT a FROM t;")
+    assert valid.status == "correct"